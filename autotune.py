@@ -0,0 +1,166 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import model_api
+from preferences import Paths, Inference
+
+""" ===========================================================
+CPU inference auto-tuning for BabyLemmatizer 2
+
+Times the tagger and the lemmatizer of a model on a sample of
+their own test.src with different numbers of worker processes
+(jobs), torch threads per worker and batch sizes, and saves the
+fastest combination into the config.yaml of the model:
+
+   python babylemmatizer.py --autotune=assyrian
+
+   ## Tuned with --autotune
+   tuned_cores: 8
+   threads: 2
+   jobs: 4
+   batch_tokens: 1024
+
+From then on CPU inference with the model uses these settings
+unless --jobs, --threads or --batch-tokens are given. They are
+ignored on machines with a different number of cores. Batch
+sizes are tuned first with one job using all cores, then jobs
+and threads with the best batch size.
+
+=========================================================== """
+
+COMPONENTS = ('tagger', 'lemmatizer')
+BATCH_TOKENS = (512, 1024, 2048, 4096, 8192)
+
+
+def io(message):
+    print(f'> {message}')
+
+
+def powers_of_two(limit):
+    """ 1, 2, 4, ... up to `limit`, and `limit` itself """
+    values = [2 ** i for i in range(limit.bit_length()) if 2 ** i <= limit]
+    if limit not in values:
+        values.append(limit)
+    return values
+
+
+def read_samples(model_name, size):
+    """ Return {checkpoint: lines} of the OpenNMT components of a
+    model from the first `size` lines of their test.src """
+    samples = {}
+    for component in COMPONENTS:
+        path = os.path.join(Paths.models, model_name, component)
+        checkpoint = os.path.join(path, 'model.pt')
+        filename = os.path.join(path, 'traindata', 'test.src')
+        if not os.path.isfile(checkpoint) or not os.path.isfile(filename)\
+           or model_api.tagger_engine(checkpoint) == 'classifier':
+            continue
+        with open(filename, 'r', encoding='utf-8') as f:
+            samples[checkpoint] = f.read().splitlines()[:size]
+    return samples
+
+
+def measure(samples, jobs, threads, batch_tokens):
+    """ Translate the samples with the given settings and return
+    the throughput in lines per second. Each configuration starts
+    with fresh translators and workers, which are warmed up before
+    timing. """
+    settings = {'jobs': jobs, 'threads': threads, 'batch_tokens': batch_tokens}
+    model_api.close_pools()
+    for checkpoint in samples:
+        model_api.release_translator(checkpoint)
+
+    for checkpoint, lines in samples.items():
+        model_api.translate_lines(lines[:max(32, 8 * jobs)], checkpoint,
+                                  cpu=True, name='Autotune', **settings)
+
+    lines = 0
+    start = time.perf_counter()
+    for checkpoint, sample in samples.items():
+        model_api.translate_lines(sample, checkpoint, cpu=True,
+                                  name='Autotune', **settings)
+        lines += len(sample)
+    return lines / (time.perf_counter() - start)
+
+
+def save_tuning(model_name, tuning):
+    """ Replace the tuned settings in the config.yaml of a model
+
+    :param model_name            model name in Paths.models
+    :param tuning                {setting: value}
+
+    :type model_name             str
+    :type tuning                 dict """
+
+    filename = os.path.join(Paths.models, model_name, 'config.yaml')
+    lines = []
+    if os.path.isfile(filename):
+        with open(filename, 'r', encoding='utf-8') as f:
+            for line in f.read().splitlines():
+                key = line.replace(' ', '').partition(':')[0]
+                if key not in tuning and line != '## Tuned with --autotune':
+                    lines.append(line)
+
+    lines.append('## Tuned with --autotune')
+    lines.extend(f'{key}: {value}' for key, value in tuning.items())
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    io(f'Saved tuned settings to {filename}')
+
+
+def autotune_model(model_name, size=2000):
+    """ Find the fastest jobs, threads and batch size for CPU
+    inference with a model and save them in its config.yaml
+
+    :param model_name            model name in Paths.models
+    :param size                  lines per component to translate
+
+    :type model_name             str
+    :type size                   int """
+
+    samples = read_samples(model_name, size)
+    if not samples:
+        io(f'{model_name} has no OpenNMT tagger or lemmatizer to tune')
+        return None
+
+    cores = os.cpu_count() or 1
+    io(f'Tuning {model_name} on {cores} cores '\
+       f'({sum(len(s) for s in samples.values())} lines per run)')
+
+    results = []
+    try:
+        baseline = measure(samples, 1, None, Inference.batch_tokens)
+        results.append(('default', 1, 'auto', Inference.batch_tokens,
+                        baseline))
+
+        batch_tokens = None
+        for tokens in BATCH_TOKENS:
+            speed = measure(samples, 1, cores, tokens)
+            results.append(('batch', 1, cores, tokens, speed))
+            if batch_tokens is None or speed > batch_tokens[1]:
+                batch_tokens = (tokens, speed)
+        batch_tokens = batch_tokens[0]
+
+        for jobs in powers_of_two(cores):
+            for threads in powers_of_two(cores // jobs):
+                speed = measure(samples, jobs, threads, batch_tokens)
+                results.append(('workers', jobs, threads, batch_tokens, speed))
+    finally:
+        model_api.close_pools()
+
+    print(f'   {"STEP": <10}{"JOBS": >6}{"THREADS": >9}'\
+          f'{"BATCH": >8}{"LINES/S": >10}')
+    for step, jobs, threads, tokens, speed in results:
+        print(f'   {step: <10}{jobs: >6}{threads: >9}{tokens: >8}'\
+              f'{round(speed, 1): >10}')
+
+    _, jobs, threads, tokens, speed = max(
+        (row for row in results if row[0] != 'default'), key=lambda r: r[-1])
+    io(f'Best: {jobs} jobs, {threads} threads, batch {tokens} tokens '\
+       f'({round(speed / baseline, 2)}x the default settings)')
+    tuning = {'tuned_cores': cores, 'threads': threads,
+              'jobs': jobs, 'batch_tokens': tokens}
+    save_tuning(model_name, tuning)
+    return tuning
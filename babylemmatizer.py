@@ -4,12 +4,12 @@
 from argparse import ArgumentParser
 import os
 import sys
-import train_pipeline
-import evaluate_models
 #import conllutools
-import lemmatizer_pipeline
 from command_parser import parse_prefix
-from preferences import Paths, __version__, Tokenizer, Context
+from preferences import Paths, __version__, Tokenizer, Context, Inference, Tagger
+
+""" The pipelines are imported only by the commands that need
+them, so that --help, --version and light commands start fast """
 
 div = '‹<>›'*16
 
@@ -32,6 +32,9 @@ f"""
 def get_args():
     """ Get commandline arguments """
     ap = ArgumentParser()
+    ap.add_argument(
+        '--version', action='version',
+        version=f'BabyLemmatizer {__version__}')
     ap.add_argument(
         '--filename', type=str)
     ap.add_argument(
@@ -54,28 +57,117 @@ def get_args():
         '--lemmatizer-context', type=int, default=1)
     ap.add_argument(
         '--tagger-context', type=int, default=2)
+    ap.add_argument(
+        '--tagger-engine', type=str, default='onmt',
+        choices=('onmt', 'classifier'))
+    ap.add_argument(
+        '--quantize', type=str)
+    ap.add_argument(
+        '--no-quantized', action='store_true')
+    ap.add_argument(
+        '--export-ct2', type=str,
+        help='export the tagger and lemmatizer of a model to '\
+        'CTranslate2; only Transformer models can be converted, so '\
+        'models trained with BabyLemmatizer (BiLSTM, encoder_type: '\
+        'brnn) are refused and keep running with OpenNMT-py')
+    ap.add_argument(
+        '--ct2', action='store_true',
+        help='translate with the CTranslate2 exports made with '\
+        '--export-ct2; applies only to external Transformer '\
+        'checkpoints, as models trained with BabyLemmatizer cannot '\
+        'be exported')
+    ap.add_argument(
+        '--ct2-threads', type=int, help='with --ct2')
+    ap.add_argument(
+        '--ct2-inter-threads', type=int, help='with --ct2')
+    ap.add_argument(
+        '--ct2-batch-size', type=int, help='with --ct2')
     ap.add_argument(
         '--normalize-conllu', action='store_true')
     ap.add_argument(
-        '--lemmatize', type=str)
+        '--lemmatize', type=str,
+        help='model name; a name ending in * lemmatizes with all '\
+        'matching models and votes (an ensemble applies only the '\
+        'override of the first model, no filling in of unambiguous '\
+        'words or disambiguation, and cannot be combined with '\
+        '--chunk-size, --pipeline, --incremental or --sentence-memo)')
     ap.add_argument(
         '--use-cpu', action='store_true')
     ap.add_argument(
         '--preserve-numbers', action='store_true')
+    ap.add_argument(
+        '--chunk-size', type=int)
+    ap.add_argument(
+        '--pipeline', action='store_true')
+    ap.add_argument(
+        '--dictionary-first', action='store_true')
+    ap.add_argument(
+        '--incremental', action='store_true')
+    ap.add_argument(
+        '--profile', action='store_true')
+    ap.add_argument(
+        '--sentence-memo', action='store_true')
+    ap.add_argument(
+        '--warm-memo', type=str)
+    ap.add_argument(
+        '--no-cache', action='store_true')
+    ap.add_argument(
+        '--single-step-tagger', action='store_true')
+    ap.add_argument(
+        '--jobs', type=int)
+    ap.add_argument(
+        '--threads', type=int)
+    ap.add_argument(
+        '--batch-tokens', type=int)
+    ap.add_argument(
+        '--autotune', type=str)
+    ap.add_argument(
+        '--sample-size', type=int, default=2000)
+    ap.add_argument(
+        '--serve', type=str)
+    ap.add_argument(
+        '--port', type=int, default=8000)
+    ap.add_argument(
+        '--socket', type=str)
+    ap.add_argument(
+        '--async', action='store_true', dest='serve_async')
     return ap.parse_args()
 
 
 if __name__ == "__main__":
 
-    print(info)
-    
     args = get_args()
 
+    print(info)
+
     """ Optional args """
     if args.conllu_path:
         Paths.conllu = args.conllu_path
     if args.model_path:
         Paths.models = args.model_path
+    if args.no_cache:
+        Inference.cache = False
+    """ Explicit CPU settings override those saved by --autotune """
+    if args.jobs:
+        Inference.jobs = max(1, args.jobs)
+    if args.threads:
+        Inference.threads = max(1, args.threads)
+    if args.batch_tokens:
+        Inference.batch_tokens = max(1, args.batch_tokens)
+    if args.jobs or args.threads or args.batch_tokens:
+        Inference.tuned = False
+    if args.single_step_tagger:
+        Inference.single_step_tagger = True
+    if args.no_quantized:
+        Inference.quantized = False
+    if args.ct2:
+        Inference.ctranslate2 = True
+    if args.ct2_threads is not None:
+        Inference.ct2_intra_threads = args.ct2_threads
+    if args.ct2_inter_threads:
+        Inference.ct2_inter_threads = args.ct2_inter_threads
+    if args.ct2_batch_size:
+        Inference.ct2_batch_size = args.ct2_batch_size
 
     if args.tokenizer > 2:
         print('> Invalid tokenization setting')
@@ -84,47 +176,132 @@ if __name__ == "__main__":
         
     """ Complementary mandatory args """
     if args.train:
+        import train_pipeline
         models = parse_prefix(args.train, train=True)
         train_pipeline.train_model(
             *models, cpu=args.use_cpu)
     elif args.build:
+        import train_pipeline
         Tokenizer.setting = args.tokenizer
         Context.lemmatizer_context = args.lemmatizer_context
         Context.tagger_context = args.tagger_context
+        Tagger.engine = args.tagger_engine
         models = parse_prefix(args.build, build=True)
         train_pipeline.build_train_data(
             *models)
     elif args.build_train:
+        import train_pipeline
         Tokenizer.setting = args.tokenizer
         Context.lemmatizer_context = args.lemmatizer_context
         Context.tagger_context = args.tagger_context        
+        Tagger.engine = args.tagger_engine
         models = parse_prefix(args.build_train, build=True)
         train_pipeline.build_train_data(
             *models)
         train_pipeline.train_model(
             *models, cpu=args.use_cpu)
     elif args.evaluate:
+        import evaluate_models
         models = parse_prefix(
             args.evaluate, evaluate=True)
         evaluate_models.pipeline(
-            *models, cpu=args.use_cpu)
+            *models, cpu=args.use_cpu, profile=args.profile)
     elif args.evaluate_fast:
+         import evaluate_models
          models = parse_prefix(
              args.evaluate_fast, evaluate=True)
          evaluate_models.pipeline(
-             *models, cpu=args.use_cpu, fast=True)
+             *models, cpu=args.use_cpu, fast=True, profile=args.profile)
          #elif args.normalize_conllu:
          #   conllutools.normalize_all('conllu')
+    elif args.quantize:
+        import quantize
+        models = parse_prefix(
+            args.quantize, evaluate=True)
+        for model in models:
+            quantize.quantize_model(model)
+    elif args.warm_memo:
+        import lemmatizer_pipeline
+        models = parse_prefix(
+            args.warm_memo, evaluate=True)
+        for model in models:
+            lemmatizer_pipeline.warm_memo(
+                model, ignore_numbers=not args.preserve_numbers,
+                dictionary_first=args.dictionary_first)
+    elif args.autotune:
+        import autotune
+        models = parse_prefix(
+            args.autotune, evaluate=True)
+        for model in models:
+            autotune.autotune_model(model, args.sample_size)
+    elif args.export_ct2:
+        import ct2_export
+        models = parse_prefix(
+            args.export_ct2, evaluate=True)
+        if not all([ct2_export.export_model(model) for model in models]):
+            sys.exit(1)
     elif args.lemmatize:
+        import lemmatizer_pipeline
         cpu = args.use_cpu
         if args.preserve_numbers:
             ignore_nums = False
         else:
             ignore_nums = True
-        lemmatizer = lemmatizer_pipeline.Lemmatizer(
-            args.filename,
-            fast=False,
-            ignore_numbers=ignore_nums)
         model = args.lemmatize
-        lemmatizer.run_model(model, cpu)                                        
+        filenames = lemmatizer_pipeline.expand_inputs(args.filename)
+        """ Star expressions lemmatize with all matching models and vote """
+        models = parse_prefix(model, evaluate=True)\
+            if model.endswith('*') else [model]
+        """ Options that only the file-by-file path supports """
+        per_file = [option for option, value in (
+            ('--chunk-size', args.chunk_size),
+            ('--pipeline', args.pipeline),
+            ('--incremental', args.incremental),
+            ('--sentence-memo', args.sentence_memo)) if value]
+        if not filenames:
+            print(f'> No CoNLL-U files found in {args.filename}')
+            sys.exit(1)
+        elif len(models) > 1 and per_file:
+            print(f'> {", ".join(per_file)} cannot be used with '\
+                  f'an ensemble ({model})')
+            sys.exit(1)
+        elif len(models) > 1:
+            for filename in filenames:
+                lemmatizer = lemmatizer_pipeline.Lemmatizer(
+                    filename,
+                    ignore_numbers=ignore_nums,
+                    dictionary_first=args.dictionary_first,
+                    profile=args.profile)
+                lemmatizer.run_ensemble(sorted(models), cpu)
+        elif len(filenames) > 1 and not per_file:
+            lemmatizer_pipeline.lemmatize_files(
+                filenames, models[0], cpu, ignore_numbers=ignore_nums,
+                dictionary_first=args.dictionary_first,
+                profile=args.profile)
+        else:
+            for filename in filenames:
+                lemmatizer = lemmatizer_pipeline.Lemmatizer(
+                    filename,
+                    fast=False,
+                    ignore_numbers=ignore_nums,
+                    chunk_size=args.chunk_size,
+                    pipelined=args.pipeline,
+                    dictionary_first=args.dictionary_first,
+                    incremental=args.incremental,
+                    profile=args.profile,
+                    sentence_memo=args.sentence_memo)
+                lemmatizer.run_model(models[0], cpu)                                        
+    elif args.serve:
+        import lemmatizer_server
+        server = lemmatizer_server.LemmatizationServer(
+            args.serve,
+            cpu=args.use_cpu,
+            ignore_numbers=not args.preserve_numbers,
+            dictionary_first=args.dictionary_first)
+        if args.socket:
+            server.serve_socket(args.socket)
+        elif args.serve_async:
+            server.serve_async(args.port)
+        else:
+            server.serve_http(args.port)
         
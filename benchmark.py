@@ -0,0 +1,403 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import subprocess
+from argparse import ArgumentParser
+import model_api
+import txt2conllu
+import classifier_tagger
+import preprocessing as pp
+from preferences import Paths, Inference, ModelConfig
+
+""" ===========================================================
+Inference benchmarks for BabyLemmatizer 2
+
+The benchmarks run on the model's own test set, e.g.
+
+   python benchmark.py jobs --model=assyrian --jobs 1 2 4 8
+
+or on a text file in unit-per-line format, e.g.
+
+   python benchmark.py bucketing --model=assyrian --text=demo/enuma.txt
+   python benchmark.py decoding --model=assyrian
+   python benchmark.py tagger --model=assyrian
+   python benchmark.py backend --model=assyrian --component=lemmatizer
+
+The startup benchmark needs no model; it fails (exit status 1) if
+light commands exceed the startup budget or import the pipelines:
+
+   python benchmark.py startup
+
+=========================================================== """
+
+""" Startup budget of light commands in seconds, and modules
+that they must not import """
+STARTUP_BUDGET = 0.3
+HEAVY_MODULES = ('torch', 'onmt', 'ctranslate2', 'train_pipeline',
+                 'evaluate_models', 'lemmatizer_pipeline', 'lemmatizer_server',
+                 'model_api', 'postcorrect', 'cuneiformtools.ogsl_data')
+
+def read_sample(model_name, component='tagger', size=None):
+    """ Read neural net input lines from the test set of a model
+
+    :param model_name            model name
+    :param component             `tagger` or `lemmatizer`
+    :param size                  maximum number of lines
+
+    :type model_name             str
+    :type component              str
+    :type size                   int or None """
+
+    filename = os.path.join(
+        Paths.models, model_name, component, 'traindata', 'test.src')
+    with open(filename, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    return lines[:size] if size else lines
+
+
+def checkpoint(model_name, component='tagger'):
+    return os.path.join(Paths.models, model_name, component, 'model.pt')
+
+
+def print_table(headings, rows):
+    print('   ' + ''.join(f'{h: >14}' for h in headings))
+    for row in rows:
+        print('   ' + ''.join(f'{v: >14}' for v in row))
+
+
+def benchmark_jobs(model_name, jobs=(1, 2, 4, 8), component='tagger', size=None):
+    """ Measure CPU throughput (tokens/second) as the number of
+    worker processes grows
+
+    :param model_name            model name
+    :param jobs                  worker counts to compare
+    :param component             `tagger` or `lemmatizer`
+    :param size                  maximum number of test lines """
+
+    lines = read_sample(model_name, component, size)
+    model = checkpoint(model_name, component)
+    rows = []
+    for n in jobs:
+        """ Warm up, so that model loading is not measured """
+        model_api.translate_lines(
+            lines[:n*4], model, cpu=True, name=component, jobs=n)
+        start = time.perf_counter()
+        model_api.translate_lines(
+            lines, model, cpu=True, name=component, jobs=n)
+        elapsed = time.perf_counter() - start
+        rows.append((n, len(lines), round(elapsed, 3),
+                     round(len(lines) / elapsed, 1)))
+
+    print(f'\n> {component} throughput for {model_name}')
+    print_table(('JOBS', 'TOKENS', 'SECONDS', 'TOKENS/S'), rows)
+    return rows
+
+
+def read_text(model_name, filename, component='tagger', repeat=1):
+    """ Build neural net input lines from a unit-per-line text
+    file. Lemmatizer input is built from the predictions of the
+    tagger.
+
+    :param model_name            model name
+    :param filename              text file
+    :param component             `tagger` or `lemmatizer`
+    :param repeat                how many times the text is repeated """
+
+    config = ModelConfig.read(model_name)
+
+    with open(filename, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines() * repeat
+    conllu = txt2conllu.txt_lines_to_conllu(lines)
+    conllu.normalize()
+    conllu.update_value(
+        'formctx', conllu.get_contexts('form', size=config.tagger_context))
+    src = [pp.make_tagger_src(formctx, context=config.tagger_context,
+                              setting=config.tokenizer)
+           for formctx in conllu.get_contents('formctx')]
+    if component == 'tagger':
+        return src
+
+    tags = model_api.clean_results(model_api.translate_lines(
+        src, checkpoint(model_name, 'tagger'), cpu=True, name='tagger'))
+    model_api.merge_tags(tags, conllu, None, 'xpos', 'xposctx', config)
+    return list(model_api.lemmatizer_source(conllu, config))
+
+
+def benchmark_bucketing(model_name, filename, component='tagger', repeat=1,
+                        batch_size=30):
+    """ Compare padded tokens and wall time of OpenNMT's default
+    batching (`batch_size` sentences in input order) with length-
+    bucketed batches of Inference.batch_tokens tokens
+
+    :param model_name            model name
+    :param filename              unit-per-line text file
+    :param component             `tagger` or `lemmatizer`
+    :param repeat                how many times the text is repeated
+    :param batch_size            OpenNMT default batch size """
+
+    lines = read_text(model_name, filename, component, repeat)
+    model = checkpoint(model_name, component)
+    real = sum(map(model_api.source_length, lines))
+    
+    default_batches = [lines[i:i+batch_size]
+                       for i in range(0, len(lines), batch_size)]
+    order = model_api.sort_by_length(lines)
+    bucketed_batches = model_api.make_batches(
+        [lines[i] for i in order], Inference.batch_tokens)
+
+    rows = []
+    bucketing = Inference.bucketing
+    try:
+        for label, enabled, batches in (('default', False, default_batches),
+                                        ('bucketed', True, bucketed_batches)):
+            Inference.bucketing = enabled
+            model_api.translate_lines(lines[:batch_size], model, cpu=True,
+                                      name=component, jobs=1)
+            start = time.perf_counter()
+            model_api.translate_lines(lines, model, cpu=True,
+                                      name=component, jobs=1)
+            elapsed = time.perf_counter() - start
+            padded = model_api.padded_tokens(batches)
+            rows.append((label, len(batches), real, padded,
+                         round(100 * (padded - real) / padded, 1),
+                         round(elapsed, 3)))
+    finally:
+        Inference.bucketing = bucketing
+
+    print(f'\n> {component} batching for {model_name} on {filename}')
+    print_table(('BATCHING', 'BATCHES', 'TOKENS', 'PADDED', 'PADDING %',
+                 'SECONDS'), rows)
+    return rows
+
+
+def benchmark_decoding(model_name, size=None):
+    """ Compare beam search and single-step decoding of the tagger
+    on the test set: wall time, accuracy against the gold tags and
+    agreement of the two modes
+
+    :param model_name            model name
+    :param size                  maximum number of test lines """
+
+    lines = read_sample(model_name, 'tagger', size)
+    filename = os.path.join(
+        Paths.models, model_name, 'tagger', 'traindata', 'test.tgt')
+    with open(filename, 'r', encoding='utf-8') as f:
+        gold = [line.replace(' ', '') for line in f.read().splitlines()]
+    gold = gold[:len(lines)]
+    model = checkpoint(model_name, 'tagger')
+
+    rows, outputs = [], {}
+    single_step = Inference.single_step_tagger
+    try:
+        for label, enabled in (('beam', False), ('single-step', True)):
+            Inference.single_step_tagger = enabled
+            model_api.translate_lines(lines[:30], model, cpu=True,
+                                      name='tagger', jobs=1)
+            start = time.perf_counter()
+            tags = list(model_api.clean_results(model_api.translate_lines(
+                lines, model, cpu=True, name='tagger', jobs=1)))
+            elapsed = time.perf_counter() - start
+            outputs[label] = tags
+            correct = sum(1 for x, y in zip(tags, gold) if x == y)
+            rows.append((label, len(lines), round(elapsed, 3),
+                         round(len(lines) / elapsed, 1),
+                         round(100 * correct / len(lines), 2)))
+    finally:
+        Inference.single_step_tagger = single_step
+
+    agreement = sum(1 for x, y in zip(*outputs.values()) if x == y)
+    print(f'\n> Tagger decoding for {model_name}')
+    print_table(('DECODING', 'TOKENS', 'SECONDS', 'TOKENS/S', 'ACCURACY %'),
+                rows)
+    print(f'   Agreement: {round(100 * agreement / len(lines), 2)}%')
+    return rows
+
+
+def benchmark_tagger(model_name, size=None):
+    """ Compare accuracy and CPU throughput of the OpenNMT tagger
+    and the classifier tagger on the test set. The classifier is
+    trained first if the model does not have one.
+
+    :param model_name            model name
+    :param size                  maximum number of test lines """
+
+    lines = read_sample(model_name, 'tagger', size)
+    filename = os.path.join(
+        Paths.models, model_name, 'tagger', 'traindata', 'test.tgt')
+    with open(filename, 'r', encoding='utf-8') as f:
+        gold = [line.replace(' ', '') for line in f.read().splitlines()]
+    model = checkpoint(model_name, 'tagger')
+
+    if not os.path.isfile(os.path.join(
+            os.path.dirname(model), classifier_tagger.MODEL_FILE)):
+        classifier_tagger.train_model(os.path.join(Paths.models, model_name))
+
+    def onmt(lines):
+        order = model_api.sort_by_length(lines)
+        predictions = model_api.get_translator(model, cpu=True).translate(
+            [lines[i] for i in order])
+        return model_api.restore_order(
+            list(model_api.clean_results(predictions)), order)
+
+    def classifier(lines):
+        return model_api.get_classifier(model).translate(lines)
+
+    engines = [('classifier', classifier)]
+    if os.path.isfile(model):
+        engines.insert(0, ('onmt', onmt))
+        
+    rows = []
+    for label, tag in engines:
+        tag(lines[:30])
+        start = time.perf_counter()
+        tags = tag(lines)
+        elapsed = time.perf_counter() - start
+        correct = sum(1 for x, y in zip(tags, gold) if x == y)
+        rows.append((label, len(lines), round(elapsed, 3),
+                     round(len(lines) / elapsed, 1),
+                     round(100 * correct / len(lines), 2)))
+
+    print(f'\n> Tagger engines for {model_name} (CPU, one process)')
+    print_table(('ENGINE', 'TOKENS', 'SECONDS', 'TOKENS/S', 'ACCURACY %'),
+                rows)
+    return rows
+
+
+def benchmark_backend(model_name, component='tagger', size=None):
+    """ Compare the CPU throughput of OpenNMT-py and the CTranslate2
+    export of a checkpoint on the test set, and the agreement of
+    their predictions
+
+    :param model_name            model name
+    :param component             `tagger` or `lemmatizer`
+    :param size                  maximum number of test lines """
+
+    lines = read_sample(model_name, component, size)
+    model = checkpoint(model_name, component)
+    if model_api.ct2_checkpoint(model) is None:
+        print(f'> {component} of {model_name} has not been exported, '\
+              'run babylemmatizer.py --export-ct2 first')
+        return []
+
+    rows, outputs = [], {}
+    ctranslate2 = Inference.ctranslate2
+    try:
+        for label, enabled in (('onmt', False), ('ctranslate2', True)):
+            Inference.ctranslate2 = enabled
+            model_api.translate_lines(lines[:30], model, cpu=True,
+                                      name=component, jobs=1)
+            start = time.perf_counter()
+            outputs[label] = model_api.translate_lines(
+                lines, model, cpu=True, name=component, jobs=1)
+            elapsed = time.perf_counter() - start
+            rows.append((label, len(lines), round(elapsed, 3),
+                         round(len(lines) / elapsed, 1)))
+    finally:
+        Inference.ctranslate2 = ctranslate2
+
+    agreement = sum(1 for x, y in zip(*outputs.values()) if x == y)
+    print(f'\n> {component} backends for {model_name} (CPU)')
+    print_table(('BACKEND', 'LINES', 'SECONDS', 'LINES/S'), rows)
+    print(f'   Agreement: {round(100 * agreement / len(lines), 2)}%')
+    return rows
+
+
+def imported_modules(*args):
+    """ Return the names of the modules imported by a run of
+    babylemmatizer.py with command line arguments `args` and its
+    elapsed time in seconds """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'babylemmatizer.py')
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', script, *args],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        encoding='utf-8')
+    elapsed = time.perf_counter() - start
+
+    """ -X importtime lines: import time: self | cumulative | name """
+    modules = {line.split('|')[-1].strip()
+               for line in result.stderr.splitlines()
+               if line.startswith('import time:') and '|' in line}
+    return modules, elapsed
+
+
+def heavy_modules(modules):
+    """ Return the sorted HEAVY_MODULES and their submodules in
+    `modules` """
+    return sorted(m for m in modules
+                  if m.split('.')[0] in HEAVY_MODULES or m in HEAVY_MODULES)
+
+
+def benchmark_startup(commands=(('--version',), ('--help',)), repeat=5,
+                      budget=STARTUP_BUDGET):
+    """ Measure the startup time of babylemmatizer.py commands and
+    list the heavy modules they import. Return True if all commands
+    are within `budget` and import none of HEAVY_MODULES.
+
+    :param commands              command line arguments to time
+    :param repeat                runs per command; the fastest counts
+    :param budget                startup budget in seconds """
+
+    rows, ok = [], True
+    for args in commands:
+        times = []
+        for _ in range(repeat):
+            modules, elapsed = imported_modules(*args)
+            times.append(elapsed)
+        heavy = heavy_modules(modules)
+        elapsed = min(times)
+        passed = elapsed <= budget and not heavy
+        ok = ok and passed
+        rows.append((' '.join(args), round(elapsed, 3), len(modules),
+                     'OK' if passed else 'FAIL'))
+        if heavy:
+            print(f'> {" ".join(args)} imports {", ".join(heavy)}')
+
+    print(f'\n> Startup time (budget {budget} s)')
+    print_table(('COMMAND', 'SECONDS', 'MODULES', 'STATUS'), rows)
+    return ok
+
+
+if __name__ == "__main__":
+    ap = ArgumentParser()
+    ap.add_argument('benchmark',
+                    choices=('jobs', 'bucketing', 'decoding', 'tagger',
+                             'backend', 'startup'))
+    ap.add_argument('--model', type=str)
+    ap.add_argument('--model-path', type=str)
+    ap.add_argument('--component', type=str, default='tagger',
+                    choices=('tagger', 'lemmatizer'))
+    ap.add_argument('--size', type=int)
+    ap.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4, 8])
+    ap.add_argument('--text', type=str, default='demo/enuma.txt')
+    ap.add_argument('--repeat', type=int, default=1)
+    ap.add_argument('--batch-tokens', type=int)
+    ap.add_argument('--budget', type=float, default=STARTUP_BUDGET)
+    args = ap.parse_args()
+
+    if args.benchmark == 'startup':
+        sys.exit(0 if benchmark_startup(budget=args.budget) else 1)
+    elif not args.model:
+        ap.error(f'{args.benchmark} requires --model')
+
+    if args.model_path:
+        Paths.models = args.model_path
+
+    if args.batch_tokens:
+        Inference.batch_tokens = args.batch_tokens
+        Inference.tuned = False
+
+    if args.benchmark == 'jobs':
+        benchmark_jobs(args.model, args.jobs, args.component, args.size)
+    elif args.benchmark == 'bucketing':
+        benchmark_bucketing(args.model, args.text, args.component, args.repeat)
+    elif args.benchmark == 'decoding':
+        benchmark_decoding(args.model, args.size)
+    elif args.benchmark == 'tagger':
+        benchmark_tagger(args.model, args.size)
+    elif args.benchmark == 'backend':
+        benchmark_backend(args.model, args.component, args.size)
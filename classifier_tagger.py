@@ -0,0 +1,223 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import random
+from collections import defaultdict
+from argparse import ArgumentParser
+
+""" ===========================================================
+Classifier tagger for BabyLemmatizer 2
+
+A light alternative to the OpenNMT tagger. The tagger target is
+always a single XPOS tag, so tagging is treated as classifying
+the tagger input line (the form and its context, see
+preprocessing.make_tagger_src) with an averaged perceptron over
+sign and form features. It is trained from the same
+tagger/traindata/train.src and train.tgt as the neural tagger
+and needs nothing outside the standard library.
+
+The engine is selected with `tagger_engine: classifier` in the
+config.yaml of the model (--tagger-engine=classifier when the
+model is built). To train the classifier of an existing model:
+
+   python classifier_tagger.py --model=assyrian
+
+=========================================================== """
+
+MODEL_FILE = 'classifier.json'
+SIGN_DELIMITERS = re.compile('[-.]')
+
+
+def features(line):
+    """ Return the features of a tagger input line: the target
+    form, its signs, sign pairs and final characters, and the
+    forms and last signs of the context by their position
+    relative to the target
+
+    :param line                  tagger input line, e.g.
+                                 `a - n a | << b e - l i >> | x`
+    :type line                   str """
+
+    forms = line.split(' | ')
+    target = next((i for i, form in enumerate(forms)
+                   if form.startswith('<< ')), 0)
+    feats = ['bias']
+    for i, form in enumerate(forms):
+        offset = i - target
+        if offset == 0:
+            form = form[3:-3]
+        form = form.replace(' ', '')
+        signs = SIGN_DELIMITERS.split(form)
+        if offset:
+            feats.append(f'{offset}w={form}')
+            feats.append(f'{offset}l={signs[-1]}')
+            continue
+
+        feats.append(f'w={form}')
+        feats.append(f'f={signs[0]}')
+        feats.append(f'l={signs[-1]}')
+        feats.append(f'n={min(len(signs), 6)}')
+        feats.append(f'f2={"-".join(signs[:2])}')
+        feats.append(f'l2={"-".join(signs[-2:])}')
+        feats.append(f'x1={form[-1:]}')
+        feats.append(f'x3={form[-3:]}')
+        feats.extend(f's={sign}' for sign in set(signs))
+    return feats
+
+
+class PerceptronTagger:
+
+    """ Averaged perceptron classifier
+
+    :param weights               {feature: {tag: weight}}
+    :param classes               tags in the order used to break ties
+
+    :type weights                dict
+    :type classes                [str, ...] """
+
+    def __init__(self, weights=None, classes=None):
+        self.weights = weights or {}
+        self.classes = classes or []
+        self.order = {tag: e for e, tag in enumerate(self.classes)}
+
+
+    def scores(self, feats):
+        scores = defaultdict(float)
+        for feat in feats:
+            for tag, weight in self.weights.get(feat, {}).items():
+                scores[tag] += weight
+        return scores
+
+
+    def predict(self, line):
+        """ Return the best tag for a tagger input line """
+        scores = self.scores(features(line))
+        if not scores:
+            return self.classes[0] if self.classes else '_'
+        return max(scores, key=lambda tag: (scores[tag], -self.order[tag]))
+
+
+    def translate(self, lines):
+        """ Tag input lines; the same interface as model_api.Translator """
+        return [self.predict(line) for line in lines]
+
+
+    @classmethod
+    def train(cls, src_file, tgt_file, epochs=5, seed=0):
+        """ Train from tagger training data
+
+        :param src_file          tagger input lines (.src)
+        :param tgt_file          XPOS tags (.tgt)
+        :param epochs            passes over the training data
+        :param seed              seed for shuffling the data
+
+        :type src_file           path/file as str
+        :type tgt_file           path/file as str
+        :type epochs             int
+        :type seed               int """
+
+        with open(src_file, 'r', encoding='utf-8') as src,\
+             open(tgt_file, 'r', encoding='utf-8') as tgt:
+            examples = [(features(line), tag.replace(' ', ''))
+                        for line, tag in zip(src.read().splitlines(),
+                                             tgt.read().splitlines())]
+
+        """ Most frequent tag first, it wins ties """
+        counts = defaultdict(int)
+        for _, tag in examples:
+            counts[tag] += 1
+        tagger = cls(classes=sorted(counts, key=lambda t: (-counts[t], t)))
+        weights = tagger.weights
+
+        """ Averaging: sum of each weight over all updates, and the
+        update counter when each weight was last changed """
+        totals = defaultdict(float)
+        stamps = defaultdict(int)
+        instance = 0
+
+        def update(feat, tag, value):
+            key = (feat, tag)
+            tag_weights = weights.setdefault(feat, {})
+            weight = tag_weights.get(tag, 0.0)
+            totals[key] += (instance - stamps[key]) * weight
+            stamps[key] = instance
+            tag_weights[tag] = weight + value
+
+        shuffle = random.Random(seed).shuffle
+        for epoch in range(epochs):
+            shuffle(examples)
+            correct = 0
+            for feats, tag in examples:
+                instance += 1
+                scores = tagger.scores(feats)
+                guess = max(scores, key=lambda t: (scores[t], -tagger.order[t]))\
+                    if scores else tagger.classes[0]
+                if guess == tag:
+                    correct += 1
+                    continue
+                for feat in feats:
+                    update(feat, tag, 1.0)
+                    update(feat, guess, -1.0)
+            print(f'> Classifier tagger: epoch {epoch+1}/{epochs}, '\
+                  f'training accuracy {round(100*correct/max(1, len(examples)), 2)}%')
+
+        for feat, tag_weights in weights.items():
+            for tag, weight in tag_weights.items():
+                key = (feat, tag)
+                total = totals[key] + (instance - stamps[key]) * weight
+                tag_weights[tag] = round(total / instance, 3)
+        tagger.prune()
+        return tagger
+
+
+    def prune(self):
+        """ Drop zero weights and features without weights """
+        self.weights = {feat: {tag: w for tag, w in tag_weights.items() if w}
+                        for feat, tag_weights in self.weights.items()}
+        self.weights = {feat: w for feat, w in self.weights.items() if w}
+
+
+    def save(self, filename):
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump({'classes': self.classes, 'weights': self.weights},
+                      f, ensure_ascii=False)
+
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['weights'], data['classes'])
+
+
+def train_model(model_path, epochs=5):
+    """ Train the classifier tagger of a model from its tagger
+    training data and save it to tagger/classifier.json
+
+    :param model_path            model directory
+    :type model_path             path/file as str """
+
+    traindata = os.path.join(model_path, 'tagger', 'traindata')
+    tagger = PerceptronTagger.train(
+        os.path.join(traindata, 'train.src'),
+        os.path.join(traindata, 'train.tgt'),
+        epochs)
+    filename = os.path.join(model_path, 'tagger', MODEL_FILE)
+    tagger.save(filename)
+    print(f'> Classifier tagger saved to {filename}')
+    return tagger
+
+
+if __name__ == "__main__":
+    from preferences import Paths
+    ap = ArgumentParser()
+    ap.add_argument('--model', type=str, required=True)
+    ap.add_argument('--model-path', type=str)
+    ap.add_argument('--epochs', type=int, default=5)
+    args = ap.parse_args()
+    if args.model_path:
+        Paths.models = args.model_path
+    train_model(os.path.join(Paths.models, args.model), args.epochs)
@@ -171,6 +171,10 @@ class ConlluPlus:
                       'xpos': defaultdict(int)}
         self.warnings = defaultdict(list)
 
+        """ Annotations fixed before neural net inference, one dict
+        or None per word; None if nothing is fixed """
+        self.fixed = None
+
         if filename is None:
             pass
         elif filename.endswith('.conllu'):
@@ -275,6 +279,32 @@ class ConlluPlus:
         self.word_count = sum(len(unit) for _, unit in self.data)
             
 
+    def _parse_line(self, line, lineno):
+        """ Split a word line into fields and fix its contents """
+        line = line.split('\t')
+        if len(line) < LAST_FIELD:
+            line.extend(['_'] * (LAST_FIELD - len(line) + 1))
+
+        # DELETE LOCK
+        line[-1] = '_'
+
+        """ Fix empty elements """
+        if '' in set(line):
+            print(f'> ERROR: Empty field at line {lineno} -> '\
+                  'replaced with _')
+            line = [x if x != '' else '_' for x in line]
+
+        if self.validate:
+            is_valid = self._is_valid(line, lineno)
+
+        ## TODO: Add possibility to clean data automatically
+
+        self.freqs['lemma'][line[FIELDS['lemma']]] += 1
+        self.freqs['form'][line[FIELDS['form']]] += 1
+        self.freqs['xpos'][line[FIELDS['xpos']]] += 1
+        return line
+
+    
     def read_file(self, filename):
         """ Reads and parses a CoNLL-U+ file. Forces
         additional fields for extra information 
@@ -283,7 +313,9 @@ class ConlluPlus:
         :type filename         str / path  
 
         If this method is called repeatedly, it will
-        concatenate all the CoNLL-U+ files. """
+        concatenate all the CoNLL-U+ files. The last unit
+        is kept even if the file does not end in a blank
+        line. """
 
         print(f'> Parsing {filename}')
         with open(filename, 'r', encoding='utf-8') as f:
@@ -294,34 +326,16 @@ class ConlluPlus:
                 if line.startswith('#'):
                     comments.append(line)
                 elif line:
-                    line = line.split('\t')
-                    if len(line) < LAST_FIELD:
-                        line.extend(['_'] * (LAST_FIELD - len(line) + 1))
-
-                    # DELETE LOCK
-                    line[-1] = '_'
-                    
-                    """ Fix empty elements """
-                    if '' in set(line):
-                        print(f'> ERROR: Empty field at line {e} -> '\
-                              'replaced with _')
-                        line = [x if x != '' else '_' for x in line]
-                        
-                    if self.validate:
-                        is_valid = self._is_valid(line, e)
-
-                    ## TODO: Add possibility to clean data automatically
-                    
+                    line = self._parse_line(line, e)
                     lines.append(line)
-
-                    self.freqs['lemma'][line[FIELDS['lemma']]] += 1
-                    self.freqs['form'][line[FIELDS['form']]] += 1
-                    self.freqs['xpos'][line[FIELDS['xpos']]] += 1
                 else:
                     self.data.append((comments, lines))
                     lines = []
                     comments = []
 
+        if lines or comments:
+            self.data.append((comments, lines))
+
         if self.validate:
             print('\n================================')
             print('WARNINGS')
@@ -335,24 +349,39 @@ class ConlluPlus:
         self.word_count = sum(len(unit) for _, unit in self.data)
 
             
-    def write_file(self, filename, add_info=False):
+    def write_file(self, filename, add_info=False, append=False):
         """ Compiles and writes a CoNLL-U+ file
         :param filename        filename
-        :type filename         str / path  """
+        :param add_info        write BabyLemmatizer header
+        :param append          append to an existing file
+        :type filename         str / path  
+        :type add_info         bool
+        :type append           bool """
 
         print(f'> Writing {filename}')
-        with open(filename, 'w', encoding='utf-8') as f:
-            if add_info:
-                f.write(f'# global.info = generated with BabyLemmatizer {__version__}; '\
-                    'github.com/asahala/BabyLemmatizer\n')
-                f.write('# global.columns = ' + ' '.join(FIELDS) + '\n')
-            for comments, sentence in self.data:
-                if comments:
-                    for comment in comments:
-                        f.write(comment + '\n')
-                for word in sentence:
-                    f.write('\t'.join(word) + '\n')
-                f.write('\n')
+        with open(filename, 'a' if append else 'w', encoding='utf-8') as f:
+            for line in self.iterate_lines(add_info):
+                f.write(line)
+
+
+    def iterate_lines(self, add_info=False):
+        """ Yield the compiled CoNLL-U+ file line by line """
+        if add_info:
+            yield f'# global.info = generated with BabyLemmatizer {__version__}; '\
+                'github.com/asahala/BabyLemmatizer\n'
+            yield '# global.columns = ' + ' '.join(FIELDS) + '\n'
+        for comments, sentence in self.data:
+            if comments:
+                for comment in comments:
+                    yield comment + '\n'
+            for word in sentence:
+                yield '\t'.join(word) + '\n'
+            yield '\n'
+
+
+    def to_string(self, add_info=False):
+        """ Compile the CoNLL-U+ data into a string """
+        return ''.join(self.iterate_lines(add_info))
 
 
     def get_word_freqs(self, field):
@@ -552,8 +581,18 @@ class ConlluPlus:
         the file and write them into correction glossaries 
         aka lemmadicts. """
         
-        lemmadict = defaultdict(LemmaDict)
-    
+        lemmadict = self.collect_lemmalists(defaultdict(LemmaDict))
+
+        for score, ldict in lemmadict.items():
+            ldict.write_file(score, self.filename)
+
+
+    def collect_lemmalists(self, lemmadict):
+        """ Add low-confidence lemmatizations to lemmadicts
+
+        :param lemmadict       lemmadicts by score
+        :type lemmadict        defaultdict(LemmaDict) """
+        
         for comments, unit in self.data:
             for form, lemma, xpos, score in self._iterate_fields(
                     unit, 'form', 'lemma', 'xpos', 'score'):
@@ -562,8 +601,7 @@ class ConlluPlus:
                 if float(score) <= 2.0:
                     lemmadict[score].add_entry(form, lemma, xpos)
 
-        for score, ldict in lemmadict.items():
-            ldict.write_file(score, self.filename)
+        return lemmadict
 
 
     def unlemmatize(self, numbers=True):
@@ -605,6 +643,52 @@ class ConlluPlus:
             print(f'  + {self.lacunae_removed} lacunae flattened')
 
 
+def read_chunks(filename, chunk_size, validate=False):
+    """ Read a CoNLL-U+ file as ConlluPlus objects of about
+    `chunk_size` words. Units are never split between chunks.
+    The units are the same as with ConlluPlus.read_file().
+
+    :param filename        filename
+    :param chunk_size      number of words per chunk
+    :param validate        Run validator to check data integrity
+
+    :type filename         str / path
+    :type chunk_size       int
+    :type validate         bool """
+
+    def new_chunk():
+        chunk = ConlluPlus(None, validate=validate)
+        chunk.filename = filename
+        chunk.word_count = 0
+        return chunk
+    
+    print(f'> Streaming {filename} in chunks of {chunk_size} words')
+    chunk = new_chunk()
+    with open(filename, 'r', encoding='utf-8') as f:
+        lines = []
+        comments = []
+        for e, line in enumerate(f, start=1):
+            line = line.strip()
+            if line.startswith('#'):
+                comments.append(line)
+            elif line:
+                lines.append(chunk._parse_line(line, e))
+            else:
+                chunk.data.append((comments, lines))
+                chunk.word_count += len(lines)
+                lines = []
+                comments = []
+                if chunk.word_count >= chunk_size:
+                    yield chunk
+                    chunk = new_chunk()
+
+    if lines or comments:
+        chunk.data.append((comments, lines))
+        chunk.word_count += len(lines)
+    if chunk.data:
+        yield chunk
+
+    
 if __name__ == "__main__":
     #y = ConlluPlus('achemenet/achemenet-murashu.conllu', validate=False)
     #contexts = x.get_contexts('form', 'xpos', size=1)
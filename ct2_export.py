@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import model_api
+from preferences import Paths
+
+""" ===========================================================
+CTranslate2 export for BabyLemmatizer 2
+
+Converts the tagger and lemmatizer checkpoints of a model to
+CTranslate2 format in <component>/ctranslate2 next to model.pt.
+model_api then translates with CTranslate2 instead of OpenNMT-py
+(see Inference.ctranslate2 and the ct2_* settings); an export
+older than its model.pt is ignored.
+
+   python babylemmatizer.py --export-ct2=assyrian
+
+CTranslate2 converts only OpenNMT-py Transformer checkpoints.
+Both training configurations in base_yaml.py use a bidirectional
+LSTM encoder (encoder_type: brnn), so every model trained with
+BabyLemmatizer is refused with an error message; such models
+keep running with OpenNMT-py.
+
+=========================================================== """
+
+COMPONENTS = ('tagger', 'lemmatizer')
+
+
+def io(message):
+    print(f'> {message}')
+
+
+def architecture(model_name):
+    """ Return the encoder and decoder types of a checkpoint """
+    import torch
+    try:
+        checkpoint = torch.load(
+            model_name, map_location='cpu', weights_only=False)
+    except TypeError:
+        checkpoint = torch.load(model_name, map_location='cpu')
+    opt = checkpoint['opt']
+    return getattr(opt, 'encoder_type', 'rnn'),\
+        getattr(opt, 'decoder_type', 'rnn')
+
+
+def export_checkpoint(model_name):
+    """ Convert an OpenNMT-py checkpoint to CTranslate2 format and
+    return the output directory. Raises ValueError if the model
+    cannot be converted.
+
+    :param model_name            model checkpoint path
+    :type model_name             path/file as str """
+
+    encoder, decoder = architecture(model_name)
+    if encoder != 'transformer' or decoder != 'transformer':
+        raise ValueError(
+            f'CTranslate2 supports only Transformer models, {model_name} '\
+            f'has a {encoder} encoder and a {decoder} decoder')
+
+    from ctranslate2.converters import OpenNMTPyConverter
+    output_dir = os.path.join(os.path.dirname(model_name), model_api.CT2_DIR)
+    OpenNMTPyConverter(model_name).convert(output_dir, force=True)
+    return output_dir
+
+
+def export_model(model_name):
+    """ Export the OpenNMT networks of a model; return True if
+    all of them were converted
+
+    :param model_name            model name in Paths.models
+    :type model_name             str """
+
+    model_path = os.path.join(Paths.models, model_name)
+    ok = True
+    for component in COMPONENTS:
+        checkpoint = os.path.join(model_path, component, 'model.pt')
+        if not os.path.isfile(checkpoint):
+            io(f'{component} of {model_name} has no model.pt, skipping')
+            continue
+        if model_api.tagger_engine(checkpoint) == 'classifier':
+            continue
+        try:
+            output_dir = export_checkpoint(checkpoint)
+        except ValueError as e:
+            io(f'Cannot export {component} of {model_name}: {e}')
+            ok = False
+            continue
+        io(f'Exported {component} of {model_name} to {output_dir}')
+    return ok
@@ -9,19 +9,33 @@ import cuneiformtools.util as util
 import cuneiformtools.norm as norm
 import cuneiformtools.aa_data as anderson
 from cuneiformtools.alphabet import CONSONANT, VOWEL, DELIMITERS, REMOVE_INDEX
-from cuneiformtools.ogsl_data import sign_list
 from functools import lru_cache
 
 
-_lookup = {}
-_lookup_r = {}
+@lru_cache(maxsize=None)
+def _tables():
+    """ Load the sign list on first use; ogsl_data is large
+    and slow to import """
+    from cuneiformtools.ogsl_data import sign_list
+    lookup = {}
+    lookup_r = {}
+    for key in sign_list['signs']:
+        values = sign_list['signs'][key].get('values', None)
+        if values is not None:
+            lookup.setdefault(key, values)
+            for v in values:
+                lookup_r[v] = key
+    return sign_list, lookup, lookup_r
 
-for key in sign_list['signs']:
-    values = sign_list['signs'][key].get('values', None)
-    if values is not None:
-        _lookup.setdefault(key, values)
-        for v in values:
-            _lookup_r[v] = key
+
+def _sign_list():
+    return _tables()[0]
+
+def _lookup():
+    return _tables()[1]
+
+def _lookup_r():
+    return _tables()[2]
 
 
 def _remove_indices(string):
@@ -32,14 +46,14 @@ def credits():
     print(io.DIV)
     for key in ('project', 'source', 'license', 'license-url',
                 'more-info', 'UTC-timestamp'):
-        print(f'{io.INDENT}{key}: {sign_list[key]}')
+        print(f'{io.INDENT}{key}: {_sign_list()[key]}')
     print('\n')
     print('Original AA-Sign list spreadsheet')
     print(io.DIV)
     print(f'{io.INDENT}author: {anderson.credits}')
 
 def version():
-    print(f"OGSL version: {sign_list['UTC-timestamp']}")
+    print(f"OGSL version: {_sign_list()['UTC-timestamp']}")
     print(f"AA-Sign list version: {anderson.version}")
 
 
@@ -55,7 +69,7 @@ def _set_sort_key(sort_index):
 
 
 def _collect_phonemic(phonemic, normalize):
-    for key, values in _lookup.items():
+    for key, values in _lookup().items():
         for value in values:
             if re.match('^%s$' % phonemic, _remove_indices(value)):
                 yield (value, key)
@@ -70,7 +84,7 @@ def get_name(reading, normalize=False):
     """
     reading = norm.harmonize_all(reading)
     
-    for name, readings in _lookup.items():
+    for name, readings in _lookup().items():
         if reading in readings:
             return name
 
@@ -89,7 +103,7 @@ def get_readings(sign, sort=False, normalize=False):
 
     if sign.islower():
         sign = get_name(sign)
-    readings = _lookup.get(sign, None)
+    readings = _lookup().get(sign, None)
 
     if readings is not None:
         return _sort(readings, sort_index=0, sort=sort)
@@ -189,16 +203,16 @@ def contains_sign(sign, position='', sort=False, normalize=False):
     final = '.' + sign + '|'
     
     if position == 'initial':        
-        array = [sign for sign in _lookup
+        array = [sign for sign in _lookup()
                  if sign.startswith(initial)]
     elif position == 'final':
-        array = [sign for sign in _lookup
+        array = [sign for sign in _lookup()
                  if sign.endswith(final)]
     elif position == 'middle':
-        array = [sign for sign in _lookup
+        array = [sign for sign in _lookup()
                  if (middle) in sign]
     else:
-        array = [sign for sign in _lookup
+        array = [sign for sign in _lookup()
                  if (initial) in sign
                  or (middle) in sign
                  or (final) in sign]
@@ -263,7 +277,7 @@ def _map_signs(xlit):
                     sign += c.lower()
         yield sign
 
-    return [_lookup_r.get(s, s) for s in _split(xlit) if s]
+    return [_lookup_r().get(s, s) for s in _split(xlit) if s]
 
     
 def get_signs(xlit, ignore_glosses=False, normalize=False):
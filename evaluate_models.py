@@ -8,10 +8,11 @@ import copy
 from collections import defaultdict
 from collections import Counter
 from command_parser import parse_prefix
-from postcorrect import pipeline as PP
-from preferences import Paths, Tokenizer, Context
+from preferences import Paths
 import postprocess
 import model_api
+import model_registry
+import instrumentation
 import conllutools
 import conlluplus
 import cuneiformtools.tests as tests
@@ -267,16 +268,19 @@ def evaluate(predictions, gold_standard, model, model_path):
     return output, oov_rate
         
     
-def pipeline(*models, cpu=False, fast=False):
-    """ Run the whole evaluation pipeline for `models`
+def pipeline(*models, cpu=False, fast=False, profile=False):
+    """ Run the whole evaluation pipeline for `models`. Stage
+    times are written to eval/report.json of each model.
 
     :param models        model name
     :param cpu           run on CPU instead of GPU
     :param no_run        do not rerun tagger/lemmatizer
+    :param profile       write cProfile statistics to eval/report.prof
        
     :type models         str
     :type cpu            bool
     :type no_run         bool
+    :type profile        bool
 
     """
 
@@ -299,9 +303,8 @@ def pipeline(*models, cpu=False, fast=False):
         lemmatizer_path = os.path.join(model_path, 'lemmatizer')
         conllu_path = os.path.join(model_path, 'conllu')
         
-        """ Load Tokenizer preferences """
-        Tokenizer.read(model)                
-        Context.read(model)
+        timer = instrumentation.StageTimer(profile)
+        timer.start_profiling()
         
         """ Intermediate files """
         tagger_output = 'output_tagger.txt'
@@ -317,50 +320,66 @@ def pipeline(*models, cpu=False, fast=False):
                   ' tagger/lemmatizer outputs not found')
             fast = False
 
-        """ Load test data as CoNLL-U+ object """
-        this_data = conlluplus.ConlluPlus(
-            os.path.join(conllu_path, 'test.conllu'),
-            validate=False)
+        """ Load model settings and lexicons; fast evaluation
+        re-scores the previous outputs and needs no translators """
+        with timer.stage('load model'):
+            session = model_registry.get_registry().get(
+                model, cpu, translators=not fast)
 
-        this_data.force_value('lemma', '_')
-        this_data.force_value('xpos', '_')
-        this_data.force_value('upos', '_')
+        """ Load test data as CoNLL-U+ object """
+        with timer.stage('parse') as stage:
+            this_data = conlluplus.ConlluPlus(
+                os.path.join(conllu_path, 'test.conllu'),
+                validate=False)
+
+            this_data.force_value('lemma', '_')
+            this_data.force_value('xpos', '_')
+            this_data.force_value('upos', '_')
+            words = stage['tokens'] = instrumentation.count_words(this_data)
         
         if not fast:
             print(f'> Running model {model}')
             """ Run tagger """
-            model_api.run_tagger(
-                input_file = os.path.join(tagger_path, 'traindata', 'test.src'),
-                model_name = os.path.join(tagger_path, step),
-                output_file = os.path.join(eval_path, tagger_output),
-                cpu = cpu)
+            with timer.stage('tagger', words):
+                model_api.run_tagger(
+                    input_file = os.path.join(tagger_path, 'traindata', 'test.src'),
+                    model_name = os.path.join(tagger_path, step),
+                    output_file = os.path.join(eval_path, tagger_output),
+                    cpu = cpu,
+                    settings = session.config.inference_settings())
 
             #xpos_tags = model_api.read_results(os.path.join(eval_path, tagger_output))
             #this_data.update_value('xpos', xpos_tags)
             #xposctx = this_data.get_context('xpos')
             #this_data.update_value('xposctx', xposctx)
             """ Merge tagger output with CoNLL-U+ """
-            model_api.merge_tags(
-                neural_net_output = os.path.join(eval_path, tagger_output),
-                conllu_object = this_data,#os.path.join(lemmatizer_path, 'traindata', 'test.src'),
-                output_file = os.path.join(eval_path, lemmatizer_input),
-                field = 'xpos',
-                fieldctx = 'xposctx')
+            with timer.stage('tagger merge', words):
+                model_api.merge_tags(
+                    neural_net_output = os.path.join(eval_path, tagger_output),
+                    conllu_object = this_data,#os.path.join(lemmatizer_path, 'traindata', 'test.src'),
+                    output_file = os.path.join(eval_path, lemmatizer_input),
+                    field = 'xpos',
+                    fieldctx = 'xposctx',
+                    config = session.config)
 
             """ Run lemmatizer """
-            model_api.run_lemmatizer(
-                input_file = os.path.join(eval_path, lemmatizer_input),
-                model_name = os.path.join(lemmatizer_path, step),
-                output_file = os.path.join(eval_path, lemmatizer_output),
-                cpu = cpu)
+            with timer.stage('lemmatizer', words):
+                model_api.run_lemmatizer(
+                    input_file = os.path.join(eval_path, lemmatizer_input),
+                    model_name = os.path.join(lemmatizer_path, step),
+                    output_file = os.path.join(eval_path, lemmatizer_output),
+                    cpu = cpu,
+                    settings = session.config.inference_settings())
 
             """ Merge lemmatizer output with CoNLL-U+ """
-            model_api.merge_tags(
-                neural_net_output = os.path.join(eval_path, lemmatizer_output),
-                conllu_object = this_data,#os.path.join(lemmatizer_path, 'traindata', 'test.src'),
-                output_file = None,#os.path.join(eval_path, lemmatizer_input),
-                field = 'lemma',
-                fieldctx = None)            
+            with timer.stage('lemmatizer merge', words):
+                model_api.merge_tags(
+                    neural_net_output = os.path.join(eval_path, lemmatizer_output),
+                    conllu_object = this_data,#os.path.join(lemmatizer_path, 'traindata', 'test.src'),
+                    output_file = None,#os.path.join(eval_path, lemmatizer_input),
+                    field = 'lemma',
+                    fieldctx = None,
+                    config = session.config)            
             
         #""" Merge prediced results """
         #model_api.merge_to_final(
@@ -369,23 +388,25 @@ def pipeline(*models, cpu=False, fast=False):
         #    output = os.path.join(eval_path, final_output))
 
         if fast:
-            """ Read XPOS and LEMMA tags produced by the neural net """
-            xpos_tags = model_api.read_results(os.path.join(eval_path, tagger_output))
-            lemmas = model_api.read_results(os.path.join(eval_path, lemmatizer_output))
-
-            """ Merge results with the CoNLL-U file """
-            #this_data = conlluplus.ConlluPlus(os.path.join(conllu_path, 'test.conllu'), validate=False)
-            this_data.update_value('xpos', xpos_tags)
-            this_data.update_value('lemma', lemmas)
-
-            """ Add XPOS context field based on predictions """
-            this_data.update_value('xposctx', this_data.get_contexts('xpos', size=Context.tagger_context))
+            with timer.stage('merge', words):
+                """ Read XPOS and LEMMA tags produced by the neural net """
+                xpos_tags = model_api.read_results(os.path.join(eval_path, tagger_output))
+                lemmas = model_api.read_results(os.path.join(eval_path, lemmatizer_output))
+
+                """ Merge results with the CoNLL-U file """
+                #this_data = conlluplus.ConlluPlus(os.path.join(conllu_path, 'test.conllu'), validate=False)
+                this_data.update_value('xpos', xpos_tags)
+                this_data.update_value('lemma', lemmas)
+
+                """ Add XPOS context field based on predictions """
+                this_data.update_value('xposctx', this_data.get_contexts('xpos', size=session.config.tagger_context))
         
         #""" Force 0.0 confidence scores """
         #this_data.force_value(field='score', value=str(0.0))
         
         """ Write lemmatized/tagged file to disk """
-        this_data.write_file(filename = os.path.join(eval_path, 'test_nn.conllu'))
+        with timer.stage('write', words):
+            this_data.write_file(filename = os.path.join(eval_path, 'test_nn.conllu'))
         
         """ Write neural net results to conllu """
         #conllutools.make_conllu(
@@ -405,41 +426,51 @@ def pipeline(*models, cpu=False, fast=False):
         #conllutools.write_conllu(fntmpp, tmp)
         
         """ Neural net evaluation """
-        R[model], OOV[model] = evaluate(
-            predictions = os.path.join(eval_path, 'test_nn.conllu'),
-            gold_standard = os.path.join(model_path, 'conllu', 'test.conllu'),
-            model = model,
-            model_path = model_path)
+        with timer.stage('evaluate', words):
+            R[model], OOV[model] = evaluate(
+                predictions = os.path.join(eval_path, 'test_nn.conllu'),
+                gold_standard = os.path.join(model_path, 'conllu', 'test.conllu'),
+                model = model,
+                model_path = model_path)
 
         """ Run post-corrections """
-        P = postprocess.Postprocessor(
-            predictions = this_data,
-            model_name = model)
+        P = session.postprocessor.bind(this_data)
 
         """ Initialize confidence scoring """
         #this_data.force_value(field='score', value=str(0.0))
-        P.initialize_scores()
-        P.fill_unambiguous(threshold = 0.7)
-        P.disambiguate_by_pos_context(threshold = 0.7)
-
-        this_data.force_value('xposctx', '_')
-        this_data.force_value('formctx', '_')
-        this_data.write_file(
-            filename = os.path.join(eval_path, 'test_pp.conllu'),
-            add_info = True)
+        with timer.stage('postprocess: scores', words):
+            P.initialize_scores()
+        with timer.stage('postprocess: unambiguous', words):
+            P.fill_unambiguous(threshold = 0.7)
+        with timer.stage('postprocess: disambiguate', words):
+            P.disambiguate_by_pos_context(threshold = 0.7)
+
+        with timer.stage('postprocess: cleanup', words):
+            this_data.force_value('xposctx', '_')
+            this_data.force_value('formctx', '_')
+        with timer.stage('write', words):
+            this_data.write_file(
+                filename = os.path.join(eval_path, 'test_pp.conllu'),
+                add_info = True)
         
         """ Post-correction evaluation """
-        R_post[model], OOV_post[model] = evaluate(
-            predictions = os.path.join(eval_path, 'test_pp.conllu'),
-            gold_standard = os.path.join(model_path, 'conllu', 'test.conllu'),
-            model = model,
-            model_path = model_path)
+        with timer.stage('evaluate', words):
+            R_post[model], OOV_post[model] = evaluate(
+                predictions = os.path.join(eval_path, 'test_pp.conllu'),
+                gold_standard = os.path.join(model_path, 'conllu', 'test.conllu'),
+                model = model,
+                model_path = model_path)
+
+        timer.stop_profiling()
+        timer.summary()
+        timer.write(os.path.join(eval_path, 'report.json'))
                 
 
     print('\nNeural Net Evaluation') 
     cross_validation(R, OOV)
     print('\nPost-correct Evaluation')
     cross_validation(R_post, OOV_post)
+    model_registry.get_registry().report()
 
 if __name__ == "__main__":
     #prefix = 'lbtest1'
@@ -0,0 +1,152 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import sys
+import json
+import time
+import cProfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+""" ===========================================================
+Stage timing for BabyLemmatizer 2
+
+Records wall time, CPU time, token counts and peak RSS for each
+stage of a run. Stages with the same name (e.g. the same stage
+of successive chunks) are summed.
+
+   timer = StageTimer()
+   with timer.stage('tagger', tokens=len(lines)):
+       ...
+   timer.write('output_report.json')
+
+CPU time is the CPU time of the whole process, so for stages
+that run in parallel threads it includes the work of the other
+threads.
+
+=========================================================== """
+
+def peak_rss():
+    """ Peak resident set size of the process in megabytes, or
+    None if it cannot be measured on this platform """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    """ Linux reports kilobytes, macOS bytes """
+    if sys.platform == 'darwin':
+        rss /= 1024
+    return round(rss / 1024, 1)
+
+
+def count_words(data):
+    """ Number of words in a ConlluPlus object """
+    return sum(len(unit) for _, unit in data.data)
+
+
+class StageTimer:
+
+    """ Collects per-stage measurements of a run
+
+    :param profile               also collect cProfile statistics
+    :type profile                bool """
+
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.profiler = None
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+
+
+    @contextmanager
+    def stage(self, name, tokens=None):
+        """ Measure the enclosed block as stage `name`. Yields a dict
+        where the block can set `tokens` if the count is not known in
+        advance. """
+        record = {'tokens': tokens}
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield record
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            self.add(name, wall, cpu, record['tokens'])
+
+
+    def add(self, name, wall, cpu, tokens=None):
+        with self.lock:
+            stage = self.stages.setdefault(
+                name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'tokens': 0})
+            stage['calls'] += 1
+            stage['wall'] += wall
+            stage['cpu'] += cpu
+            stage['tokens'] += tokens or 0
+            stage['peak_rss_mb'] = peak_rss()
+
+
+    def start_profiling(self):
+        if self.profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+
+    def stop_profiling(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+
+            
+    @contextmanager
+    def profiling(self):
+        """ Run the enclosed block under cProfile if profiling is on """
+        self.start_profiling()
+        try:
+            yield
+        finally:
+            self.stop_profiling()
+
+
+    def report(self):
+        """ Return the measurements as a JSON-serializable dict """
+        stages = {}
+        for name, stage in self.stages.items():
+            stages[name] = {
+                'calls': stage['calls'],
+                'wall_s': round(stage['wall'], 4),
+                'cpu_s': round(stage['cpu'], 4),
+                'tokens': stage['tokens'],
+                'tokens_per_s': round(stage['tokens'] / stage['wall'], 1)
+                                if stage['tokens'] and stage['wall'] else None,
+                'peak_rss_mb': stage['peak_rss_mb']}
+        return {'wall_s': round(time.perf_counter() - self.started, 4),
+                'cpu_s': round(time.process_time() - self.cpu_started, 4),
+                'peak_rss_mb': peak_rss(),
+                'stages': stages}
+
+
+    def summary(self):
+        """ Print stage times """
+        report = self.report()
+        print(f'> Stage times (total {report["wall_s"]} s, '\
+              f'peak RSS {report["peak_rss_mb"]} MB)')
+        for name, stage in report['stages'].items():
+            print(f'   {name: <28}{stage["wall_s"]: >10} s'\
+                  f'{stage["tokens"]: >10} tokens')
+
+
+    def write(self, filename):
+        """ Write the JSON report to `filename` and the cProfile
+        statistics to `filename` with .prof instead of .json """
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+        print(f'> Wrote timing report to {filename}')
+        if self.profiler is not None:
+            stats_file = filename.rsplit('.', 1)[0] + '.prof'
+            self.profiler.dump_stats(stats_file)
+            print(f'> Wrote cProfile statistics to {stats_file}')
@@ -4,12 +4,25 @@
 import os
 import sys
 import shutil
-import tempfile
 import subprocess
+import glob
+import json
+import copy
+import hashlib
+import itertools
+import queue
+import threading
+from collections import defaultdict, Counter
+from concurrent.futures import ThreadPoolExecutor
 import conlluplus
 import preprocessing as pp
 import model_api
-from preferences import Paths, Tokenizer, Context
+import model_registry
+import instrumentation
+import prediction_cache
+import sentence_memo
+import cuneiformtools.tests as tests
+from preferences import Paths, Inference, ModelConfig, __version__
 import postprocess
 
 info = """===========================================================
@@ -70,9 +83,153 @@ def run_opennmt_translate(input_file, model_path, output_file, use_cpu=True, tim
         raise RuntimeError(f"OpenNMT execution error: {e}")
 
 
+def update_override(input_path, *model_names):
+    """ Add corrected lemmalists (.tsv) in `input_path` to the
+    override lexicon of the models """
+    overrides = [os.path.join(input_path, f) for f
+                 in os.listdir(input_path) if f.endswith('.tsv')]
+
+    if overrides:
+        for model_name in model_names:
+            mod_o = os.path.join(
+                Paths.models, model_name, 'override', 'override.conllu')
+            override = conlluplus.ConlluPlus(mod_o, validate=False)
+            for o_file in overrides:
+                override.read_corrections(o_file)
+                override.normalize()
+            override.write_file(mod_o)
+        for o_file in overrides:
+            os.remove(o_file)
+
+
+def vote(predictions):
+    """ Majority vote over the predictions of several models. Ties
+    are won by the model that comes first. Return the winning
+    predictions and the share of models that voted for them.
+
+    :param predictions     predictions of each model, in the same
+                           order of input lines
+    :type predictions      [[str, ...], ...] """
+
+    winners, shares = [], []
+    for candidates in zip(*predictions):
+        (winner, count), = Counter(candidates).most_common(1)
+        winners.append(winner)
+        shares.append(count / len(candidates))
+    return winners, shares
+
+
+class Stages:
+
+    """ Producer/consumer pipeline where each stage runs in its own
+    thread and passes items to the next stage through a bounded
+    queue. The order of the items is preserved.
+
+    :param stages          functions item -> item, in order
+    :param maxsize         number of items waiting between stages """
+
+    END = object()
+
+    """ Seconds between checks for shutdown while waiting on a queue """
+    TIMEOUT = 0.1
+    
+    def __init__(self, *stages, maxsize=2):
+        self.stages = stages
+        self.maxsize = maxsize
+        self.error = None
+        self.stopped = threading.Event()
+
+
+    def _put(self, target, item):
+        """ Put an item in the queue; False if the pipeline was
+        stopped before there was room for it """
+        while not self.stopped.is_set():
+            try:
+                target.put(item, timeout=self.TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+    def _get(self, source):
+        """ Get an item from the queue; END if the pipeline was
+        stopped before one arrived """
+        while not self.stopped.is_set():
+            try:
+                return source.get(timeout=self.TIMEOUT)
+            except queue.Empty:
+                pass
+        return self.END
+
+
+    def _stop(self, error):
+        self.error = error
+        self.stopped.set()
+
+
+    def _work(self, function, source, target):
+        while True:
+            item = self._get(source)
+            if item is self.END:
+                break
+            try:
+                result = function(item)
+            except Exception as e:
+                self._stop(e)
+                return
+            if not self._put(target, result):
+                return
+        self._put(target, self.END)
+
+            
+    def _feed(self, items, target):
+        try:
+            for item in items:
+                if not self._put(target, item):
+                    return
+        except Exception as e:
+            self._stop(e)
+            return
+        self._put(target, self.END)
+        
+
+    def run(self, items):
+        """ Yield the results of the last stage """
+        queues = [queue.Queue(self.maxsize)
+                  for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(
+            target=self._feed, args=(items, queues[0]), daemon=True)]
+        for function, source, target in zip(
+                self.stages, queues, queues[1:]):
+            threads.append(threading.Thread(
+                target=self._work, args=(function, source, target),
+                daemon=True))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = self._get(queues[-1])
+                if item is self.END:
+                    break
+                yield item
+        finally:
+            """ Stop the stages if a stage or the consumer has failed;
+            blocked stages notice it within TIMEOUT seconds """
+            self.stopped.set()
+            for thread in threads:
+                thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+                
 class Lemmatizer:
 
-    def __init__(self, input_file, fast=False, ignore_numbers=True, output_file=None):
+    def __init__(self, input_file, fast=False, ignore_numbers=True, output_file=None,
+                 chunk_size=None, pipelined=False, dictionary_first=False,
+                 incremental=False, profile=False, sentence_memo=False):
         """
         :param input_file: puede ser:
             - str: ruta a archivo .conllu (modo CLI clásico)
@@ -81,11 +238,36 @@ class Lemmatizer:
         :param ignore_numbers: bool
         :param output_file: str (opcional) - archivo de salida final
                            Si es None y input_file es objeto, NO escribe archivos
+        :param chunk_size: int (opcional) - stream the input file in
+                           sentence-aligned chunks of this many words
+        :param pipelined: bool - overlap the stages of successive chunks
+                          (only with chunk_size)
+        :param dictionary_first: bool - annotate words fully determined
+                          by the override lexicon or the training data
+                          without running the neural nets
+        :param incremental: bool - lemmatize only sentences that have
+                          changed since the previous run of the file
+        :param profile: bool - collect cProfile statistics in addition
+                          to the stage timing report
+        :param sentence_memo: bool - take sentences seen before from
+                          the sentence memo of the model and lemmatize
+                          each repeated sentence only once
         """
         
         self.ignore_numbers = ignore_numbers
         self.fast = fast
         self.output_file = output_file
+        self.chunk_size = chunk_size
+        self.pipelined = pipelined
+        self.dictionary_first = dictionary_first
+        self.incremental = incremental
+        self.sentence_memo = sentence_memo
+
+        """ Per-stage timing, see instrumentation.StageTimer """
+        self.timer = instrumentation.StageTimer(profile)
+
+        """ Settings of the model, set by run_model() """
+        self.config = None
         self.use_fallback_opennmt = False  # Flag para detectar si model_api falla
         
         # --------------------------------------------------
@@ -96,22 +278,21 @@ class Lemmatizer:
             self.input_file = None
             self.is_memory_mode = True
             
-            # Crear directorio temporal para archivos intermedios
-            self.temp_dir = tempfile.mkdtemp(prefix='babylem_')
-            self.input_path = self.temp_dir
-            
-            # Generar nombres de archivos intermedios en temp
-            fn = os.path.join(self.temp_dir, 'temp')
-            self.backup_file = os.path.join(self.temp_dir, 'backup_temp.conllu')
-            self.word_forms = fn + '.forms'
-            self.tagger_input = fn + '.tag_src'
-            self.tagger_output = fn + '.tag_pred'
-            self.lemmatizer_input = fn + '.lem_src'
-            self.lemmatizer_output = fn + '.lem_pred'
-            self.final_output = fn + '.final'
+            # Sin archivos intermedios: los datos se quedan en memoria
+            self.input_path = None
+            self.backup_file = None
+            self.word_forms = None
+            self.tagger_input = None
+            self.tagger_output = None
+            self.lemmatizer_input = None
+            self.lemmatizer_output = None
+            self.final_output = None
             
             self.line_count = 0
             self.segment_count = 0
+
+            # Chunking applies only to files
+            self.chunk_size = None
             
             return
         
@@ -140,19 +321,125 @@ class Lemmatizer:
         self.lemmatizer_input = fn + '.lem_src'
         self.lemmatizer_output = fn + '.lem_pred'
         self.final_output = fn + '.final'
+        self.sentence_hashes = fn + '.hashes'
         self.line_count = 0
         self.segment_count = 0
         
         # Load and normalize source CoNLL-U+ file
-        self.source_file = conlluplus.ConlluPlus(input_file, validate=False)
+        if chunk_size:
+            self.source_file = None
+        else:
+            with self.timer.stage('parse') as stage:
+                self.source_file = conlluplus.ConlluPlus(input_file, validate=False)
+                stage['tokens'] = self.source_file.word_count
 
         
-    def preprocess_source(self):
-        self.source_file.normalize()
-        formctx = self.source_file.get_contexts('form', size=Context.tagger_context)
-        self.source_file.update_value('formctx', formctx)
+    def get_config(self):
+        """ Return the settings of the model in use; process-wide
+        settings if no model has been set """
+        return self.config or ModelConfig.current()
+
         
-        with open(self.tagger_input, 'w', encoding='utf-8') as pos_src, \
+    def prepare_source(self, data=None, P=None):
+        """ Normalize input, build form contexts for the tagger and
+        fix annotations that do not need the neural nets """
+        if data is None:
+            data = self.source_file
+        words = instrumentation.count_words(data)
+        with self.timer.stage('normalize', words):
+            data.normalize()
+        with self.timer.stage('contexts', words):
+            formctx = data.get_contexts(
+                'form', size=self.get_config().tagger_context)
+            data.update_value('formctx', formctx)
+
+        data.fixed = None
+        with self.timer.stage('fixed annotations', words):
+            if self.dictionary_first and P is not None:
+                self.resolve_by_dictionary(data, P)
+            if self.ignore_numbers:
+                self.resolve_numbers(data)
+
+
+    def resolve_by_dictionary(self, data, P):
+        """ Fix lemma and XPOS of forms that are fully determined by
+        the override lexicon or have only one analysis in the training
+        data. Such words are left out of the neural net inputs, but
+        they remain in the context windows of their neighbours. """
+        forms = P.get_form_dictionary()
+        fixed = [forms.get(form, None) for form in data.get_contents('form')]
+        data.fixed = fixed
+        
+        resolved = sum(1 for x in fixed if x is not None)
+        if fixed:
+            io(f'Dictionary: {resolved} of {len(fixed)} words '\
+               f'({round(100*resolved/len(fixed), 2)}%) bypass the neural nets')
+
+
+    def resolve_numbers(self, data):
+        """ Fix numerals and lacunae to the values that unlemmatize()
+        gives them after post-processing, so that the neural nets
+        do not spend time on them """
+        forms = list(data.get_contents('form'))
+        fixed = data.fixed or [None] * len(forms)
+        resolved = 0
+        for index, form in enumerate(forms):
+            if tests.is_lacuna(form):
+                fixed[index] = {'lemma': '_', 'xpos': 'u'}
+            elif tests.is_numeral(form):
+                fixed[index] = {'lemma': '_', 'xpos': 'n'}
+            else:
+                continue
+            resolved += 1
+        data.fixed = fixed
+
+        if forms:
+            io(f'Numbers and lacunae: {resolved} of {len(forms)} words '\
+               f'({round(100*resolved/len(forms), 2)}%) bypass the neural nets')
+
+            
+    def tagger_source(self, data=None):
+        """ Yield tagger input lines for the words of the prepared
+        input that are not fixed """
+        if data is None:
+            data = self.source_file
+        config = self.get_config()
+        fixed = data.fixed or itertools.repeat(None)
+        for formctx, annotation in zip(data.get_contents('formctx'), fixed):
+            if annotation is None:
+                yield pp.make_tagger_src(
+                    formctx, context=config.tagger_context, setting=config.tokenizer)
+
+
+    def merge_tagger_output(self, predictions, data=None):
+        """ Merge tagger predictions and fixed XPOS tags into the data
+        and return the lemmatizer input lines """
+        if data is None:
+            data = self.source_file
+        tags = model_api.fill_fixed(
+            model_api.clean_results(predictions), data.fixed, 'xpos')
+        config = self.get_config()
+        model_api.merge_tags(tags, data, None, 'xpos', 'xposctx', config)
+
+        fixed = data.fixed or itertools.repeat(None)
+        return [line for line, annotation in zip(
+            model_api.lemmatizer_source(data, config), fixed) if annotation is None]
+
+
+    def merge_lemmatizer_output(self, predictions, data=None):
+        """ Merge lemmatizer predictions and fixed lemmata into the data """
+        if data is None:
+            data = self.source_file
+        lemmas = model_api.fill_fixed(
+            model_api.clean_results(predictions), data.fixed, 'lemma')
+        model_api.merge_tags(lemmas, data, None, 'lemma', None, self.get_config())
+        
+            
+    def preprocess_source(self, P=None):
+        self.prepare_source(P=P)
+        
+        with self.timer.stage('write inputs', instrumentation.count_words(self.source_file)),\
+             open(self.tagger_input, 'w', encoding='utf-8') as pos_src, \
              open(self.word_forms, 'w', encoding='utf-8') as wf:
             
             if not self.is_memory_mode:
@@ -160,10 +447,11 @@ class Lemmatizer:
             else:
                 io(f'Generating input data for neural net (memory mode)')
                 
-            for id_, form, formctx in self.source_file.get_contents('id', 'form', 'formctx'):
-                pos_src.write(
-                    pp.make_tagger_src(formctx, context=Context.tagger_context) + '\n')
-                wf.write(pp.get_chars(form + '\n'))
+            for line in self.tagger_source():
+                pos_src.write(line + '\n')
+                
+            for id_, form in self.source_file.get_contents('id', 'form'):
+                wf.write(pp.get_chars(form + '\n', self.get_config().tokenizer))
                 self.line_count += 1
                 if id_ == '1':
                     self.segment_count += 1
@@ -171,183 +459,1034 @@ class Lemmatizer:
             io(f'Input file size: {self.line_count} words in {self.segment_count} segments.')
 
 
-    def update_model(self, model_name):
-        overrides = [os.path.join(self.input_path, f) for f
-                     in os.listdir(self.input_path) if f.endswith('.tsv')]
-                
-        if overrides:
-            mod_o = os.path.join(
-                Paths.models, model_name, 'override', 'override.conllu')
-            override = conlluplus.ConlluPlus(mod_o, validate=False)
-            for o_file in overrides:
-                override.read_corrections(o_file)
-                override.normalize()
-                os.remove(o_file)
-            override.write_file(mod_o)
+    def update_model(self, *model_names):
+        """ Objects in memory have no directory for corrections """
+        if self.input_path is not None:
+            update_override(self.input_path, *model_names)
 
-            
-    def run_model(self, model_name, cpu):
-        """
-        Ejecuta el modelo de lemmatización.
-        
-        :param model_name: nombre del modelo
-        :param cpu: bool - usar CPU en lugar de GPU
-        :return: conlluplus.ConlluPlus - objeto procesado (siempre)
-        """
 
-        # Read Tokenizer Preferences
-        Tokenizer.read(model_name)
-        Context.read(model_name)
+    def run_neural_nets(self, model_name, cpu, data=None):
+        """ Tag and lemmatize prepared data in memory. Neural net
+        inputs and predictions are passed as lists, so nothing is
+        written to disk. """
+        if data is None:
+            data = self.source_file
+        tagger_path = os.path.join(
+            Paths.models, model_name, 'tagger', 'model.pt')
+        lemmatizer_path = os.path.join(
+            Paths.models, model_name, 'lemmatizer', 'model.pt')
         
-        # Update model override
-        self.update_model(model_name)
-
-        # En modo clásico, recargar desde archivo
-        if not self.is_memory_mode:
-            self.source_file = conlluplus.ConlluPlus(
-                self.input_file, validate=False)
+        settings = self.get_config().inference_settings()
         
-        # Backup for write-protected fields
-        if not self.is_memory_mode:
-            pp_file = self.input_file.replace('.conllu', '_pp.conllu')
-            if os.path.isfile(pp_file):
-                is_backup = True
-                shutil.copy(pp_file, self.backup_file)
-            else:
-                is_backup = False
-        else:
-            is_backup = False
+        io(f'Tagging with {model_name}')
+        src = list(self.tagger_source(data))
+        with self.timer.stage('tagger', len(src)):
+            tags = model_api.translate(
+                src, tagger_path, cpu, 'Tagger', settings=settings)
+        with self.timer.stage('tagger merge', len(tags)):
+            src = self.merge_tagger_output(tags, data)
+        
+        io(f'Lemmatizing with {model_name}')
+        with self.timer.stage('lemmatizer', len(src)):
+            lemmas = model_api.translate(
+                src, lemmatizer_path, cpu, 'Lemmatizer', settings=settings)
+        with self.timer.stage('lemmatizer merge', len(lemmas)):
+            self.merge_lemmatizer_output(lemmas, data)
+
             
-        # Preprocess data for lemmatization
-        self.preprocess_source()
-                
-        # Set model paths
+    def run_tagger(self, model_name, cpu):
+        """ Tag the preprocessed input and build lemmatizer input """
         tagger_path = os.path.join(
                 Paths.models, model_name, 'tagger', 'model.pt')
-        lemmatizer_path = os.path.join(
-                Paths.models, model_name, 'lemmatizer', 'model.pt')
 
         # ===================================================================
         # Run tagger on input (con fallback robusto)
         # ===================================================================
         io(f'Tagging with {model_name}')
         
-        try:
-            # Intentar usar model_api original
-            model_api.run_tagger(self.tagger_input,
-                                 tagger_path,
-                                 self.tagger_output,
-                                 cpu)
+        with self.timer.stage('tagger') as stage:
+            try:
+                # Intentar usar model_api original
+                model_api.run_tagger(self.tagger_input,
+                                     tagger_path,
+                                     self.tagger_output,
+                                     cpu,
+                                     settings=self.get_config().inference_settings())
             
-            # Verificar que generó el archivo
-            if not os.path.isfile(self.tagger_output):
-                raise FileNotFoundError("model_api.run_tagger did not generate output")
+                # Verificar que generó el archivo
+                if not os.path.isfile(self.tagger_output):
+                    raise FileNotFoundError("model_api.run_tagger did not generate output")
                 
-        except Exception as e:
-            # Si falla, usar método alternativo directo
-            io(f"model_api.run_tagger failed, using direct OpenNMT: {e}")
-            self.use_fallback_opennmt = True
-            run_opennmt_translate(self.tagger_input, tagger_path, 
-                                self.tagger_output, cpu)
+            except Exception as e:
+                # Si falla, usar método alternativo directo
+                io(f"model_api.run_tagger failed, using direct OpenNMT: {e}")
+                self.use_fallback_opennmt = True
+                run_opennmt_translate(self.tagger_input, tagger_path, 
+                                    self.tagger_output, cpu)
+            tags = list(model_api.read_results(self.tagger_output))
+            stage['tokens'] = len(tags)
 
         # Merge tags to make lemmatizer input
-        model_api.merge_tags(self.tagger_output,
-                             self.source_file,
-                             self.lemmatizer_input,
-                             'xpos',
-                             'xposctx')
+        with self.timer.stage('tagger merge', len(tags)):
+            lem_src = self.merge_tagger_output(tags)
+            with open(self.lemmatizer_input, 'w', encoding='utf-8') as o_file:
+                for line in lem_src:
+                    o_file.write(line + '\n')
+
 
+    def run_lemmatizer(self, model_name, cpu):
+        """ Lemmatize the tagged input """
+        lemmatizer_path = os.path.join(
+                Paths.models, model_name, 'lemmatizer', 'model.pt')
+        
         # ===================================================================
         # Run lemmatizer (con fallback robusto)
         # ===================================================================
         io(f'Lemmatizing with {model_name}')
         
-        try:
-            if not self.use_fallback_opennmt:
-                # Intentar usar model_api original
-                model_api.run_lemmatizer(self.lemmatizer_input,
-                                       lemmatizer_path,
-                                       self.lemmatizer_output,
-                                       cpu)
+        with self.timer.stage('lemmatizer') as stage:
+            try:
+                if not self.use_fallback_opennmt:
+                    # Intentar usar model_api original
+                    model_api.run_lemmatizer(self.lemmatizer_input,
+                                           lemmatizer_path,
+                                           self.lemmatizer_output,
+                                           cpu,
+                                           settings=self.get_config().inference_settings())
                 
-                # Verificar que generó el archivo
-                if not os.path.isfile(self.lemmatizer_output):
-                    raise FileNotFoundError("model_api.run_lemmatizer did not generate output")
-            else:
-                # Ya sabemos que model_api falla, usar directo
-                raise RuntimeError("Using fallback")
+                    # Verificar que generó el archivo
+                    if not os.path.isfile(self.lemmatizer_output):
+                        raise FileNotFoundError("model_api.run_lemmatizer did not generate output")
+                else:
+                    # Ya sabemos que model_api falla, usar directo
+                    raise RuntimeError("Using fallback")
                 
-        except Exception as e:
-            # Si falla, usar método alternativo directo
-            if not self.use_fallback_opennmt:
-                io(f"model_api.run_lemmatizer failed, using direct OpenNMT: {e}")
-                self.use_fallback_opennmt = True
-            run_opennmt_translate(self.lemmatizer_input, lemmatizer_path,
-                                self.lemmatizer_output, cpu)
+            except Exception as e:
+                # Si falla, usar método alternativo directo
+                if not self.use_fallback_opennmt:
+                    io(f"model_api.run_lemmatizer failed, using direct OpenNMT: {e}")
+                    self.use_fallback_opennmt = True
+                run_opennmt_translate(self.lemmatizer_input, lemmatizer_path,
+                                    self.lemmatizer_output, cpu)
+            lemmas = list(model_api.read_results(self.lemmatizer_output))
+            stage['tokens'] = len(lemmas)
 
         # Merge lemmata to CoNLL-U+
-        model_api.merge_tags(self.lemmatizer_output,
-                             self.source_file,
-                             None,
-                             'lemma',
-                             None)
+        with self.timer.stage('lemmatizer merge', len(lemmas)):
+            self.merge_lemmatizer_output(lemmas)
 
-        # En modo clásico, escribir archivo _nn.conllu
-        if not self.is_memory_mode:
-            self.source_file.write_file(
-                self.input_file.replace('.conllu', '_nn.conllu'))
 
-        # Initialize postprocessor
-        P = postprocess.Postprocessor(
-            predictions=self.source_file,
-            model_name=model_name)
+    def get_postprocessor(self, model_name, postprocessor=None, data=None):
+        """ Initialize postprocessor or bind a resident one to
+        the current data """
+        if data is None:
+            data = self.source_file
+        if postprocessor is None:
+            return postprocess.Postprocessor(
+                predictions=data,
+                model_name=model_name)
+        postprocessor.predictions = data
+        return postprocessor
+
+    
+    def postprocess(self, P, final=True):
+        """ Apply post-corrections to the neural net output bound
+        to the postprocessor. With final=False the override, number
+        handling and cleanup are left to finalize(). """
+        data = P.predictions
+        words = instrumentation.count_words(data)
+        with self.timer.stage('postprocess: scores', words):
+            P.initialize_scores()
+        with self.timer.stage('postprocess: unambiguous', words):
+            P.fill_unambiguous(threshold=0.6)
+        with self.timer.stage('postprocess: disambiguate', words):
+            P.disambiguate_by_pos_context(threshold=0.6)
+        if final:
+            self.finalize(P)
 
-        P.initialize_scores()
-        P.fill_unambiguous(threshold=0.6)
-        P.disambiguate_by_pos_context(threshold=0.6)
-        P.apply_override()
+
+    def finalize(self, P):
+        """ Apply the override lexicon and number handling to the
+        data bound to the postprocessor and clean up contexts """
+        data = P.predictions
+        words = instrumentation.count_words(data)
+        with self.timer.stage('postprocess: override', words):
+            P.apply_override()
         
         if self.ignore_numbers:
-            self.source_file.unlemmatize(numbers=True)
+            with self.timer.stage('postprocess: numbers', words):
+                data.unlemmatize(numbers=True)
 
         # Temporary field cleanup
-        self.source_file.force_value('xposctx', '_')
-        self.source_file.force_value('formctx', '_')
+        with self.timer.stage('postprocess: cleanup', words):
+            data.force_value('xposctx', '_')
+            data.force_value('formctx', '_')
+
+        
+    def backup(self):
+        """ Backup for write-protected fields """
+        pp_file = self.input_file.replace('.conllu', '_pp.conllu')
+        if os.path.isfile(pp_file):
+            shutil.copy(pp_file, self.backup_file)
+            return True
+        return False
+    
+
+    def run_model(self, model_name, cpu, postprocessor=None):
+        """
+        Ejecuta el modelo de lemmatización y escribe el informe de
+        tiempos por etapa (_report.json) junto a la salida.
+        
+        :param model_name: nombre del modelo
+        :param cpu: bool - usar CPU en lugar de GPU
+        :param postprocessor: postprocess.Postprocessor (opcional) -
+                              resident postprocessor whose lexicons are
+                              reused instead of being rebuilt
+        :return: conlluplus.ConlluPlus - objeto procesado (siempre)
+                 None in streaming mode
+        """
+        with self.timer.profiling():
+            result = self._run_model(model_name, cpu, postprocessor)
+        self.write_report()
+        return result
+
+
+    def write_report(self):
+        report_file = self.report_file()
+        if report_file is not None:
+            self.timer.summary()
+            self.timer.write(report_file)
+
+
+    def report_file(self):
+        """ Timing report next to the output; None in memory mode
+        without an output file (see self.timer.report()) """
+        if not self.is_memory_mode:
+            return self.input_file.replace('.conllu', '_report.json')
+        if self.output_file:
+            return os.path.splitext(self.output_file)[0] + '_report.json'
+        return None
+
+        
+    def _run_model(self, model_name, cpu, postprocessor=None):
+        # Update model override
+        self.update_model(model_name)
+
+        # Model settings, lexicons and translators from the registry
+        session = model_registry.get_registry().get(model_name, cpu)
+        self.config = session.config
+        if postprocessor is None:
+            postprocessor = session.postprocessor
+
+        if self.chunk_size and self.pipelined:
+            return self.run_pipelined(model_name, cpu, postprocessor)
+        elif self.chunk_size:
+            return self.run_streaming(model_name, cpu, postprocessor)
+        elif self.incremental and not self.is_memory_mode:
+            return self.run_incremental(model_name, cpu, postprocessor)
+        elif self.sentence_memo:
+            return self.run_memoized(model_name, cpu, postprocessor)
+        
+        # En modo clásico, recargar desde archivo
+        if not self.is_memory_mode:
+            with self.timer.stage('parse') as stage:
+                self.source_file = conlluplus.ConlluPlus(
+                    self.input_file, validate=False)
+                stage['tokens'] = self.source_file.word_count
+        
+        # Backup for write-protected fields
+        if not self.is_memory_mode:
+            is_backup = self.backup()
+        else:
+            is_backup = False
+            
+        # Initialize postprocessor
+        P = self.get_postprocessor(model_name, postprocessor)
+
+        # Preprocess data and run neural nets; in memory mode
+        # without intermediate files
+        if self.is_memory_mode:
+            self.prepare_source(P=P)
+            words = sum(len(unit) for _, unit in self.source_file.data)
+            io(f'Input size: {words} words in '\
+               f'{len(self.source_file.data)} segments (memory mode)')
+            self.run_neural_nets(model_name, cpu)
+        else:
+            self.preprocess_source(P)
+            self.run_tagger(model_name, cpu)
+            self.run_lemmatizer(model_name, cpu)
+
+        # En modo clásico, escribir archivo _nn.conllu
+        words = instrumentation.count_words(self.source_file)
+        if not self.is_memory_mode:
+            with self.timer.stage('write', words):
+                self.source_file.write_file(
+                    self.input_file.replace('.conllu', '_nn.conllu'))
+
+        self.postprocess(P)
         
         # Escribir archivo _pp.conllu solo si:
         # 1. Modo clásico, O
         # 2. Modo memoria pero se especificó output_file
         if not self.is_memory_mode:
             pp_file = self.input_file.replace('.conllu', '_pp.conllu')
-            self.source_file.write_file(pp_file, add_info=True)
+            with self.timer.stage('write', words):
+                self.source_file.write_file(pp_file, add_info=True)
             
             # Merge backup
             print('> Merging manual corrections')
             
             # Write lemmalists
-            self.source_file.make_lemmalists()
+            with self.timer.stage('lemmalists', words):
+                self.source_file.make_lemmalists()
             
         elif self.output_file:
             # Modo memoria pero usuario quiere archivo de salida
-            self.source_file.write_file(self.output_file, add_info=True)
+            with self.timer.stage('write', words):
+                self.source_file.write_file(self.output_file, add_info=True)
             print(f'> Output saved to {self.output_file}')
 
-        # Limpiar directorio temporal en modo memoria
-        if self.is_memory_mode:
-            try:
-                shutil.rmtree(self.temp_dir)
-            except:
-                pass
-
         # Siempre retornar el objeto procesado
         return self.source_file
 
+
+    async def run_model_async(self, model_name, cpu, postprocessor=None,
+                              executor=None):
+        """ Asynchronous run_model() for asyncio applications. Model
+        loading, translation and post-processing run in `executor`
+        (the default executor of the event loop if None), so the event
+        loop is never blocked. No intermediate files are written and
+        the resident postprocessor is not rebound, thus concurrent
+        requests can share one resident model.
+
+        :param model_name: nombre del modelo
+        :param cpu: bool - usar CPU en lugar de GPU
+        :param postprocessor: postprocess.Postprocessor (opcional)
+        :param executor: concurrent.futures.Executor (opcional)
+        :return: conlluplus.ConlluPlus - objeto procesado
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+
+        def offload(function, *args):
+            return loop.run_in_executor(executor, function, *args)
+
+        if not self.is_memory_mode:
+            await offload(self.update_model, model_name)
+            
+        session = await offload(
+            model_registry.get_registry().get, model_name, cpu)
+        self.config = session.config
+        if postprocessor is None:
+            postprocessor = session.postprocessor
+
+        if not self.is_memory_mode:
+            self.source_file = await offload(
+                conlluplus.ConlluPlus, self.input_file, False)
+            await offload(self.backup)
+        data = self.source_file
+        P = postprocessor.bind(data)
+
+        def tagger_source():
+            self.prepare_source(data, P)
+            return list(self.tagger_source(data))
+        
+        """ run_in_executor() takes no keyword arguments """
+        settings = session.config.inference_settings()
+        src = await offload(tagger_source)
+        tags = await offload(model_api.translate, src,
+                             session.checkpoints['tagger'], cpu, 'Tagger',
+                             True, settings)
+        src = await offload(self.merge_tagger_output, tags, data)
+        lemmas = await offload(model_api.translate, src,
+                               session.checkpoints['lemmatizer'], cpu, 'Lemmatizer',
+                               True, settings)
+        await offload(self.merge_lemmatizer_output, lemmas, data)
+
+        def finish():
+            if not self.is_memory_mode:
+                data.write_file(self.input_file.replace('.conllu', '_nn.conllu'))
+            self.postprocess(P)
+            if not self.is_memory_mode:
+                data.write_file(
+                    self.input_file.replace('.conllu', '_pp.conllu'), add_info=True)
+                data.make_lemmalists()
+            elif self.output_file:
+                data.write_file(self.output_file, add_info=True)
+
+        await offload(finish)
+        return data
+
+
+    def run_ensemble(self, model_names, cpu):
+        """
+        Lemmatize with several models (e.g. the folds of a cross-
+        validation) and vote. Parsing, normalization and contexts are
+        shared, so the models must have the same tokenizer and context
+        settings. The taggers vote the XPOS tags, the lemmatizers get
+        one shared input built from the winning tags and vote the
+        lemmata. The score of a word is the share of the models that
+        voted for its XPOS tag or lemma, whichever is lower, mapped
+        onto the score scale of post-processing: 3.0 if all models
+        agreed, ≤ 2.0 (low confidence, written to the lemmalists)
+        if a third of them or more disagreed; words fixed before
+        inference score 3.0. Of the post-processing steps only the
+        override of the first model is applied; filling in of
+        unambiguous words and disambiguation are skipped.
+
+        :param model_names: nombres de los modelos
+        :param cpu: bool - usar CPU en lugar de GPU
+        :return: conlluplus.ConlluPlus - objeto procesado
+        """
+        with self.timer.profiling():
+            result = self._run_ensemble(model_names, cpu)
+        self.write_report()
+        return result
+
+
+    def _run_ensemble(self, model_names, cpu):
+        self.update_model(*model_names)
+
+        """ Only the first model is kept resident; the translators of
+        the others are loaded by model_api on first use """
+        session = model_registry.get_registry().get(model_names[0], cpu)
+        configs = [ModelConfig.read(model_name) for model_name in model_names]
+        def settings(config):
+            return (config.tokenizer, config.tagger_context,
+                    config.lemmatizer_context)
+        for model_name, config in zip(model_names, configs):
+            if settings(config) != settings(session.config):
+                raise ValueError(
+                    f'{model_name} has different tokenizer or context '\
+                    f'settings than {model_names[0]}, cannot vote')
+        self.config = session.config
+
+        if not self.is_memory_mode:
+            with self.timer.stage('parse') as stage:
+                self.source_file = conlluplus.ConlluPlus(
+                    self.input_file, validate=False)
+                stage['tokens'] = self.source_file.word_count
+            self.backup()
+        data = self.source_file
+        P = session.postprocessor.bind(data)
+
+        self.prepare_source(data, P)
+        words = instrumentation.count_words(data)
+        io(f'Ensemble of {len(model_names)} models: '\
+           f'{", ".join(model_names)}')
+        settings = {model_name: config.inference_settings()
+                    for model_name, config in zip(model_names, configs)}
+
+        def translate_all(src, component, name):
+            """ Run `component` of every model on the same input """
+            def run(model_name):
+                checkpoint = os.path.join(
+                    Paths.models, model_name, component, 'model.pt')
+                return list(model_api.clean_results(
+                    model_api.translate(src, checkpoint, cpu, name,
+                                        settings=settings[model_name])))
+            workers = min(len(model_names), os.cpu_count() or 1)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(run, model_names))
+
+        io('Tagging')
+        src = list(self.tagger_source(data))
+        with self.timer.stage('tagger', len(src) * len(model_names)):
+            tags = translate_all(src, 'tagger', 'Tagger')
+        with self.timer.stage('tagger vote', len(src)):
+            tags, tag_shares = vote(tags)
+        with self.timer.stage('tagger merge', len(tags)):
+            src = self.merge_tagger_output(tags, data)
+
+        io('Lemmatizing')
+        with self.timer.stage('lemmatizer', len(src) * len(model_names)):
+            lemmas = translate_all(src, 'lemmatizer', 'Lemmatizer')
+        with self.timer.stage('lemmatizer vote', len(src)):
+            lemmas, lemma_shares = vote(lemmas)
+        with self.timer.stage('lemmatizer merge', len(lemmas)):
+            self.merge_lemmatizer_output(lemmas, data)
+
+            """ A unanimous vote scores as an in-vocabulary word """
+            shares = (round(3.0 * min(x), 1)
+                      for x in zip(tag_shares, lemma_shares))
+            data.update_value('score', (
+                next(shares) if annotation is None else 3.0
+                for annotation in data.fixed or itertools.repeat(None, words)))
+        
+        if not self.is_memory_mode:
+            with self.timer.stage('write', words):
+                data.write_file(self.input_file.replace('.conllu', '_nn.conllu'))
+
+        with self.timer.stage('postprocess: override', words):
+            P.apply_override()
+        if self.ignore_numbers:
+            with self.timer.stage('postprocess: numbers', words):
+                data.unlemmatize(numbers=True)
+        with self.timer.stage('postprocess: cleanup', words):
+            data.force_value('xposctx', '_')
+            data.force_value('formctx', '_')
+
+        if not self.is_memory_mode:
+            with self.timer.stage('write', words):
+                data.write_file(
+                    self.input_file.replace('.conllu', '_pp.conllu'), add_info=True)
+            with self.timer.stage('lemmalists', words):
+                data.make_lemmalists()
+        elif self.output_file:
+            with self.timer.stage('write', words):
+                data.write_file(self.output_file, add_info=True)
+            print(f'> Output saved to {self.output_file}')
+        return data
+
+        
+    def model_key(self, model_name):
+        """ Identify everything besides the sentence itself that its
+        neural net output depends on: checkpoints, model settings,
+        options and the decoding settings (single-step tagger, int8
+        networks, CTranslate2). The override lexicon is applied after
+        the neural nets and is left out, unless it fixes words before
+        them (dictionary_first). """
+        files = [os.path.join(Paths.models, model_name, component, 'model.pt')
+                 for component in ('tagger', 'lemmatizer')]
+        files.append(os.path.join(
+            Paths.models, model_name, 'tagger', 'classifier.json'))
+        if self.dictionary_first:
+            files.append(os.path.join(
+                Paths.models, model_name, 'override', 'override.conllu'))
+        parts = [prediction_cache.fingerprint(f) if os.path.isfile(f) else '_'
+                 for f in files]
+        config = self.get_config()
+        parts += [config.tokenizer, config.tagger_context,
+                  config.lemmatizer_context, config.tagger_engine,
+                  self.ignore_numbers,
+                  self.dictionary_first, __version__,
+                  Inference.single_step_tagger, Inference.quantized,
+                  Inference.ctranslate2]
+        return '|'.join(str(part) for part in parts)
+
+
+    def hash_sentences(self, data, key):
+        """ Yield a hash for each sentence of unprocessed `data`.
+        Contexts never cross sentence boundaries, so the words of
+        the sentence are all the input its lemmatization gets. """
+        for comments, sentence in data.data:
+            sha = hashlib.sha1(key.encode('utf-8'))
+            for word in sentence:
+                sha.update(('\t'.join(word) + '\n').encode('utf-8'))
+            yield sha.hexdigest()
+
+
+    def read_previous(self):
+        """ Return {hash: nn sentence} from the _nn output of the
+        previous incremental run, or an empty dict if it is missing
+        or does not match """
+        nn_file = self.input_file.replace('.conllu', '_nn.conllu')
+        if not all(os.path.isfile(f) for f in (self.sentence_hashes, nn_file)):
+            return {}
+
+        with open(self.sentence_hashes, 'r', encoding='utf-8') as f:
+            hashes = f.read().splitlines()
+        nn = conlluplus.ConlluPlus(nn_file, validate=False)
+        if len(hashes) != len(nn.data):
+            io('Incremental: previous outputs do not match, '\
+               'lemmatizing everything')
+            return {}
+        return {h: nn_sent for h, (_, nn_sent) in zip(hashes, nn.data)}
+
+    
+    def run_incremental(self, model_name, cpu, postprocessor=None):
+        """ Run the neural nets only on the sentences that are new or
+        have changed since the previous incremental run; the neural
+        net output of unchanged sentences is carried over from the
+        previous _nn file. All sentences are post-processed, so that
+        a changed override lexicon takes effect without running the
+        neural nets again. """
+
+        with self.timer.stage('parse') as stage:
+            source = conlluplus.ConlluPlus(self.input_file, validate=False)
+            stage['tokens'] = source.word_count
+        with self.timer.stage('incremental: compare', source.word_count):
+            hashes = list(self.hash_sentences(source, self.model_key(model_name)))
+            previous = self.read_previous()
+        self.backup()
+
+        changed = conlluplus.ConlluPlus(None, validate=False)
+        changed.filename = self.input_file
+        for h, (comments, sentence) in zip(hashes, source.data):
+            if h not in previous:
+                changed.data.append((comments, sentence))
+        changed.word_count = sum(len(s) for _, s in changed.data)
+        io(f'Incremental: {len(changed.data)} of {len(source.data)} '\
+           'sentences are new or changed')
+
+        P = self.get_postprocessor(model_name, postprocessor, changed)
+        if changed.data:
+            self.source_file = changed
+            self.preprocess_source(P)
+            self.run_tagger(model_name, cpu)
+            self.run_lemmatizer(model_name, cpu)
+
+        """ Repeated sentences share one previous sentence; each
+        occurrence gets its own copy, as post-processing modifies
+        the sentences in place """
+        nn_output = conlluplus.ConlluPlus(None, validate=False)
+        processed = iter(changed.data)
+        for h, (comments, sentence) in zip(hashes, source.data):
+            if h in previous:
+                nn_sent = copy.deepcopy(previous[h])
+            else:
+                _, nn_sent = next(processed)
+            nn_output.data.append((comments, nn_sent))
+        nn_output.word_count = source.word_count
+
+        with self.timer.stage('write', source.word_count):
+            nn_output.write_file(self.input_file.replace('.conllu', '_nn.conllu'))
+            with open(self.sentence_hashes, 'w', encoding='utf-8') as f:
+                for h in hashes:
+                    f.write(h + '\n')
+
+        """ The post-processor modifies the sentences in place """
+        pp_output = copy.deepcopy(nn_output)
+        pp_output.filename = self.input_file
+        self.postprocess(P.bind(pp_output))
+
+        with self.timer.stage('write', source.word_count):
+            pp_output.write_file(
+                self.input_file.replace('.conllu', '_pp.conllu'), add_info=True)
+        with self.timer.stage('lemmalists', source.word_count):
+            pp_output.make_lemmalists()
+
+        self.source_file = pp_output
+        return pp_output
+
+    
+    def get_memo(self, model_name, postprocessor=None, warm=True):
+        """ Return the sentence memo of the model for the current
+        options; warm it from the training data if it has not been
+        warmed since it was last cleared """
+        memo = sentence_memo.get_memo(
+            os.path.join(Paths.models, model_name),
+            self.model_key(model_name), Inference.memo_size)
+        if warm and Inference.memo_warm and not memo.warmed:
+            self.warm_memo(model_name, memo, postprocessor)
+        return memo
+
+
+    def warm_memo(self, model_name, memo=None, postprocessor=None):
+        """ Memoize the gold annotations of conllu/train.conllu with
+        the scores of post-processing. A sentence annotated in several
+        ways gets its most frequent annotation. """
+        if self.config is None:
+            self.config = ModelConfig.read(model_name)
+        if memo is None:
+            memo = self.get_memo(model_name, warm=False)
+        train_file = os.path.join(
+            Paths.models, model_name, 'conllu', 'train.conllu')
+        if not os.path.isfile(train_file):
+            io(f'Sentence memo: {train_file} not found, not warming')
+            memo.set_warmed(0)
+            return memo
+
+        with self.timer.stage('memo: warm') as stage:
+            data = conlluplus.ConlluPlus(train_file, validate=False)
+            data.normalize()
+            misc = [[word[conlluplus.MISC] for word in sentence]
+                    for _, sentence in data.data]
+            if postprocessor is None:
+                P = postprocess.Postprocessor(
+                    predictions=data, model_name=model_name)
+            else:
+                P = postprocessor.bind(data)
+            P.initialize_scores()
+
+            annotations = defaultdict(Counter)
+            for (_, sentence), before in zip(data.data, misc):
+                if sentence:
+                    value = sentence_memo.annotation(sentence, before)
+                    annotations[sentence_memo.sentence_key(sentence)][
+                        json.dumps(value, ensure_ascii=False)] += 1
+            keys = list(annotations)
+            memo.store(keys, [json.loads(annotations[key].most_common(1)[0][0])
+                              for key in keys])
+            memo.set_warmed(len(keys))
+            stage['tokens'] = instrumentation.count_words(data)
+
+        io(f'Sentence memo: warmed with {len(keys)} sentences from {train_file}')
+        return memo
+
+
+    def run_memoized(self, model_name, cpu, postprocessor=None):
+        """ Lemmatize with the sentence memo. Sentences found in the
+        memo skip the neural nets and post-processing; of the others
+        each distinct sentence is lemmatized once and memoized. The
+        memo holds annotations before the override lexicon and number
+        handling, which are applied to all sentences after the lookup,
+        so that the memo stays valid when the override changes. In the
+        _nn file memoized sentences have their memoized annotation. """
+
+        if not self.is_memory_mode:
+            with self.timer.stage('parse') as stage:
+                source = conlluplus.ConlluPlus(self.input_file, validate=False)
+                stage['tokens'] = source.word_count
+            self.backup()
+        else:
+            source = self.source_file
+        words = instrumentation.count_words(source)
+        memo = self.get_memo(model_name, postprocessor)
+
+        with self.timer.stage('memo: lookup', words):
+            source.normalize()
+            keys = [sentence_memo.sentence_key(sentence) if sentence else None
+                    for _, sentence in source.data]
+            hits = memo.lookup([key for key in keys if key is not None])
+
+        """ Sentences to lemmatize: the first occurrence of each
+        sentence not in the memo """
+        pending = conlluplus.ConlluPlus(None, validate=False)
+        pending.filename = self.input_file
+        first, positions = {}, []
+        for key, (comments, sentence) in zip(keys, source.data):
+            if key in hits or key in first:
+                positions.append(None)
+                continue
+            if key is not None:
+                first[key] = len(pending.data)
+            positions.append(len(pending.data))
+            pending.data.append((comments, sentence))
+        pending.word_count = instrumentation.count_words(pending)
+        memoized = sum(1 for key in keys if key in hits)
+        io(f'Sentence memo: {memoized} of {len(keys)} sentences memoized, '\
+           f'{len(pending.data)} to lemmatize')
+
+        """ Neural net output is copied before post-processing, as
+        the post-processor modifies the sentences in place """
+        nn_data = []
+        P = self.get_postprocessor(model_name, postprocessor, pending)
+        if pending.data:
+            misc = [[word[conlluplus.MISC] for word in sentence]
+                    for _, sentence in pending.data]
+            self.source_file = pending
+            if self.is_memory_mode:
+                self.prepare_source(P=P)
+                self.run_neural_nets(model_name, cpu)
+            else:
+                self.preprocess_source(P)
+                self.run_tagger(model_name, cpu)
+                self.run_lemmatizer(model_name, cpu)
+                nn_data = copy.deepcopy(pending.data)
+            self.postprocess(P, final=False)
+
+            with self.timer.stage('memo: store', pending.word_count):
+                hits.update(
+                    (key, sentence_memo.annotation(pending.data[i][1], misc[i]))
+                    for key, i in first.items())
+                memo.store(list(first), [hits[key] for key in first])
+
+        """ Put the sentences back in order; repeated sentences get
+        the annotation of their first occurrence """
+        pp_data, nn_output = [], conlluplus.ConlluPlus(None, validate=False)
+        for key, position, (comments, sentence) in zip(
+                keys, positions, source.data):
+            if position is not None:
+                pp_sent = pending.data[position][1]
+                nn_sent = nn_data[position][1] if nn_data else None
+            else:
+                if nn_data:
+                    nn_sent = copy.deepcopy(sentence)
+                    if key in first:
+                        for word, nn_word in zip(nn_sent, nn_data[first[key]][1]):
+                            word[conlluplus.LEMMA] = nn_word[conlluplus.LEMMA]
+                            word[conlluplus.XPOS] = nn_word[conlluplus.XPOS]
+                            word[conlluplus.FORMCTX:conlluplus.SCORE+1] =\
+                                nn_word[conlluplus.FORMCTX:conlluplus.SCORE+1]
+                    else:
+                        sentence_memo.apply(nn_sent, hits[key])
+                pp_sent = sentence_memo.apply(sentence, hits[key])
+            pp_data.append((comments, pp_sent))
+            if nn_data:
+                nn_output.data.append((comments, nn_sent))
+        if not self.is_memory_mode and not nn_data:
+            nn_output.data = copy.deepcopy(pp_data)
+        source.data = pp_data
+        source.fixed = None
+        self.source_file = source
+        self.finalize(P.bind(source))
+
+        if not self.is_memory_mode:
+            with self.timer.stage('write', words):
+                nn_output.write_file(
+                    self.input_file.replace('.conllu', '_nn.conllu'))
+                source.write_file(
+                    self.input_file.replace('.conllu', '_pp.conllu'), add_info=True)
+            with self.timer.stage('lemmalists', words):
+                source.make_lemmalists()
+        elif self.output_file:
+            with self.timer.stage('write', words):
+                source.write_file(self.output_file, add_info=True)
+            print(f'> Output saved to {self.output_file}')
+        return source
+
+
+    def run_streaming(self, model_name, cpu, postprocessor=None):
+        """ Lemmatize the input file in sentence-aligned chunks of
+        about `chunk_size` words. Finished chunks are appended to
+        the _nn and _pp files, so memory use is bounded by the chunk
+        size instead of the corpus size. Contexts never cross
+        sentence boundaries and thus are not affected by chunking. """
+
+        nn_file = self.input_file.replace('.conllu', '_nn.conllu')
+        pp_file = self.input_file.replace('.conllu', '_pp.conllu')
+        self.backup()
+
+        lemmadict = defaultdict(conlluplus.LemmaDict)
+        P = postprocessor
         
+        chunks = conlluplus.read_chunks(self.input_file, self.chunk_size)
+        for e, chunk in enumerate(chunks):
+            io(f'Processing chunk {e+1} ({chunk.word_count} words)')
+            self.source_file = chunk
+            P = self.get_postprocessor(model_name, P)
+            self.preprocess_source(P)
+            self.run_tagger(model_name, cpu)
+            self.run_lemmatizer(model_name, cpu)
+            with self.timer.stage('write', chunk.word_count):
+                self.source_file.write_file(nn_file, append=e > 0)
+            self.postprocess(P)
+            with self.timer.stage('write', chunk.word_count):
+                self.source_file.write_file(pp_file, add_info=e == 0, append=e > 0)
+            with self.timer.stage('lemmalists', chunk.word_count):
+                self.source_file.collect_lemmalists(lemmadict)
+
+        self.source_file = None
+            
+        # Write lemmalists
+        with self.timer.stage('lemmalists'):
+            for score, ldict in lemmadict.items():
+                ldict.write_file(score, self.input_file)
+
+
+    def run_pipelined(self, model_name, cpu, postprocessor=None):
+        """ Streaming lemmatization where the stages work on
+        different chunks at the same time: the tagger works on chunk
+        k+1 while chunk k is lemmatized and chunk k-1 postprocessed.
+        Contexts never cross sentence boundaries, so every chunk can
+        be processed independently. The stages pass neural net
+        inputs and outputs in memory instead of the steps/ files. """
+
+        nn_file = self.input_file.replace('.conllu', '_nn.conllu')
+        pp_file = self.input_file.replace('.conllu', '_pp.conllu')
+        self.backup()
+        
+        tagger_path = os.path.join(
+                Paths.models, model_name, 'tagger', 'model.pt')
+        lemmatizer_path = os.path.join(
+                Paths.models, model_name, 'lemmatizer', 'model.pt')
+
+        """ The lexicons are shared by the stages and loaded before
+        the stages are started """
+        lexicon = self.get_postprocessor(model_name, postprocessor)
+        if self.dictionary_first:
+            lexicon.get_form_dictionary()
+        
+        settings = self.get_config().inference_settings()
+        
+        def tag(chunk):
+            self.prepare_source(chunk, lexicon)
+            src = list(self.tagger_source(chunk))
+            with self.timer.stage('tagger', len(src)):
+                return chunk, model_api.translate(
+                    src, tagger_path, cpu, 'Tagger', settings=settings)
+
+        def merge(item):
+            chunk, tags = item
+            with self.timer.stage('tagger merge', len(tags)):
+                return chunk, self.merge_tagger_output(tags, chunk)
+
+        def lemmatize(item):
+            chunk, src = item
+            with self.timer.stage('lemmatizer', len(src)):
+                lemmas = model_api.translate(
+                    src, lemmatizer_path, cpu, 'Lemmatizer', settings=settings)
+            with self.timer.stage('lemmatizer merge', len(lemmas)):
+                self.merge_lemmatizer_output(lemmas, chunk)
+            return chunk
+
+        chunks = conlluplus.read_chunks(self.input_file, self.chunk_size)
+        stages = Stages(tag, merge, lemmatize)
+
+        lemmadict = defaultdict(conlluplus.LemmaDict)
+        P = lexicon
+        for e, chunk in enumerate(stages.run(chunks)):
+            io(f'Postprocessing chunk {e+1} ({chunk.word_count} words)')
+            with self.timer.stage('write', chunk.word_count):
+                chunk.write_file(nn_file, append=e > 0)
+            P = self.get_postprocessor(model_name, P, chunk)
+            self.postprocess(P)
+            with self.timer.stage('write', chunk.word_count):
+                chunk.write_file(pp_file, add_info=e == 0, append=e > 0)
+            with self.timer.stage('lemmalists', chunk.word_count):
+                chunk.collect_lemmalists(lemmadict)
+
+        # Write lemmalists
+        with self.timer.stage('lemmalists'):
+            for score, ldict in lemmadict.items():
+                ldict.write_file(score, self.input_file)
+
+            
     def override_cycle(self):
         """ Lemmatization cycle """
         filename, ext = os.path.splitext(self.filename)
 
 
+def warm_memo(model_name, ignore_numbers=True, dictionary_first=False):
+    """ Warm the sentence memo of a model from its training data
+    for the given options """
+    lemmatizer = Lemmatizer(
+        conlluplus.ConlluPlus(None, validate=False),
+        ignore_numbers=ignore_numbers,
+        dictionary_first=dictionary_first,
+        sentence_memo=True)
+    return lemmatizer.warm_memo(model_name)
+
+
+def is_source_file(filename):
+    """ Exclude BabyLemmatizer output files from input file lists """
+    name = os.path.basename(filename)
+    return name.endswith('.conllu')\
+        and not name.endswith(('_nn.conllu', '_pp.conllu'))\
+        and not name.startswith('backup_')
+
+
+def expand_inputs(filename):
+    """ Resolve --filename into a list of CoNLL-U files. The
+    argument can be a file, a directory, a glob pattern or a
+    manifest file that lists one CoNLL-U file per line
+
+    :param filename        file, directory, glob or manifest
+    :type filename         str """
+
+    if os.path.isdir(filename):
+        return sorted(os.path.join(filename, f) for f in os.listdir(filename)
+                      if is_source_file(f))
+    if any(c in filename for c in '*?['):
+        return sorted(f for f in glob.glob(filename) if is_source_file(f))
+    if os.path.isfile(filename) and not filename.endswith('.conllu'):
+        path = os.path.dirname(filename)
+        with open(filename, 'r', encoding='utf-8') as f:
+            return [os.path.join(path, line.strip()) for line in f
+                    if line.strip() and not line.startswith('#')]
+    return [filename]
+
+
+def lemmatize_files(filenames, model_name, cpu, ignore_numbers=True,
+                    group_size=100000, dictionary_first=False, profile=False):
+    """ Lemmatize many files with one model session. Model settings,
+    translators and post-processor lexicons are loaded only once and
+    the neural net inputs of several files are translated together.
+    Each file still gets its own _nn/_pp outputs and lemmalists.
+
+    :param filenames       CoNLL-U files
+    :param model_name      model name
+    :param cpu             use CPU instead of GPU
+    :param ignore_numbers  remove lemmatization of numbers
+    :param group_size      number of words translated together
+    :param dictionary_first  bypass the neural nets for words that
+                             are fully determined by the lexicons
+    :param profile         collect cProfile statistics; stage times
+                           of all files are written to
+                           lemmatize_report.json in the directory
+                           of the first file
+
+    :type filenames        [str, ...]
+    :type model_name       str
+    :type cpu              bool
+    :type ignore_numbers   bool
+    :type group_size       int
+    :type dictionary_first   bool
+    :type profile          bool """
+
+    io(f'Lemmatizing {len(filenames)} files with {model_name}')
+    timer = instrumentation.StageTimer(profile)
+    with timer.profiling():
+        _lemmatize_files(filenames, model_name, cpu, ignore_numbers,
+                         group_size, dictionary_first, timer)
+    
+    timer.summary()
+    timer.write(os.path.join(
+        os.path.dirname(filenames[0]), 'lemmatize_report.json'))
+
+
+def _lemmatize_files(filenames, model_name, cpu, ignore_numbers,
+                     group_size, dictionary_first, timer):
+
+    """ Update override from corrections in all input directories
+    before the post-processor lexicons are loaded """
+    for path in sorted(set(os.path.dirname(f) or '.' for f in filenames)):
+        update_override(path, model_name)
+
+    session = model_registry.get_registry().get(model_name, cpu)
+    tagger_path = session.checkpoints['tagger']
+    lemmatizer_path = session.checkpoints['lemmatizer']
+    settings = session.config.inference_settings()
+    
+    def process(group):
+        """ Translate the inputs of the group at once and split
+        the results back to the files """
+        sources = [list(l.tagger_source(l.source_file)) for l in group]
+        src = [x for src in sources for x in src]
+        with timer.stage('tagger', len(src)):
+            tags = model_api.translate(
+                src, tagger_path, cpu, 'Tagger', settings=settings)
+        start, lem_sources = 0, []
+        with timer.stage('tagger merge', len(tags)):
+            for lemmatizer, src in zip(group, sources):
+                lem_sources.append(lemmatizer.merge_tagger_output(
+                    tags[start:start+len(src)]))
+                start += len(src)
+
+        src = [x for src in lem_sources for x in src]
+        with timer.stage('lemmatizer', len(src)):
+            lemmas = model_api.translate(
+                src, lemmatizer_path, cpu, 'Lemmatizer', settings=settings)
+        start = 0
+        with timer.stage('lemmatizer merge', len(lemmas)):
+            for lemmatizer, src in zip(group, lem_sources):
+                lemmatizer.merge_lemmatizer_output(lemmas[start:start+len(src)])
+                start += len(src)
+
+        for lemmatizer in group:
+            data = lemmatizer.source_file
+            with timer.stage('write', data.word_count):
+                data.write_file(lemmatizer.input_file.replace('.conllu', '_nn.conllu'))
+            lemmatizer.postprocess(lemmatizer.get_postprocessor(model_name, P))
+            with timer.stage('write', data.word_count):
+                data.write_file(
+                    lemmatizer.input_file.replace('.conllu', '_pp.conllu'), add_info=True)
+            with timer.stage('lemmalists', data.word_count):
+                data.make_lemmalists()
+    
+    P = session.postprocessor
+    
+    group, words = [], 0
+    for filename in filenames:
+        with timer.stage('parse') as stage:
+            lemmatizer = Lemmatizer(filename, ignore_numbers=ignore_numbers,
+                                    dictionary_first=dictionary_first)
+            stage['tokens'] = lemmatizer.source_file.word_count
+        lemmatizer.timer = timer
+        lemmatizer.config = session.config
+        lemmatizer.backup()
+        lemmatizer.prepare_source(P=P)
+        group.append(lemmatizer)
+        words += lemmatizer.source_file.word_count
+        if words >= group_size:
+            process(group)
+            group, words = [], 0
+            
+    if group:
+        process(group)
+
+
 if __name__ == "__main__":
     """ Demo for lemmatization """
     pass
\ No newline at end of file
@@ -0,0 +1,275 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import asyncio
+import socketserver
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import model_registry
+import txt2conllu
+from lemmatizer_pipeline import Lemmatizer
+from preferences import Paths
+
+""" ===========================================================
+Lemmatization server for BabyLemmatizer 2
+
+Keeps the tagger, the lemmatizer, the post-processor lexicons
+and the override dictionary of the served models resident (see
+model_registry) and answers requests over a localhost HTTP port
+or a Unix socket.
+
+A request is a batch of lines in unit-per-line format: each
+line of transliteration is one unit, whose words are separated
+by spaces, and lines starting with # are comments of the next
+unit (as in txt2conllu.upl_to_conllu). The reply is CoNLL-U+.
+
+   HTTP:   curl --data-binary @text.txt http://127.0.0.1:8000/
+           curl --data-binary @text.txt http://127.0.0.1:8000/<model>
+           curl http://127.0.0.1:8000/stats
+   Socket: send the lines, shut down writing and read the reply
+
+serve_async() answers the same HTTP requests from an asyncio
+event loop, and lemmatize_async() can be awaited directly by
+asyncio applications.
+
+=========================================================== """
+
+def io(message):
+    print(f'> {message}')
+
+
+def request_to_conllu(lines):
+    """ Convert the unit-per-line lines of a request into CoNLL-U+.
+    txt2conllu.txt_lines_to_conllu() joins consecutive lines into
+    one unit, so each line of transliteration is followed by a
+    blank line.
+
+    :param lines                 text lines
+    :type lines                  [str, ...] """
+
+    units = []
+    for line in lines:
+        units.append(line)
+        if line.strip() and not line.strip().startswith('#'):
+            units.append('')
+    return txt2conllu.txt_lines_to_conllu(units)
+
+
+class LemmatizationServer:
+
+    """ Resident model session for serving lemmatization requests.
+    Other models in Paths.models can be requested by name; they are
+    loaded on first use and kept in the model registry.
+
+    :param model_name            default model name in Paths.models
+    :param cpu                   use CPU instead of GPU
+    :param ignore_numbers        remove lemmatization of numbers
+    :param dictionary_first      bypass the neural nets for words
+                                 fully determined by the lexicons
+
+    :type model_name             str
+    :type cpu                    bool
+    :type ignore_numbers         bool
+    :type dictionary_first       bool """
+
+    def __init__(self, model_name, cpu=False, ignore_numbers=True,
+                 dictionary_first=False):
+        self.model_name = model_name
+        self.cpu = cpu
+        self.ignore_numbers = ignore_numbers
+        self.dictionary_first = dictionary_first
+
+        """ Requests to the same model are served one at a time, as
+        they share its post-processor; different models are served
+        concurrently """
+        self.locks = {}
+        self.lock = threading.Lock()
+
+        self.registry = model_registry.get_registry()
+        self.load(model_name)
+
+
+    def load(self, model_name):
+        """ Make `model_name` resident """
+        if model_name.startswith('.') or os.path.basename(model_name) != model_name\
+           or not os.path.isdir(os.path.join(Paths.models, model_name)):
+            raise ValueError(f'unknown model "{model_name}"')
+        session = self.registry.get(model_name, self.cpu)
+        if self.dictionary_first:
+            session.postprocessor.get_form_dictionary()
+        return session
+
+
+    def lemmatize(self, lines, model_name=None):
+        """ Lemmatize a batch of unit-per-line text and return
+        the result as a CoNLL-U+ string
+
+        :param lines             text lines
+        :param model_name        model name, default model if None
+
+        :type lines              [str, ...]
+        :type model_name         str """
+
+        model_name = model_name or self.model_name
+        with self.lock:
+            lock = self.locks.setdefault(model_name, threading.Lock())
+            
+        with lock:
+            session = self.load(model_name)
+            conllu = request_to_conllu(lines)
+            lemmatizer = Lemmatizer(
+                conllu, ignore_numbers=self.ignore_numbers,
+                dictionary_first=self.dictionary_first)
+            result = lemmatizer.run_model(
+                model_name, self.cpu,
+                postprocessor=session.postprocessor)
+            return result.to_string(add_info=True)
+
+
+    async def lemmatize_async(self, lines, model_name=None, executor=None):
+        """ Lemmatize without blocking the event loop. Requests to
+        the same model run concurrently; see
+        Lemmatizer.run_model_async
+
+        :param lines             text lines
+        :param model_name        model name, default model if None
+        :param executor          executor for the blocking work
+
+        :type lines              [str, ...]
+        :type model_name         str
+        :type executor           concurrent.futures.Executor """
+
+        loop = asyncio.get_running_loop()
+        model_name = model_name or self.model_name
+        session = await loop.run_in_executor(executor, self.load, model_name)
+        conllu = await loop.run_in_executor(
+            executor, request_to_conllu, lines)
+        lemmatizer = Lemmatizer(
+            conllu, ignore_numbers=self.ignore_numbers,
+            dictionary_first=self.dictionary_first)
+        result = await lemmatizer.run_model_async(
+            model_name, self.cpu, session.postprocessor, executor)
+        return result.to_string(add_info=True)
+
+
+    def serve_async(self, port=8000, host='127.0.0.1', workers=4):
+        """ Serve requests over HTTP from an asyncio event loop;
+        blocking work runs in a pool of `workers` threads """
+        asyncio.run(self._serve_async(port, host, workers))
+
+
+    async def _serve_async(self, port, host, workers):
+        executor = ThreadPoolExecutor(max_workers=workers)
+        
+        async def reply(writer, status, body, content_type='text/plain'):
+            body = body.encode('utf-8')
+            writer.write(
+                (f'HTTP/1.1 {status}\r\n'
+                 f'Content-Type: {content_type}; charset=utf-8\r\n'
+                 f'Content-Length: {len(body)}\r\n'
+                 'Connection: close\r\n\r\n').encode('latin-1') + body)
+            await writer.drain()
+            writer.close()
+
+        async def handle(reader, writer):
+            try:
+                method, path, _ = (await reader.readline())\
+                    .decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(
+                    int(headers.get('content-length', 0)))
+            except (ValueError, asyncio.IncompleteReadError):
+                await reply(writer, '400 Bad Request', '# error: bad request\n')
+                return
+
+            if method == 'GET' and path.strip('/') == 'stats':
+                await reply(writer, '200 OK', json.dumps(self.registry.stats()),
+                            'application/json')
+            elif method == 'POST':
+                lines = body.decode('utf-8').splitlines()
+                try:
+                    result = await self.lemmatize_async(
+                        lines, path.strip('/') or None, executor)
+                    await reply(writer, '200 OK', result)
+                except Exception as e:
+                    await reply(writer, '500 Internal Server Error',
+                                f'# error: {e}\n')
+            else:
+                await reply(writer, '404 Not Found', '# error: not found\n')
+
+        server = await asyncio.start_server(handle, host, port)
+        io(f'Serving {self.model_name} at http://{host}:{port}/ (asyncio)')
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            executor.shutdown(wait=False)
+
+            
+    def serve_http(self, port=8000, host='127.0.0.1'):
+        """ Serve requests over HTTP POST """
+        session = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def reply(self, status, body, content_type='text/plain'):
+                body = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.strip('/') == 'stats':
+                    self.reply(200, json.dumps(session.registry.stats()),
+                               'application/json')
+                else:
+                    self.reply(404, '# error: not found\n')
+                
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                lines = self.rfile.read(length).decode('utf-8').splitlines()
+                model_name = self.path.strip('/') or None
+                try:
+                    self.reply(200, session.lemmatize(lines, model_name))
+                except Exception as e:
+                    self.reply(500, f'# error: {e}\n')
+
+        with ThreadingHTTPServer((host, port), Handler) as server:
+            io(f'Serving {self.model_name} at http://{host}:{port}/')
+            server.serve_forever()
+
+
+    def serve_socket(self, path):
+        """ Serve requests over a Unix socket. The client sends
+        the lines and shuts down writing to mark the end of the
+        request """
+        session = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                lines = self.rfile.read().decode('utf-8').splitlines()
+                try:
+                    reply = session.lemmatize(lines)
+                except Exception as e:
+                    reply = f'# error: {e}\n'
+                self.wfile.write(reply.encode('utf-8'))
+
+        if os.path.exists(path):
+            os.remove(path)
+
+        with socketserver.ThreadingUnixStreamServer(path, Handler) as server:
+            io(f'Serving {self.model_name} at {path}')
+            try:
+                server.serve_forever()
+            finally:
+                os.remove(path)
@@ -1,7 +1,14 @@
 import os
 import sys
+import contextlib
+import shutil
+import tempfile
 import subprocess
-from preferences import Context
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from preferences import Inference, ModelConfig
+import prediction_cache
+import classifier_tagger
 import preprocessing as PP
 
 """ ===========================================================
@@ -20,14 +27,413 @@ University of Helsinki
 =========================================================== """
 
 
-def run_tagger(input_file, model_name, output_file, cpu=False):
+class Translator:
+
+    """ Resident in-process OpenNMT translator. The checkpoint is
+    loaded once and kept in memory, so that repeated calls do not
+    pay for re-importing torch/onmt and reloading `model.pt`.
+
+    :param model_name            path to the model checkpoint
+    :param cpu                   use CPU instead of GPU
+    :param quantized             path to the int8 copy of the
+                                 checkpoint to use instead (CPU only)
+
+    :type model_name             path/file as str
+    :type cpu                    bool
+    :type quantized              path/file as str or None """
+
+    def __init__(self, model_name, cpu=False, quantized=None):
+        from onmt.translate.translator import build_translator
+        from onmt.transforms import get_transforms_cls
+
+        self.model_name = model_name
+        self.cpu = cpu
+        self.quantized = quantized
+        self.single_step_failed = False
+
+        opt = translate_opts(model_name, cpu)
+        self.opt = opt
+        self.lock = threading.Lock()
+        self.batch_size = opt.batch_size
+        self.batch_type = opt.batch_type
+        self.out_file = open(os.devnull, 'w', encoding='utf-8')
+        self.translator = build_translator(
+            opt, report_score=False, out_file=self.out_file)
+        self.transforms_cls = get_transforms_cls(opt._all_transform)
+
+        """ The vocabularies and options come from the original
+        checkpoint, the network from the quantized one """
+        if quantized is not None:
+            self.translator.model = load_quantized(quantized)
+
+        
+    def translate(self, lines, batch_tokens=None):
+        """ Translate source lines and return the best hypothesis
+        for each line in the original order
+
+        :param lines             neural net input lines
+        :param batch_tokens      defaults to Inference.batch_tokens
+
+        :type lines              [str, ...]
+        :type batch_tokens       int """
+        
+        lines = [line.rstrip('\n') for line in lines]
+        if not lines:
+            return []
+
+        """ The translator and its options are shared by the threads
+        of the process, so one call is translated at a time """
+        with self.lock:
+            return self._translate_batches(lines, self._decode, batch_tokens)
+
+
+    def tag(self, lines, k=None, batch_tokens=None):
+        """ Return the `k` most probable tags and their probabilities
+        for each line, see _tag()
+
+        :param lines             tagger input lines
+        :param k                 defaults to Inference.tagger_topk
+        :param batch_tokens      defaults to Inference.batch_tokens
+
+        :type lines              [str, ...]
+        :type k                  int
+        :type batch_tokens       int """
+
+        lines = [line.rstrip('\n') for line in lines]
+        if not lines:
+            return []
+        k = k or Inference.tagger_topk
+        with self.lock:
+            return self._translate_batches(
+                lines, lambda x: self._tag(x, k), batch_tokens)
+
+    
+    def _translate_batches(self, lines, translate, batch_tokens=None):
+        if not Inference.bucketing:
+            self.opt.batch_size = self.batch_size
+            self.opt.batch_type = self.batch_type
+            return translate(lines)
+
+        """ Lines are expected to be sorted by length (see
+        translate_lines), so each batch holds lines of similar
+        length and one batch is translated at a time """
+        predictions = []
+        self.opt.batch_type = 'sents'
+        for batch in make_batches(
+                lines, batch_tokens or Inference.batch_tokens):
+            self.opt.batch_size = len(batch)
+            predictions.extend(translate(batch))
+        return predictions
+
+
+    def _decode(self, lines):
+        """ Single decoder step for the tagger if enabled, otherwise
+        beam search """
+        if single_step(self.model_name) and not self.single_step_failed:
+            try:
+                return [best[0][0] for best in self._tag(lines, 1)]
+            except Exception as e:
+                print(f'> Single-step decoding failed ({e}), '\
+                      'using beam search')
+                self.single_step_failed = True
+        return self._translate(lines)
+
+
+    @contextlib.contextmanager
+    def _infer_iter(self, lines):
+        """ Yield the inference iterator and the transform pipe for
+        `lines`, built as in onmt/bin/translate.py. OpenNMT reads the
+        source from the -src file, so the lines are written to a
+        temporary file for the duration of the call. """
+        from onmt.constants import CorpusTask
+        from onmt.inputters.dynamic_iterator import build_dynamic_dataset_iter
+        from onmt.inputters.inputter import IterOnDevice
+        from onmt.transforms import TransformPipe
+
+        fd, filename = tempfile.mkstemp(prefix='babylem_', suffix='.src')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for line in lines:
+                    f.write(line + '\n')
+            self.opt.src = filename
+            infer_iter = build_dynamic_dataset_iter(
+                self.opt, self.transforms_cls, self.translator.vocabs,
+                task=CorpusTask.INFER, copy=self.translator.copy_attn)
+            transform = TransformPipe.build_from(
+                [infer_iter.transforms[name] for name in self.opt.transforms
+                 if name in infer_iter.transforms])
+            yield IterOnDevice(infer_iter, self.opt.gpu), transform
+        finally:
+            self.opt.src = os.devnull
+            os.remove(filename)
+
+
+    def _translate(self, lines):
+        with self._infer_iter(lines) as (infer_iter, transform):
+            _, predictions = self.translator._translate(
+                infer_iter, transform=transform,
+                attn_debug=False, align_debug=False)
+        return [nbest[0] for nbest in predictions]
+
+
+    def _tag(self, lines, k):
+        """ Run the encoder and only the first decoder step: the
+        tagger target is exactly one token, so the distribution of
+        the generator at that step is all we need. Return the `k`
+        most probable tokens and their probabilities for each line.
+        Padding, BOS and EOS are never predicted; EOS is blocked at
+        the first step by -min_length 1 in beam search too. """
+        import torch
+
+        translator = self.translator
+        specials = [translator._tgt_pad_idx, translator._tgt_bos_idx,
+                    translator._tgt_eos_idx]
+
+        results = [None] * len(lines)
+        with self._infer_iter(lines) as (infer_iter, _), torch.no_grad():
+            for batch in infer_iter:
+                src, enc_final_hs, enc_out, src_len = \
+                    translator._run_encoder(batch)
+                translator.model.decoder.init_state(src, enc_out, enc_final_hs)
+                decoder_in = torch.full(
+                    (len(batch['srclen']), 1, 1), translator._tgt_bos_idx,
+                    dtype=torch.long, device=src.device)
+                log_probs, _ = translator._decode_and_generate(
+                    decoder_in, enc_out, batch, src_len=src_len, step=0)
+                log_probs[:, specials] = -float('inf')
+                probs, indices = log_probs.exp().topk(k, dim=-1)
+
+                """ Examples are sorted by length within a batch;
+                `indices` gives the line number of each of them """
+                for index, p_row, i_row in zip(
+                        batch['indices'].tolist(), probs.tolist(),
+                        indices.tolist()):
+                    results[index] = [
+                        (translator._tgt_vocab.lookup_index(i), round(p, 4))
+                        for i, p in zip(i_row, p_row)]
+        return results
+
+
+class CT2Translator:
+
+    """ Resident CTranslate2 translator for a checkpoint exported
+    with ct2_export.py. Same interface as Translator; CTranslate2
+    sorts each call into batches of similar length itself and is
+    safe to call from several threads.
+
+    :param model_dir             CTranslate2 model directory
+    :param cpu                   use CPU instead of GPU
+
+    :type model_dir              path as str
+    :type cpu                    bool """
+
+    def __init__(self, model_dir, cpu=False):
+        import ctranslate2
+        self.model_name = model_dir
+        self.cpu = cpu
+        self.translator = ctranslate2.Translator(
+            model_dir,
+            device='cpu' if cpu else 'cuda',
+            compute_type=Inference.ct2_compute_type,
+            inter_threads=Inference.ct2_inter_threads,
+            intra_threads=Inference.ct2_intra_threads or Inference.threads or 0)
+        self.tagger = os.path.basename(os.path.dirname(
+            os.path.abspath(model_dir))) == 'tagger'
+
+
+    def _translate_batch(self, lines, **options):
+        lines = [line.rstrip('\n') for line in lines]
+        if not lines:
+            return []
+        return self.translator.translate_batch(
+            [line.split() for line in lines],
+            max_batch_size=Inference.ct2_batch_size,
+            min_decoding_length=1,
+            **options)
+
+
+    def translate(self, lines, batch_tokens=None):
+        """ Translate source lines and return the best hypothesis
+        for each line; the tagger is decoded with one step if
+        Inference.single_step_tagger is set. CTranslate2 batches by
+        Inference.ct2_batch_size, `batch_tokens` is ignored. """
+        if self.tagger and Inference.single_step_tagger:
+            options = {'beam_size': 1, 'max_decoding_length': 1}
+        else:
+            options = {'beam_size': 5}
+        return [' '.join(result.hypotheses[0]) for result
+                in self._translate_batch(lines, **options)]
+
+
+    def tag(self, lines, k=None, batch_tokens=None):
+        """ Return the `k` most probable tags and their probabilities
+        for each line from the first decoder step """
+        import math
+        k = k or Inference.tagger_topk
+        results = self._translate_batch(
+            lines, beam_size=k, num_hypotheses=k, max_decoding_length=1,
+            return_scores=True)
+        return [[(' '.join(tokens), round(math.exp(score), 4))
+                 for tokens, score in zip(result.hypotheses, result.scores)]
+                for result in results]
+
+
+def translate_opts(model_name, cpu=False):
+    """ Return OpenNMT translation options for `model_name` """
+    from onmt import opts
+    from onmt.utils.parse import ArgumentParser
+
+    parser = ArgumentParser(description='translate.py')
+    opts.config_opts(parser)
+    opts.translate_opts(parser, dynamic=True)
+    opt = parser.parse_args(
+        ['-model', model_name,
+         '-src', os.devnull,
+         '-min_length', '1',
+         '-gpu', '-1' if cpu else '0'])
+
+    ArgumentParser.validate_translate_opts(opt)
+    ArgumentParser._get_all_transform_translate(opt)
+    ArgumentParser._validate_transforms_opts(opt)
+    ArgumentParser.validate_translate_opts_dynamic(opt)
+    return opt
+
+
+QUANTIZED_FILE = 'model.int8.pt'
+
+def quantized_checkpoint(model_name):
+    """ Return the int8 copy of `model_name` made by quantize.py,
+    or None if there is none or it is older than the checkpoint """
+    filename = os.path.join(os.path.dirname(model_name), QUANTIZED_FILE)
+    if not os.path.isfile(filename) or not os.path.isfile(model_name):
+        return None
+    if os.path.getmtime(filename) < os.path.getmtime(model_name):
+        return None
+    return filename
+
+
+def use_quantized(model_name, cpu):
+    """ Quantized checkpoint to use for `model_name`, or None """
+    if cpu and Inference.quantized:
+        return quantized_checkpoint(model_name)
+    return None
+
+
+CT2_DIR = 'ctranslate2'
+
+def ct2_checkpoint(model_name):
+    """ Return the CTranslate2 export of `model_name` made by
+    ct2_export.py, or None if there is none or it is older than
+    the checkpoint """
+    model_dir = os.path.join(os.path.dirname(model_name), CT2_DIR)
+    filename = os.path.join(model_dir, 'model.bin')
+    if not os.path.isfile(filename) or not os.path.isfile(model_name):
+        return None
+    if os.path.getmtime(filename) < os.path.getmtime(model_name):
+        return None
+    return model_dir
+
+
+def use_ct2(model_name):
+    """ CTranslate2 export to use for `model_name`, or None """
+    if Inference.ctranslate2:
+        return ct2_checkpoint(model_name)
+    return None
+
+
+def load_quantized(filename):
+    """ Load a quantized network saved by quantize.py """
+    import torch
+    try:
+        model = torch.load(filename, map_location='cpu', weights_only=False)
+    except TypeError:
+        """ torch < 1.13 has no weights_only """
+        model = torch.load(filename, map_location='cpu')
+    model.eval()
+    return model
+
+
+""" Translators that have been loaded in this process """
+_translators = {}
+
+""" Guards loading of translators and worker pools in threads """
+_lock = threading.RLock()
+
+def get_translator(model_name, cpu=False):
+    """ Return a resident translator for `model_name`, loading
+    the checkpoint on first use """
+    exported = use_ct2(model_name)
+    quantized = None if exported else use_quantized(model_name, cpu)
+    key = (os.path.abspath(model_name), cpu, exported or quantized)
+    with _lock:
+        if key not in _translators:
+            print(f'> Loading {exported or quantized or model_name}')
+            if exported:
+                _translators[key] = CT2Translator(exported, cpu)
+            else:
+                _translators[key] = Translator(model_name, cpu, quantized)
+        return _translators[key]
+
+
+def tagger_engine(model_name):
+    """ Return `classifier` if `model_name` is the tagger of a model
+    whose config.yaml selects the classifier tagger, otherwise `onmt` """
+    component_path = os.path.dirname(os.path.abspath(model_name))
+    if os.path.basename(component_path) != 'tagger':
+        return 'onmt'
+    config = os.path.join(os.path.dirname(component_path), 'config.yaml')
+    if not os.path.isfile(config):
+        return 'onmt'
+    return ModelConfig.read_file(config).tagger_engine
+
+
+""" Classifier taggers that have been loaded in this process """
+_classifiers = {}
+
+def get_classifier(model_name):
+    """ Return the classifier tagger that is saved next to the
+    tagger checkpoint `model_name`; reloaded if it has been
+    retrained """
+    filename = os.path.join(
+        os.path.dirname(os.path.abspath(model_name)),
+        classifier_tagger.MODEL_FILE)
+    key = (filename, os.path.getmtime(filename))
+    with _lock:
+        if key not in _classifiers:
+            print(f'> Loading {filename}')
+            _classifiers[key] = classifier_tagger.PerceptronTagger.load(filename)
+        return _classifiers[key]
+
+
+def single_step(model_name):
+    """ True if `model_name` is a tagger that is decoded with a
+    single step, see Inference.single_step_tagger """
+    component = os.path.basename(os.path.dirname(os.path.abspath(model_name)))
+    return Inference.single_step_tagger and component == 'tagger'
+
+
+def release_translator(model_name):
+    """ Drop the resident translators of `model_name` """
+    path = os.path.abspath(model_name)
+    for key in [key for key in _translators if key[0] == path]:
+        del _translators[key]
+    path = os.path.join(os.path.dirname(path), classifier_tagger.MODEL_FILE)
+    for key in [key for key in _classifiers if key[0] == path]:
+        del _classifiers[key]
+
+
+def run_onmt(input_file, model_name, output_file, cpu=False, name='OpenNMT',
+             batch_tokens=None, threads=None):
     """
-    Run OpenNMT tagger using portable Python paths
+    Run OpenNMT translate in a subprocess using portable Python paths
     
     :param input_file: source file path
     :param model_name: model path
     :param output_file: output file path
     :param cpu: use CPU instead of GPU
+    :param name: component name for error messages
+    :param batch_tokens: token-based batch size (OpenNMT default if None)
+    :param threads: CPU threads (torch default if None)
     """
     
     # Construcción portable del comando
@@ -40,72 +446,474 @@ def run_tagger(input_file, model_name, output_file, cpu=False):
         "-min_length", "1"
     ]
     
+    env = None
     if cpu:
         cmd.extend(["-gpu", "-1"])
+        if threads:
+            env = dict(os.environ, OMP_NUM_THREADS=str(threads))
     else:
         cmd.extend(["-gpu", "0"])
+
+    if batch_tokens:
+        cmd.extend(["-batch_type", "tokens", "-batch_size", str(batch_tokens)])
     
     try:
         result = subprocess.run(
             cmd,
             capture_output=True,
             text=True,
-            check=False
+            check=False,
+            env=env
         )
         
         # Solo mostrar errores si falló
         if result.returncode != 0:
-            print(f"Tagger warning/error (code {result.returncode}):")
+            print(f"{name} warning/error (code {result.returncode}):")
             if result.stderr:
                 print(result.stderr[:500])
                 
     except Exception as e:
-        print(f"Error running tagger: {e}")
+        print(f"Error running {name.lower()}: {e}")
         raise
 
 
-def run_lemmatizer(input_file, model_name, output_file, cpu=False):
+def deduplicate(lines):
+    """ Collapse repeated neural net inputs. Returns the distinct
+    lines in order of first appearance and the position of each
+    input line in that list.
+
+    :param lines                 neural net input lines
+    :type lines                  [str, ...] """
+
+    index = {}
+    positions = [index.setdefault(line, len(index)) for line in lines]
+    return list(index), positions
+
+
+def source_length(line):
+    """ Number of tokens in a neural net input line """
+    return line.count(' ') + 1
+
+
+def sort_by_length(lines):
+    """ Return the indices of lines from the shortest line to the
+    longest; the sort is stable """
+    return sorted(range(len(lines)), key=lambda i: source_length(lines[i]))
+
+
+def restore_order(predictions, order):
+    """ Put predictions of length-sorted lines back to the original
+    order of the lines
+
+    :param predictions           predictions in sorted order
+    :param order                 output of sort_by_length()
+
+    :type predictions            [str, ...]
+    :type order                  [int, ...] """
+
+    restored = [None] * len(order)
+    for index, prediction in zip(order, predictions):
+        restored[index] = prediction
+    return restored
+
+
+def make_batches(lines, batch_tokens):
+    """ Split length-sorted lines into consecutive batches whose
+    padded size (longest line x number of lines) does not exceed
+    `batch_tokens`. A line longer than `batch_tokens` gets a batch
+    of its own.
+
+    :param lines                 neural net input lines
+    :param batch_tokens          maximum padded tokens per batch
+
+    :type lines                  [str, ...]
+    :type batch_tokens           int """
+
+    batches, batch, longest = [], [], 0
+    for line in lines:
+        length = source_length(line)
+        if batch and max(longest, length) * (len(batch) + 1) > batch_tokens:
+            batches.append(batch)
+            batch, longest = [], 0
+        batch.append(line)
+        longest = max(longest, length)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def padded_tokens(batches):
+    """ Number of tokens fed to the network including padding """
+    return sum(max(map(source_length, batch)) * len(batch)
+               for batch in batches if batch)
+
+
+def make_shards(lines, n):
+    """ Deal lines into `n` shards of nearly equal size, line i to
+    shard i % n. If the lines are sorted by length, every shard
+    gets an equal share of short and long lines and stays sorted. """
+    return [lines[i::n] for i in range(n)]
+
+
+def merge_shards(shards):
+    """ Put the predictions of make_shards() shards back in order """
+    predictions = [None] * sum(len(shard) for shard in shards)
+    for i, shard in enumerate(shards):
+        predictions[i::len(shards)] = shard
+    return predictions
+
+
+def _init_worker(threads):
+    """ Limit each worker to its share of the cores """
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    set_threads(threads)
+
+
+""" Number of torch threads set in this process """
+_threads = None
+
+def set_threads(threads):
+    """ Set the number of torch threads of this process; None keeps
+    the torch default """
+    global _threads
+    if not threads or threads == _threads:
+        return
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        _threads = threads
+    except ImportError:
+        pass
+
+
+""" Settings that change the predictions of a translator. Workers
+get them with each shard instead of inheriting them, as they may
+change after the pool has been started (and are not inherited at
+all unless the workers are forked). """
+WORKER_SETTINGS = ('bucketing', 'single_step_tagger', 'tagger_topk',
+                   'quantized', 'ctranslate2', 'ct2_compute_type',
+                   'ct2_inter_threads', 'ct2_intra_threads', 'ct2_batch_size')
+
+def worker_settings():
+    """ Current values of WORKER_SETTINGS """
+    return {name: getattr(Inference, name) for name in WORKER_SETTINGS}
+
+
+def _translate_shard(shard, model_name, name, resident, threads, batch_tokens,
+                     settings):
+    for setting, value in settings.items():
+        setattr(Inference, setting, value)
+    return translate_lines(shard, model_name, True, name, resident, jobs=1,
+                           threads=threads, batch_tokens=batch_tokens)
+
+
+""" Worker pools that have been started in this process """
+_pools = {}
+
+def worker_threads(jobs, threads=None):
+    """ Threads of each of `jobs` workers: `threads`, or an equal
+    share of the cores """
+    return threads or max(1, (os.cpu_count() or 1) // jobs)
+
+
+def get_pool(jobs, threads=None):
+    """ Return a process pool of `jobs` workers. Workers are kept
+    alive, so that each of them loads the checkpoints only once;
+    there is a pool for each combination of jobs and threads """
+    threads = worker_threads(jobs, threads)
+    key = (jobs, threads)
+    with _lock:
+        if key not in _pools:
+            print(f'> Starting {jobs} workers with {threads} threads each')
+            _pools[key] = ProcessPoolExecutor(
+                max_workers=jobs,
+                initializer=_init_worker,
+                initargs=(threads,))
+        return _pools[key]
+
+
+def close_pools():
+    """ Shut down the worker pools, e.g. to start workers with
+    fresh translators """
+    with _lock:
+        for pool in _pools.values():
+            pool.shutdown()
+        _pools.clear()
+
+
+def translate_sharded(lines, model_name, jobs, name='OpenNMT', resident=True,
+                      threads=None, batch_tokens=None):
+    """ Translate shards of `lines` in parallel on CPU and put the
+    predictions back together in order
+
+    :param lines                 neural net input lines
+    :param model_name            model checkpoint path
+    :param jobs                  number of worker processes
+    :param name                  component name for messages
+    :param resident              use in-process translator
+    :param threads               threads per worker
+    :param batch_tokens          padded tokens per batch
+
+    :type lines                  [str, ...]
+    :type model_name             path/file as str
+    :type jobs                   int
+    :type name                   str
+    :type resident               bool
+    :type threads                int
+    :type batch_tokens           int """
+
+    threads = worker_threads(jobs, threads)
+    pool = get_pool(jobs, threads)
+    settings = worker_settings()
+    futures = [pool.submit(_translate_shard, shard, model_name, name,
+                           resident, threads, batch_tokens, settings)
+               for shard in make_shards(lines, jobs)]
+    return merge_shards([future.result() for future in futures])
+
+
+def translate_lines(lines, model_name, cpu=False, name='OpenNMT',
+                    resident=True, jobs=None, threads=None, batch_tokens=None):
+    """ Translate source lines with a resident translator. Falls
+    back to a subprocess if OpenNMT cannot be used in-process.
+    On CPU the lines are sharded over `jobs` worker processes.
+    With Inference.bucketing the lines are translated in order of
+    length to reduce padding and returned in the original order.
+
+    :param lines                 neural net input lines
+    :param model_name            model checkpoint path
+    :param cpu                   use CPU instead of GPU
+    :param name                  component name for messages
+    :param resident              use in-process translator
+    :param jobs                  number of CPU worker processes,
+                                 defaults to Inference.jobs
+    :param threads               CPU threads per process,
+                                 defaults to Inference.threads
+    :param batch_tokens          padded tokens per batch,
+                                 defaults to Inference.batch_tokens
+
+    :type lines                  [str, ...]
+    :type model_name             path/file as str
+    :type cpu                    bool
+    :type name                   str
+    :type resident               bool
+    :type jobs                   int
+    :type threads                int
+    :type batch_tokens           int """
+
+    """ The classifier tagger is fast enough without batching
+    or worker processes """
+    if tagger_engine(model_name) == 'classifier':
+        return get_classifier(model_name).translate(lines)
+
+    settings = (jobs or Inference.jobs, threads or Inference.threads,
+                batch_tokens or Inference.batch_tokens)
+    if Inference.bucketing and len(lines) > 1:
+        order = sort_by_length(lines)
+        lines = [lines[i] for i in order]
+        return restore_order(
+            _translate_lines(lines, model_name, cpu, name, resident, *settings),
+            order)
+    return _translate_lines(lines, model_name, cpu, name, resident, *settings)
+
+
+""" Number of calls in this process that fell back to a subprocess
+because OpenNMT could not be used in-process """
+fallbacks = 0
+
+def _translate_lines(lines, model_name, cpu, name, resident, jobs, threads,
+                     batch_tokens):
+    global fallbacks
+    if cpu and jobs > 1 and len(lines) >= jobs:
+        try:
+            return translate_sharded(lines, model_name, jobs, name, resident,
+                                     threads, batch_tokens)
+        except Exception as e:
+            close_pools()
+            print(f'> {name}: sharded translation failed ({e}), '\
+                  'using a single process')
+
+    if resident:
+        try:
+            if cpu:
+                set_threads(threads)
+            return get_translator(model_name, cpu).translate(
+                lines, batch_tokens)
+        except Exception as e:
+            print(f'> {name}: in-process translation failed ({e}), '\
+                  'falling back to subprocess')
+            fallbacks += 1
+
+    temp_dir = tempfile.mkdtemp(prefix='babylem_')
+    try:
+        input_file = os.path.join(temp_dir, 'input.src')
+        output_file = os.path.join(temp_dir, 'output.pred')
+        with open(input_file, 'w', encoding='utf-8') as f:
+            for line in lines:
+                f.write(line + '\n')
+        run_onmt(input_file, model_name, output_file, cpu, name,
+                 batch_tokens if Inference.bucketing else None, threads)
+        with open(output_file, 'r', encoding='utf-8') as f:
+            return f.read().splitlines()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def translate(lines, model_name, cpu=False, name='OpenNMT', resident=True,
+              settings=None):
+    """ Translate neural net input lines. Each distinct source line
+    is translated only once and the result is copied back to every
+    line in order; lines already seen by this checkpoint are taken
+    from the prediction cache.
+
+    :param lines                 neural net input lines
+    :param model_name            model checkpoint path
+    :param cpu                   use CPU instead of GPU
+    :param name                  component name for messages
+    :param resident              use in-process translator
+    :param settings              CPU inference settings of the model,
+                                 see ModelConfig.inference_settings()
+
+    :type lines                  [str, ...]
+    :type model_name             path/file as str
+    :type cpu                    bool
+    :type name                   str
+    :type resident               bool
+    :type settings               dict or None """
+
+    unique, positions = deduplicate(lines)
+    if lines:
+        ratio = round(100 * (1 - len(unique) / len(lines)), 2)
+        print(f'> {name}: {len(lines)} inputs, {len(unique)} unique '\
+              f'({ratio}% deduplicated)')
+
+    """ Send only lines not seen by this checkpoint to the neural net;
+    the classifier tagger is not cached """
+    if Inference.cache and tagger_engine(model_name) == 'onmt':
+        """ CTranslate2, quantized, single-step and beam search
+        predictions may differ from each other """
+        exported = use_ct2(model_name)
+        variant = [name for name, used in
+                   (('ct2', exported),
+                    ('int8', not exported and use_quantized(model_name, cpu)),
+                    ('single-step', single_step(model_name))) if used]
+        cache = prediction_cache.get_cache(
+            model_name, Inference.cache_size, '+'.join(variant) or None)
+        hits = cache.lookup(unique)
+        misses = [line for line in unique if line not in hits]
+        print(f'> {name}: {len(hits)} cached, {len(misses)} to translate')
+    else:
+        cache = None
+        hits = {}
+        misses = unique
+
+    if misses:
+        translations = translate_lines(
+            misses, model_name, cpu, name, resident, **(settings or {}))
+        if cache is not None:
+            cache.store(misses, translations)
+        hits.update(zip(misses, translations))
+    
+    predictions = [hits[line] for line in unique]
+    return [predictions[position] for position in positions]
+
+
+def tag_topk(lines, model_name, cpu=False, k=None, settings=None):
+    """ Return the `k` most probable XPOS tags and their
+    probabilities for each tagger input line using a single
+    decoder step. If the tagger cannot be run in-process, the
+    beam search prediction is returned with probability None.
+
+    :param lines                 tagger input lines
+    :param model_name            tagger checkpoint path
+    :param cpu                   use CPU instead of GPU
+    :param k                     defaults to Inference.tagger_topk
+    :param settings              CPU inference settings of the model
+
+    :type lines                  [str, ...]
+    :type model_name             path/file as str
+    :type cpu                    bool
+    :type k                      int
+    :type settings               dict or None
+
+    [[(tag, probability), ...], ...] """
+
+    unique, positions = deduplicate(lines)
+    order = sort_by_length(unique) if Inference.bucketing\
+        else list(range(len(unique)))
+    settings = settings or {}
+    try:
+        topk = restore_order(get_translator(model_name, cpu).tag(
+            [unique[i] for i in order], k, settings.get('batch_tokens')),
+            order)
+    except Exception as e:
+        print(f'> Tagger: single-step decoding failed ({e}), '\
+              'using beam search')
+        topk = [[(tag, None)] for tag in clean_results(
+            translate(unique, model_name, cpu, 'Tagger', settings=settings))]
+    return [topk[position] for position in positions]
+
+
+def translate_file(input_file, model_name, output_file, cpu=False,
+                   name='OpenNMT', resident=True, settings=None):
+    """ Translate `input_file` and write the results into
+    `output_file`, see translate()
+
+    :param input_file            neural net input file
+    :param model_name            model checkpoint path
+    :param output_file           neural net output file
+    :param cpu                   use CPU instead of GPU
+    :param name                  component name for messages
+    :param resident              use in-process translator
+    :param settings              CPU inference settings of the model
+
+    :type input_file             path/file as str
+    :type model_name             path/file as str
+    :type output_file            path/file as str
+    :type cpu                    bool
+    :type name                   str
+    :type resident               bool
+    :type settings               dict or None """
+
+    with open(input_file, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+
+    predictions = translate(lines, model_name, cpu, name, resident, settings)
+    
+    with open(output_file, 'w', encoding='utf-8') as o_file:
+        for prediction in predictions:
+            o_file.write(prediction + '\n')
+    
+
+def run_tagger(input_file, model_name, output_file, cpu=False, resident=True,
+               settings=None):
     """
-    Run OpenNMT lemmatizer using portable Python paths
+    Run OpenNMT tagger
     
     :param input_file: source file path
     :param model_name: model path
     :param output_file: output file path
     :param cpu: use CPU instead of GPU
+    :param resident: use in-process translator
+    :param settings: CPU inference settings of the model
     """
+    translate_file(input_file, model_name, output_file,
+                   cpu, 'Tagger', resident, settings)
+
+
+def run_lemmatizer(input_file, model_name, output_file, cpu=False, resident=True,
+                   settings=None):
+    """
+    Run OpenNMT lemmatizer
     
-    # Construcción portable del comando
-    cmd = [
-        sys.executable,  # Python actual del sistema
-        "-m", "onmt.bin.translate",
-        "-model", model_name,
-        "-src", input_file,
-        "-output", output_file,
-        "-min_length", "1"
-    ]
-    
-    if cpu:
-        cmd.extend(["-gpu", "-1"])
-    else:
-        cmd.extend(["-gpu", "0"])
-    
-    try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=False
-        )
-        
-        # Solo mostrar errores si falló
-        if result.returncode != 0:
-            print(f"Lemmatizer warning/error (code {result.returncode}):")
-            if result.stderr:
-                print(result.stderr[:500])
-                
-    except Exception as e:
-        print(f"Error running lemmatizer: {e}")
-        raise
+    :param input_file: source file path
+    :param model_name: model path
+    :param output_file: output file path
+    :param cpu: use CPU instead of GPU
+    :param resident: use in-process translator
+    :param settings: CPU inference settings of the model
+    """
+    translate_file(input_file, model_name, output_file,
+                   cpu, 'Lemmatizer', resident, settings)
 
 
 def read_results(filename):
@@ -115,30 +923,75 @@ def read_results(filename):
             yield line.replace(' ', '').rstrip()
 
 
-def merge_tags(neural_net_output, conllu_object, output_file, field, fieldctx):
+def clean_results(predictions):
+    """ Format in-memory OpenNMT output like read_results() """
+    for line in predictions:
+        yield line.replace(' ', '').rstrip()
+
+
+def fill_fixed(predictions, fixed, field):
+    """ Combine predictions of the words that were sent to the
+    neural net with annotations fixed before inference
+
+    :param predictions           neural net output for non-fixed words
+    :param fixed                 fixed annotation dict or None for
+                                 every word, or None if nothing is fixed
+    :param field                 which annotation to take
+
+    :type predictions            iterable of str
+    :type fixed                  [dict or None, ...] or None
+    :type field                  str """
+
+    if fixed is None:
+        return predictions
+    predictions = iter(predictions)
+    return (next(predictions) if annotation is None else annotation[field]
+            for annotation in fixed)
+
+
+def lemmatizer_source(conllu_object, config=None):
+    """ Yield lemmatizer input lines for a tagged CoNLL-U+ object;
+    `config` is the ModelConfig of the model (process-wide settings
+    if None) """
+    setting = config.tokenizer if config is not None else None
+    for form, xposctx in conllu_object.get_contents('form', 'xposctx'):
+        yield PP.make_lem_src(form, xposctx, setting)
+        
+
+def merge_tags(neural_net_output, conllu_object, output_file, field, fieldctx,
+               config=None):
     """ Merge neural net output with the CoNLL-U+ object and generate
     data for the next step in pipeline 
 
     :param neural_net_output     Path/filename to previous step's output
+                                 or the predictions as a list
     :param conllu_object         File for storing the annotations
     :param output_file           Output for next step's input
     :param field                 Which field to populate with the output
     :param fieldctx              Which context field to update
+    :param config                Model settings, process-wide
+                                 settings if None
 
-    :type neural_net_output      path/file as str
+    :type neural_net_output      path/file as str or [str, ...]
     :type conllu_object          ConlluPlus obj
     :type output_file            path/file as str or None
     :type field                  str
-    :type fieldctx               str or None """
+    :type fieldctx               str or None
+    :type config                 ModelConfig or None """
 
     ## TODO: tee tää suoraan tagger/lemmatisaattorikutsun
     ## yhteydessä, etenkin jos tästä tulee modulaarisempi
-    
-    annotations = read_results(neural_net_output)
+
+    if isinstance(neural_net_output, str):
+        annotations = read_results(neural_net_output)
+    else:
+        annotations = clean_results(neural_net_output)
     conllu_object.update_value(field, annotations)
 
-    contexts = {'xpos': Context.lemmatizer_context,
-                'form': Context.tagger_context}
+    if config is None:
+        config = ModelConfig.current()
+    contexts = {'xpos': config.lemmatizer_context,
+                'form': config.tagger_context}
     
     if fieldctx is not None:
         ctx_annotations = conllu_object.get_contexts(field, size=contexts[field])
@@ -146,8 +999,8 @@ def merge_tags(neural_net_output, conllu_object, output_file, field, fieldctx):
 
     if output_file is not None and fieldctx is not None:
         with open(output_file, 'w', encoding='utf-8') as o_file:
-            for form, xposctx in conllu_object.get_contents('form', 'xposctx'):
-                o_file.write(PP.make_lem_src(form, xposctx) + '\n')
+            for line in lemmatizer_source(conllu_object, config):
+                o_file.write(line + '\n')
 
             
 def ___merge_tags(tagged_file, lemma_input, output_file):
@@ -0,0 +1,247 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import threading
+from collections import OrderedDict
+import model_api
+import postprocess
+from preferences import Paths, Inference, ModelConfig
+
+""" ===========================================================
+Model registry for BabyLemmatizer 2
+
+Keeps the resources of several models resident in one process:
+tagger and lemmatizer translators, config.yaml settings, the
+post-processor lexicons and the override dictionary. Models are
+loaded on first use and the least recently used models are
+evicted when there are more than Inference.resident_models of
+them or when their estimated size exceeds
+Inference.memory_budget.
+
+   session = get_registry().get('assyrian', cpu=True)
+   P = session.postprocessor
+
+=========================================================== """
+
+COMPONENTS = ('tagger', 'lemmatizer')
+
+
+def io(message):
+    print(f'> {message}')
+
+
+class ModelSession:
+
+    """ Resident resources of one model
+
+    :param model_name            model name in Paths.models
+    :param cpu                   load translators for CPU
+    :param translators           load the translators now; otherwise
+                                 they are loaded by the first get()
+                                 that asks for them or on first use
+
+    :type model_name             str
+    :type cpu                    bool
+    :type translators            bool """
+
+    def __init__(self, model_name, cpu=False, translators=True):
+        self.model_name = model_name
+        self.path = os.path.join(Paths.models, model_name)
+        self.checkpoints = {
+            component: os.path.join(self.path, component, 'model.pt')
+            for component in COMPONENTS}
+        self.load_times = {}
+        self.devices = set()
+        self.uses = 0
+
+        start = time.perf_counter()
+        self.config = ModelConfig.read(model_name)
+        self.load_times['settings'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.postprocessor = postprocess.Postprocessor(
+            predictions=None, model_name=model_name)
+        self.postprocessor.preload(threshold=0.6)
+        self.override_mtime = self._override_mtime()
+        self.load_times['lexicons'] = time.perf_counter() - start
+
+        if translators:
+            self.load_translators(cpu)
+
+
+    def _override_mtime(self):
+        try:
+            return os.path.getmtime(self.postprocessor.override)
+        except OSError:
+            return None
+
+
+    def load_translators(self, cpu):
+        """ Load tagger and lemmatizer in-process. If OpenNMT cannot
+        be used in-process, model_api falls back to a subprocess for
+        each call """
+        if cpu in self.devices:
+            return
+        self.devices.add(cpu)
+        for component, checkpoint in self.checkpoints.items():
+            start = time.perf_counter()
+            try:
+                if model_api.tagger_engine(checkpoint) == 'classifier':
+                    model_api.get_classifier(checkpoint)
+                else:
+                    model_api.get_translator(checkpoint, cpu)
+            except Exception as e:
+                io(f'Could not load {component} of {self.model_name} '\
+                   f'in-process ({e})')
+            self.load_times[component] = self.load_times.get(component, 0)\
+                + time.perf_counter() - start
+
+
+    def activate(self):
+        """ Reload the override dictionary if it has been updated on
+        disk. The settings of the model are not copied to the
+        process-wide settings; they are passed as self.config. """
+        mtime = self._override_mtime()
+        if mtime != self.override_mtime:
+            io(f'Override of {self.model_name} has changed, reloading')
+            self.postprocessor.override_dict = None
+            self.postprocessor.form_dict = None
+            self.override_mtime = mtime
+
+
+    @property
+    def size(self):
+        """ Estimated resident size in bytes: checkpoints and the
+        training data the lexicons are built from """
+        files = list(self.checkpoints.values()) + [self.postprocessor.train]
+        if self.config.tagger_engine == 'classifier':
+            files[0] = os.path.join(self.path, 'tagger', 'classifier.json')
+        return sum(os.path.getsize(f) for f in files if os.path.isfile(f))
+
+
+    @property
+    def load_time(self):
+        return sum(self.load_times.values())
+
+
+    def release(self):
+        for checkpoint in self.checkpoints.values():
+            model_api.release_translator(checkpoint)
+
+
+class ModelRegistry:
+
+    """ LRU registry of resident models
+
+    :param max_models            maximum number of resident models
+    :param memory_budget         maximum estimated size of resident
+                                 models in megabytes (None = no limit)
+
+    :type max_models             int
+    :type memory_budget          int or None """
+
+    def __init__(self, max_models=None, memory_budget=None):
+        self.max_models = max_models or Inference.resident_models
+        self.memory_budget = memory_budget or Inference.memory_budget
+        self.models = OrderedDict()
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def get(self, model_name, cpu=False, translators=True):
+        """ Return the resident session of `model_name` and mark it
+        as the most recently used; load it on first use
+
+        :param model_name        model name in Paths.models
+        :param cpu               use CPU instead of GPU
+        :param translators       load the tagger and the lemmatizer;
+                                 False loads only settings and lexicons
+
+        :type model_name         str
+        :type cpu                bool
+        :type translators        bool """
+
+        with self.lock:
+            session = self.models.get(model_name, None)
+            if session is not None:
+                self.hits += 1
+                self.models.move_to_end(model_name)
+                if translators:
+                    session.load_translators(cpu)
+            else:
+                self.misses += 1
+                io(f'Registry: loading {model_name}')
+                session = ModelSession(model_name, cpu, translators)
+                self.models[model_name] = session
+                io(f'Registry: loaded {model_name} in '\
+                   f'{round(session.load_time, 2)} s')
+                self._evict()
+            session.uses += 1
+            session.activate()
+            return session
+
+
+    def _evict(self):
+        """ Drop least recently used models until the limits hold.
+        The most recently used model is never evicted. """
+        def over_budget():
+            if len(self.models) > self.max_models:
+                return True
+            if self.memory_budget is None:
+                return False
+            size = sum(s.size for s in self.models.values())
+            return size > self.memory_budget * 1024 * 1024
+
+        while len(self.models) > 1 and over_budget():
+            model_name, session = self.models.popitem(last=False)
+            session.release()
+            self.evictions += 1
+            io(f'Registry: evicted {model_name}')
+
+
+    def evict(self, model_name):
+        """ Remove `model_name` from the registry """
+        with self.lock:
+            session = self.models.pop(model_name, None)
+            if session is not None:
+                session.release()
+                self.evictions += 1
+
+
+    def stats(self):
+        """ Return hit/miss counts and load times of resident models """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'models': {
+                    name: {'uses': s.uses,
+                           'size_mb': round(s.size / 1024 / 1024, 1),
+                           'load_time': round(s.load_time, 3),
+                           'load_times': {k: round(v, 3) for k, v
+                                          in s.load_times.items()}}
+                    for name, s in self.models.items()}}
+
+
+    def report(self):
+        stats = self.stats()
+        io(f'Registry: {stats["hits"]} hits, {stats["misses"]} misses, '\
+           f'{stats["evictions"]} evictions')
+        for name, model in stats['models'].items():
+            print(f'   {name}: {model["uses"]} uses, {model["size_mb"]} MB, '\
+                  f'loaded in {model["load_time"]} s')
+
+
+""" Registry shared by the lemmatizer, the evaluator and the server """
+_registry = None
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry()
+    return _registry
@@ -29,6 +29,30 @@ class Postprocessor:
         self.predictions = predictions
         self.train_data = None
 
+        """ Lexicons are built once and kept for reuse, so that a
+        resident Postprocessor can be applied to many predictions """
+        self.invocab = None
+        self.lemmadicts = {}
+        self.override_dict = None
+        self.form_dict = None
+
+        
+    def bind(self, predictions):
+        """ Return a postprocessor for `predictions` that shares the
+        lexicons of this one. Unlike rebinding `predictions`, this
+        lets concurrent requests use one resident postprocessor. """
+        P = copy.copy(self)
+        P.predictions = predictions
+        return P
+
+    
+    def preload(self, threshold=0.6):
+        """ Build all lexicons in advance """
+        self._get_invocab()
+        self._get_lemmadict((cplus.FORM, cplus.XPOS), threshold)
+        self._get_lemmadict((cplus.FORM, cplus.XPOSCTX), threshold)
+        self._get_override()
+
         
     def _generate_lemmadict(self, fields, threshold):
         """ Creates naive disambiguation dictionary based on
@@ -55,15 +79,69 @@ class Postprocessor:
                 if score >= threshold:
                     yield xlit_pos, lemma, 1.0 #score; now flat not
 
+
+    def _get_lemmadict(self, fields, threshold):
+        """ Return cached substitution dictionary in format
+           {(input fields): 
+               {output_index: output, score: score}, ...} """
+        key = (fields, threshold)
+        if key not in self.lemmadicts:
+            self.lemmadicts[key] = {
+                xlit_pos : {cplus.LEMMA: lemma, 'score': score}
+                for xlit_pos, lemma, score in self._generate_lemmadict(
+                        fields=fields, threshold=threshold)}
+        return self.lemmadicts[key]
+
+
+    def get_form_dictionary(self):
+        """ Return cached dictionary of forms that are fully determined:
+        forms listed in the override lexicon and forms that have
+        exactly one lemma + XPOS in the training data
+
+            {form: {'lemma': lemma, 'xpos': xpos}, ...} """
+        if self.form_dict is None:
+            if self.train_data is None:
+                self.train_data = cplus.ConlluPlus(self.train, validate=False)
+            analyses = defaultdict(set)
+            for form, lemma, xpos in self.train_data.get_contents(
+                    'form', 'lemma', 'xpos'):
+                analyses[form].add((lemma, xpos))
+
+            self.form_dict = {}
+            for form, values in analyses.items():
+                if len(values) == 1:
+                    lemma, xpos = values.pop()
+                    self.form_dict[form] = {'lemma': lemma, 'xpos': xpos}
+            self.form_dict.update(self._get_override())
+        return self.form_dict
+
+    
+    def _get_invocab(self):
+        """ Return cached set of in-vocabulary forms """
+        if self.invocab is None:
+            self.invocab = set()
+            with open(os.path.join(Paths.models, self.model_name,
+                                   'lex', 'train-types.xlit')) as f:
+                for line in f:
+                    line = line.rstrip()
+                    self.invocab.add(line.split('\t')[0])
+        return self.invocab
+
+
+    def _get_override(self):
+        """ Return cached override dictionary """
+        if self.override_dict is None:
+            override = cplus.ConlluPlus(self.override, validate=False)
+            self.override_dict = {}
+            for form, lemma, xpos in override.get_contents('form', 'lemma', 'xpos'):
+                #form = form.strip('*') # remove stars
+                self.override_dict[form] = {'lemma': lemma, 'xpos': xpos}
+        return self.override_dict
+
                     
     def initialize_scores(self):
         """ Initialize confidence scores """
-        invocab = set()
-        with open(os.path.join(Paths.models, self.model_name,
-                               'lex', 'train-types.xlit')) as f:
-            for line in f:
-                line = line.rstrip()
-                invocab.add(line.split('\t')[0])
+        invocab = self._get_invocab()
 
         def get_scores():
             for sentence in self.predictions.get_contents():
@@ -94,12 +172,8 @@ class Postprocessor:
         print(f'> Post-processor ({self.model_name}): '\
               f'filling in unambiguous words (t ≥ {threshold})')
 
-        """ Reform dictionary in format 
-           {(input fields): 
-               {output_index: output, score: score}, ...} """
-        unambiguous = {xlit_pos : {cplus.LEMMA: lemma, 'score': score}
-                       for xlit_pos, lemma, score in self._generate_lemmadict(
-                               fields=(cplus.FORM, cplus.XPOS), threshold=threshold)}
+        unambiguous = self._get_lemmadict(
+            (cplus.FORM, cplus.XPOS), threshold)
 
         """ Populate CoNLL-U with substitutions """
         self.predictions.conditional_update_value(
@@ -115,9 +189,8 @@ class Postprocessor:
         ## Ei kyllä toimi jos konteksti on vituillaan
         ## Markovin ketju? 
         
-        unambiguous = {xlit_pos : {cplus.LEMMA: lemma, 'score': score}
-                       for xlit_pos, lemma, score in self._generate_lemmadict(
-                               fields=(cplus.FORM, cplus.XPOSCTX), threshold=threshold)}  
+        unambiguous = self._get_lemmadict(
+            (cplus.FORM, cplus.XPOSCTX), threshold)
 
         self.predictions.conditional_update_value(
             unambiguous, fields = ('form', 'xposctx'))
@@ -125,12 +198,7 @@ class Postprocessor:
         
     def apply_override(self):
         """ Make override dictionary """
-        override = cplus.ConlluPlus(self.override, validate=False)
-
-        _dict = {}
-        for form, lemma, xpos in override.get_contents('form', 'lemma', 'xpos'):
-            #form = form.strip('*') # remove stars
-            _dict[form] = {'lemma': lemma, 'xpos': xpos}
+        _dict = self._get_override()
             
         # aa override ja ylikirjoita jokainen form overriden lemma + pos kombolla
         self.predictions.override_form(_dict)
@@ -0,0 +1,164 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+""" ===========================================================
+Persistent prediction cache for BabyLemmatizer 2
+
+Maps the exact neural net input line (make_tagger_src or
+make_lem_src output) to the prediction of a given checkpoint.
+The cache is stored in models/<name>/cache/predictions.sqlite
+and it is bound to the fingerprint of the checkpoint, i.e. all
+entries of a component are dropped when its model.pt changes.
+
+=========================================================== """
+
+CACHE_FILE = 'predictions.sqlite'
+
+""" SQLite limits the number of variables per query """
+QUERY_SIZE = 500
+
+_fingerprints = {}
+_caches = {}
+
+
+def fingerprint(model_name):
+    """ SHA-1 of the checkpoint; memoized by path, size and
+    modification time to avoid rehashing large files
+
+    :param model_name            model checkpoint path
+    :type model_name             path/file as str """
+
+    stat = os.stat(model_name)
+    key = (os.path.abspath(model_name), stat.st_size, stat.st_mtime_ns)
+    if key not in _fingerprints:
+        sha = hashlib.sha1()
+        with open(model_name, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        _fingerprints[key] = sha.hexdigest()
+    return _fingerprints[key]
+
+
+class PredictionCache:
+
+    """ Size-bounded LRU cache of neural net predictions
+
+    :param model_name            model checkpoint path, e.g.
+                                 models/<name>/tagger/model.pt
+    :param max_entries           maximum number of predictions
+                                 kept per component
+    :param variant               decoding mode whose predictions are
+                                 kept apart from the default ones
+
+    :type model_name             path/file as str
+    :type max_entries            int
+    :type variant                str or None """
+
+    def __init__(self, model_name, max_entries=1000000, variant=None):
+        component_path = os.path.dirname(os.path.abspath(model_name))
+        self.component = os.path.basename(component_path)
+        if variant is not None:
+            self.component += f':{variant}'
+        self.max_entries = max_entries
+        self.fingerprint = fingerprint(model_name)
+        self.lock = threading.Lock()
+
+        cache_path = os.path.join(os.path.dirname(component_path), 'cache')
+        os.makedirs(cache_path, exist_ok=True)
+        self.filename = os.path.join(cache_path, CACHE_FILE)
+
+        self.db = sqlite3.connect(self.filename, check_same_thread=False)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS meta '
+            '(component TEXT PRIMARY KEY, fingerprint TEXT)')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS entries '
+            '(component TEXT, source TEXT, prediction TEXT, used REAL, '
+            'PRIMARY KEY (component, source))')
+        self.db.execute(
+            'CREATE INDEX IF NOT EXISTS entries_used '
+            'ON entries (component, used)')
+        self._invalidate()
+        self.db.commit()
+
+
+    def _invalidate(self):
+        """ Drop entries predicted by another version of the model """
+        row = self.db.execute(
+            'SELECT fingerprint FROM meta WHERE component = ?',
+            (self.component,)).fetchone()
+        if row is None or row[0] != self.fingerprint:
+            if row is not None:
+                print(f'> Cache: {self.component} model has changed, '\
+                      'clearing cached predictions')
+            self.db.execute(
+                'DELETE FROM entries WHERE component = ?', (self.component,))
+            self.db.execute(
+                'INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                (self.component, self.fingerprint))
+
+
+    def lookup(self, lines):
+        """ Return dictionary {line: prediction} of cached lines
+        and mark them as recently used
+
+        :param lines             neural net input lines
+        :type lines              [str, ...] """
+
+        hits = {}
+        with self.lock:
+            for i in range(0, len(lines), QUERY_SIZE):
+                batch = lines[i:i+QUERY_SIZE]
+                marks = ','.join('?' * len(batch))
+                hits.update(self.db.execute(
+                    'SELECT source, prediction FROM entries '
+                    f'WHERE component = ? AND source IN ({marks})',
+                    (self.component, *batch)).fetchall())
+            now = time.time()
+            self.db.executemany(
+                'UPDATE entries SET used = ? WHERE component = ? AND source = ?',
+                ((now, self.component, line) for line in hits))
+            self.db.commit()
+        return hits
+
+
+    def store(self, lines, predictions):
+        """ Save predictions and evict least recently used entries
+        if the cache grows too large """
+        now = time.time()
+        with self.lock:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                ((self.component, line, prediction, now)
+                 for line, prediction in zip(lines, predictions)))
+            self._evict()
+            self.db.commit()
+
+
+    def _evict(self):
+        count = self.db.execute(
+            'SELECT COUNT(*) FROM entries WHERE component = ?',
+            (self.component,)).fetchone()[0]
+        if count > self.max_entries:
+            self.db.execute(
+                'DELETE FROM entries WHERE rowid IN '
+                '(SELECT rowid FROM entries WHERE component = ? '
+                'ORDER BY used LIMIT ?)',
+                (self.component, count - self.max_entries))
+
+
+def get_cache(model_name, max_entries=1000000, variant=None):
+    """ Return the prediction cache of `model_name`; reopened if
+    the checkpoint has changed since the last call """
+    key = (os.path.abspath(model_name), variant)
+    cache = _caches.get(key, None)
+    if cache is None or cache.fingerprint != fingerprint(model_name):
+        cache = PredictionCache(model_name, max_entries, variant)
+        _caches[key] = cache
+    return cache
@@ -42,6 +42,63 @@ class Paths:
     models = 'models'
     override = 'override'
 
+
+class Inference:
+
+    """ Runtime options for running the neural nets """
+    
+    """ Look up and store predictions in models/<name>/cache """
+    cache = True
+    cache_size = 1000000 # predictions per component
+
+    """ Number of CPU worker processes and torch threads per worker
+    (None = divide the cores evenly between the workers) """
+    jobs = 1
+    threads = None
+
+    """ Use the threads, jobs and batch_tokens saved in config.yaml
+    by --autotune; off when they are given on the command line """
+    tuned = True
+
+    """ Sort neural net inputs into length buckets and translate
+    them in batches of at most this many tokens, padding included """
+    bucketing = True
+    batch_tokens = 2048
+
+    """ How many models the model registry keeps loaded and their
+    estimated total size in megabytes (None = no limit) """
+    resident_models = 3
+    memory_budget = None
+
+    """ Tag with a single decoder step (argmax over the generator)
+    instead of beam search; the tagger target is always one XPOS
+    token. model_api.tag_topk() returns the `tagger_topk` best tags
+    and their probabilities. """
+    single_step_tagger = False
+    tagger_topk = 3
+
+    """ On CPU use the int8 checkpoints (model.int8.pt) made with
+    --quantize when they are available """
+    quantized = True
+
+    """ Maximum number of sentences in the sentence memo of a model
+    (--sentence-memo) and whether an empty memo is warmed from the
+    training data of the model """
+    memo_size = 1000000
+    memo_warm = True
+
+    """ Use the CTranslate2 export of a checkpoint (ctranslate2/ next
+    to model.pt, see ct2_export.py) when it is available. Off by
+    default: only external Transformer checkpoints can be exported,
+    models trained with BabyLemmatizer are BiLSTMs. Threads per
+    translation (0 = CTranslate2 default), parallel translations,
+    batch size in examples and compute type (e.g. int8 on CPU) """
+    ctranslate2 = False
+    ct2_intra_threads = 0
+    ct2_inter_threads = 1
+    ct2_batch_size = 64
+    ct2_compute_type = 'default'
+
     
 class Context:
     
@@ -96,8 +153,118 @@ class Tokenizer:
                         Tokenizer.setting = val
                         
         print(f'> Using tokenizer {Tokenizer.setting}')
+
+
+class Tagger:
+
+    """ Tagger engine of models that are built
+
+    onmt = OpenNMT encoder-decoder
+    classifier = averaged perceptron (see classifier_tagger.py)
+
+    This info is saved in to model config.yaml """
+
+    engine = 'onmt'
         
 
+class ModelConfig:
+
+    """ Tokenizer and context settings of one model. Tokenizer and
+    Context hold process-wide settings; a ModelConfig is passed to
+    preprocessing and merging instead, so that models with different
+    settings can be used at the same time in one process.
+
+    :param tokenizer             tokenizer setting (see Tokenizer)
+    :param tagger_context        tagger context size
+    :param lemmatizer_context    lemmatizer context size
+    :param tagger_engine         tagger engine (see Tagger)
+    :param tuning                CPU inference settings saved by
+                                 --autotune, see inference_settings()
+
+    :type tokenizer              int
+    :type tagger_context         int
+    :type lemmatizer_context     int
+    :type tagger_engine          str
+    :type tuning                 dict or None """
+
+    """ Inference settings saved by --autotune """
+    TUNED = ('threads', 'jobs', 'batch_tokens')
+
+    def __init__(self, tokenizer=0, tagger_context=2, lemmatizer_context=1,
+                 tagger_engine='onmt', tuning=None):
+        self.tokenizer = tokenizer
+        self.tagger_context = tagger_context
+        self.lemmatizer_context = lemmatizer_context
+        self.tagger_engine = tagger_engine
+        self.tuning = tuning or {}
+
+
+    @classmethod
+    def read(cls, prefix):
+        """ Read settings from config.yaml of model `prefix`; models
+        trained with old versions get the default settings """
+        filename = os.path.join(Paths.models, prefix, 'config.yaml')
+        if not os.path.isfile(filename):
+            print('> Your model was trained with an old version of BabyLemmatizer.')
+            print('> Using default tokenizer and contexts')
+            return cls()
+        
+        config = cls.read_file(filename)
+        print(f'> {prefix}: tokenizer {config.tokenizer}, '\
+              f'tagger context {config.tagger_context}, '\
+              f'lemmatizer context {config.lemmatizer_context}'\
+              + (f', {config.tagger_engine} tagger'
+                 if config.tagger_engine != 'onmt' else ''))
+        if config.tuning:
+            print(f'> {prefix}: tuned for {config.tuned_cores} cores: '\
+                  + ', '.join(f'{key} {val}' for key, val
+                              in config.tuning.items() if key in cls.TUNED))
+        return config
+
+
+    @classmethod
+    def read_file(cls, filename):
+        """ Read settings from a config.yaml file """
+        config = cls()
+        keys = {'tokenizer', 'tagger_context', 'lemmatizer_context'}
+        with open(filename) as f:
+            for l in f.read().splitlines():
+                key, _, val = l.replace(' ', '').partition(':')
+                if key in keys:
+                    setattr(config, key, int(val))
+                elif key == 'tagger_engine':
+                    config.tagger_engine = val
+                elif key in cls.TUNED or key == 'tuned_cores':
+                    config.tuning[key] = int(val)
+        return config
+
+
+    @property
+    def tuned_cores(self):
+        return self.tuning.get('tuned_cores', None)
+
+
+    @classmethod
+    def current(cls):
+        """ Config from the process-wide settings """
+        return cls(Tokenizer.setting,
+                   Context.tagger_context,
+                   Context.lemmatizer_context,
+                   Tagger.engine)
+
+
+    def inference_settings(self):
+        """ Return the CPU inference settings of the model as keyword
+        arguments of model_api.translate_lines(). Settings tuned on a
+        machine with a different number of cores are not used; the
+        defaults are read from Inference on each call, so that the
+        command line can override them. """
+        settings = {key: getattr(Inference, key) for key in self.TUNED}
+        if Inference.tuned and self.tuned_cores == os.cpu_count():
+            settings.update((key, value) for key, value
+                            in self.tuning.items() if key in self.TUNED)
+        return settings
+
     
 if __name__ == "__main__":
     # Versión portable del test
@@ -40,16 +40,25 @@ def remove_brackets(xlit):
     return ''.join(c for c in xlit if c not in LACUNA_METACHARS)
     
     
+def reformat(sign, setting=None):
+    """ Reformat cuneiform input
+
+    :param sign           sign
+    :param setting        tokenizer setting, Tokenizer.setting if None """
+    if setting is None:
+        setting = Tokenizer.setting
+    return _reformat(sign, setting)
+
+
 @lru_cache(maxsize=256)
-def reformat(sign):
-    """ Reformat cuneiform input """
+def _reformat(sign, setting):
     sign = sign.replace('*', '') # remove stars
     
     if sign.upper() == sign:
         return sign
     elif sign.lower() == sign:
         """ Remove indices only if tokenizer setting 0 is used """
-        if Tokenizer.setting == 1:
+        if setting == 1:
             return ' '.join(c for c in sign)
         return ' '.join(c for c in sign if not c.isdigit())
     else:
@@ -60,8 +69,7 @@ def get_chars_lemma(lemma):
     return ' '.join(list(lemma))
 
 
-@lru_cache(maxsize=512)
-def get_chars(xlit):
+def get_chars(xlit, setting=None):
 
     """ It seems that the best tokenization for Akkadian includes
     
@@ -69,14 +77,26 @@ def get_chars(xlit):
     - removal of indices for lowerase
     - preserving indices for uppercase
     - splitting logograms at .
-    
-    """
+
+    Tokenizations are cached by tokenizer setting, thus models
+    with different settings can be used side by side.
+
+    :param xlit           transliteration
+    :param setting        tokenizer setting, Tokenizer.setting if None """
+
+    if setting is None:
+        setting = Tokenizer.setting
+    return _get_chars(xlit, setting)
+
+
+@lru_cache(maxsize=512)
+def _get_chars(xlit, setting):
     
     if xlit == '_':
         return xlit
 
     """ If used for languages with alphabet """
-    if Tokenizer.setting == 2:
+    if setting == 2:
         return ' '.join(list(xlit))
 
     #return ' '.join(list(xlit))
@@ -87,7 +107,7 @@ def get_chars(xlit):
     xlit = uppercase_determinatives(xlit)
     signs, delimiters = util.unzip_xlit(xlit)
     delimiters = [f' {d} '.replace('{ ', '{').replace(' }', '}') for d in delimiters]
-    signs = [reformat(s) for s in signs]
+    signs = [_reformat(s, setting) for s in signs]
     
     xlit_ = util.zip_xlit(signs, delimiters)\
             .lstrip()\
@@ -118,24 +138,30 @@ def get_signs(xlit):
 #    return f'{token} {context}\n'
 
 
+def clean_traindata(xlit, setting=None):
+    if setting is None:
+        setting = Tokenizer.setting
+    return _clean_traindata(xlit, setting)
+
+
 @lru_cache(maxsize=1024)
-def clean_traindata(xlit):
+def _clean_traindata(xlit, setting):
     xlit = remove_brackets(xlit)
     xlit = uppercase_determinatives(xlit)
     #xlit = xlit.replace('{d}+', '{d}')
-    xlit = get_chars(xlit)
+    xlit = get_chars(xlit, setting)
     return xlit
 
 
-def make_tagger_src(formctx, context):
+def make_tagger_src(formctx, context, setting=None):
     """ Format FORM context for training data """
-    return ' | '.join(f'<< {get_chars(xlit)} >>'
-            if e == context else f'{get_chars(xlit)}'
+    return ' | '.join(f'<< {get_chars(xlit, setting)} >>'
+            if e == context else f'{get_chars(xlit, setting)}'
                       for e, xlit in enumerate(formctx.split('|')))
 
-def make_lem_src(form, xposctx):
+def make_lem_src(form, xposctx, setting=None):
     """ Format XPOS context for training data """
-    xlit = get_chars(form)
+    xlit = get_chars(form, setting)
     xpos = ' '.join(f'P{e}={pos}' for e, pos in enumerate(xposctx.split('|')))
     return f'{xlit} {xpos}'
 
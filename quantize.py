@@ -0,0 +1,191 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import conlluplus
+import model_api
+import evaluate_models
+from preferences import Paths, Inference, ModelConfig
+
+""" ===========================================================
+Dynamic int8 quantization for BabyLemmatizer 2
+
+Makes int8 copies of the tagger and lemmatizer checkpoints for
+CPU inference. The weights of the LSTM and Linear layers are
+stored as int8 and the activations are quantized on the fly, so
+no calibration data is needed. The quantized network is saved
+as model.int8.pt next to model.pt; model_api uses it instead of
+model.pt when running on CPU (see Inference.quantized). A copy
+older than its model.pt is ignored, so retraining a model does
+not leave a stale quantized network in use.
+
+   python babylemmatizer.py --quantize=assyrian
+
+After quantizing, the model is run on its conllu/test.conllu
+with and without the int8 networks and the size, speed and
+accuracy of both are reported.
+
+=========================================================== """
+
+COMPONENTS = ('tagger', 'lemmatizer')
+
+
+def io(message):
+    print(f'> {message}')
+
+
+def megabytes(filename):
+    return round(os.path.getsize(filename) / 1024 / 1024, 1)
+
+
+def quantize_checkpoint(model_name):
+    """ Save a dynamically quantized copy of an OpenNMT checkpoint
+    as model.int8.pt in the same directory and return its path
+
+    :param model_name            model checkpoint path
+    :type model_name             path/file as str """
+
+    import torch
+    from torch import nn
+    from onmt.model_builder import load_test_model
+
+    opt = model_api.translate_opts(model_name, cpu=True)
+    _, model, _ = load_test_model(opt)
+    model.eval()
+
+    qmodel = torch.quantization.quantize_dynamic(
+        model, {nn.LSTM, nn.LSTMCell, nn.Linear}, dtype=torch.qint8)
+
+    filename = os.path.join(os.path.dirname(model_name),
+                            model_api.QUANTIZED_FILE)
+    torch.save(qmodel, filename)
+    return filename
+
+
+def checkpoints(model_name):
+    """ Yield (component, checkpoint) of the OpenNMT networks of a
+    model; a classifier tagger has nothing to quantize """
+    model_path = os.path.join(Paths.models, model_name)
+    for component in COMPONENTS:
+        checkpoint = os.path.join(model_path, component, 'model.pt')
+        if not os.path.isfile(checkpoint):
+            io(f'{component} of {model_name} has no model.pt, skipping')
+            continue
+        if model_api.tagger_engine(checkpoint) == 'classifier':
+            continue
+        yield component, checkpoint
+
+
+def run_test(model_name, quantized):
+    """ Tag and lemmatize conllu/test.conllu of a model on CPU with
+    or without the int8 networks. Returns the elapsed time, the
+    number of neural net input lines and the evaluation results.
+
+    :param model_name            model name in Paths.models
+    :param quantized             use the int8 networks
+
+    :type model_name             str
+    :type quantized              bool """
+
+    model_path = os.path.join(Paths.models, model_name)
+    tagger = os.path.join(model_path, 'tagger', 'model.pt')
+    lemmatizer = os.path.join(model_path, 'lemmatizer', 'model.pt')
+    gold = os.path.join(model_path, 'conllu', 'test.conllu')
+    config = ModelConfig.read(model_name)
+
+    data = conlluplus.ConlluPlus(gold, validate=False)
+    data.force_value('lemma', '_')
+    data.force_value('xpos', '_')
+    data.force_value('upos', '_')
+    with open(os.path.join(model_path, 'tagger', 'traindata', 'test.src'),
+              'r', encoding='utf-8') as f:
+        source = f.read().splitlines()
+
+    previous = Inference.quantized
+    Inference.quantized = quantized
+    try:
+        """ Load the translators before timing """
+        for checkpoint in (tagger, lemmatizer):
+            if model_api.tagger_engine(checkpoint) != 'classifier':
+                model_api.get_translator(checkpoint, cpu=True)
+
+        """ One job: fallbacks to a subprocess are only counted in
+        this process """
+        fallbacks = model_api.fallbacks
+        start = time.perf_counter()
+        tags = model_api.translate_lines(
+            source, tagger, cpu=True, name='Tagger', jobs=1)
+        model_api.merge_tags(tags, data, None, 'xpos', 'xposctx', config)
+        lem_source = list(model_api.lemmatizer_source(data, config))
+        lemmas = model_api.translate_lines(
+            lem_source, lemmatizer, cpu=True, name='Lemmatizer', jobs=1)
+        model_api.merge_tags(lemmas, data, None, 'lemma', None, config)
+        elapsed = time.perf_counter() - start
+    finally:
+        Inference.quantized = previous
+
+    """ The subprocess always loads model.pt, so its results say
+    nothing about the int8 networks """
+    if model_api.fallbacks != fallbacks:
+        raise RuntimeError(
+            f'{model_name} could not be run in-process, the '\
+            f'{"int8" if quantized else "fp32"} results would be invalid')
+
+    label = 'int8' if quantized else 'fp32'
+    filename = os.path.join(model_path, 'eval', f'test_nn_{label}.conllu')
+    data.write_file(filename=filename)
+    results, _ = evaluate_models.evaluate(filename, gold, model_name, model_path)
+    return elapsed, len(source) + len(lem_source), results
+
+
+def quantize_model(model_name, evaluate=True):
+    """ Quantize the tagger and lemmatizer of a model and report
+    size reduction, speedup and accuracy delta on the test set
+
+    :param model_name            model name in Paths.models
+    :param evaluate              compare against the float model
+
+    :type model_name             str
+    :type evaluate               bool """
+
+    print(f'> Quantizing {model_name}')
+    print(f'   {"COMPONENT": <14}{"FP32 MB": >10}{"INT8 MB": >10}{"RATIO": >8}')
+    for component, checkpoint in checkpoints(model_name):
+        quantized = quantize_checkpoint(checkpoint)
+        fp32, int8 = megabytes(checkpoint), megabytes(quantized)
+        print(f'   {component: <14}{fp32: >10}{int8: >10}'\
+              f'{round(fp32 / max(int8, 0.1), 2): >8}')
+
+    if not evaluate:
+        return
+
+    if not os.path.isfile(os.path.join(
+            Paths.models, model_name, 'conllu', 'test.conllu')):
+        io(f'{model_name} has no conllu/test.conllu, skipping evaluation')
+        return
+
+    keys = ('POS-tagger', 'Lemmatizer', 'Combined  ')
+    runs = {}
+    for label, quantized in (('fp32', False), ('int8', True)):
+        io(f'Running {model_name} on the test set ({label})')
+        try:
+            runs[label] = run_test(model_name, quantized)
+        except RuntimeError as e:
+            io(f'Evaluation failed: {e}')
+            return
+
+    print(f'> {model_name} on CPU')
+    print(f'   {"": <8}{"SECONDS": >10}{"LINES/S": >10}'\
+          f'{"POS": >8}{"LEMMA": >8}{"COMBINED": >10}')
+    for label, (elapsed, lines, results) in runs.items():
+        accuracy = [round(100 * results[key]['accuracy'], 2) for key in keys]
+        print(f'   {label: <8}{round(elapsed, 2): >10}'\
+              f'{round(lines / elapsed, 1): >10}'\
+              f'{accuracy[0]: >8}{accuracy[1]: >8}{accuracy[2]: >10}')
+
+    fp32, int8 = runs['fp32'], runs['int8']
+    delta = [round(100 * (int8[2][key]['accuracy'] - fp32[2][key]['accuracy']), 2)
+             for key in keys]
+    print(f'   {"delta": <8}{str(round(fp32[0] / int8[0], 2)) + "x": >10}{"": >10}'\
+          f'{delta[0]: >8}{delta[1]: >8}{delta[2]: >10}')
@@ -0,0 +1,215 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import json
+import hashlib
+import sqlite3
+import threading
+import conlluplus
+
+""" ===========================================================
+Sentence memo for BabyLemmatizer 2
+
+Letters, contracts and omen series repeat whole lines verbatim.
+The sentence memo maps the normalized form sequence of a unit
+to its annotation after post-processing, i.e. the XPOS, lemma
+and score of each word (and MISC where post-processing changed
+it), so that a sentence seen before skips the tagger, the
+lemmatizer and the post-processor. Contexts never cross
+sentence boundaries, so the forms of a sentence determine its
+annotation. The override lexicon and number handling are not
+memoized; they are applied to every sentence after the lookup,
+so that corrections take effect without clearing the memo.
+
+The memo is stored in models/<name>/cache/sentences.sqlite.
+Each entry is keyed on the sentence and a fingerprint of
+everything else the annotation depends on (checkpoints, model
+settings and options, see Lemmatizer.model_key), so that
+entries made with different options live side by side and
+switching back and forth between them keeps both. Entries of
+old checkpoints are never looked up again and are evicted as
+the least recently used. Entries can be warmed from the gold
+annotations of conllu/train.conllu (see Lemmatizer.warm_memo);
+each fingerprint is warmed separately.
+
+=========================================================== """
+
+MEMO_FILE = 'sentences.sqlite'
+
+""" SQLite limits the number of variables per query """
+QUERY_SIZE = 500
+
+
+def sentence_key(sentence):
+    """ Memo key of a normalized sentence: its forms """
+    return ' '.join(word[conlluplus.FORM] for word in sentence)
+
+
+def annotation(sentence, misc=None):
+    """ Return the annotation of a processed sentence as a list of
+    [xpos, lemma, score, misc] per word; misc is None where it is
+    the same as in `misc`, the values before processing """
+    if misc is None:
+        misc = [None] * len(sentence)
+    return [[word[conlluplus.XPOS], word[conlluplus.LEMMA],
+             word[conlluplus.SCORE],
+             word[conlluplus.MISC] if word[conlluplus.MISC] != before else None]
+            for word, before in zip(sentence, misc)]
+
+
+def apply(sentence, values):
+    """ Annotate a sentence in place from the memo """
+    for word, (xpos, lemma, score, misc) in zip(sentence, values):
+        word[conlluplus.XPOS] = xpos
+        word[conlluplus.LEMMA] = lemma
+        word[conlluplus.SCORE] = score
+        if misc is not None:
+            word[conlluplus.MISC] = misc
+        word[conlluplus.FORMCTX] = '_'
+        word[conlluplus.XPOSCTX] = '_'
+    return sentence
+
+
+class SentenceMemo:
+
+    """ Size-bounded LRU memo of sentence annotations of a model
+    for one fingerprint. The least recently used sentences of all
+    fingerprints are evicted first.
+
+    :param model_path            model directory
+    :param fingerprint           identifies the model and options
+                                 the annotations were made with
+    :param max_entries           maximum number of sentences of
+                                 all fingerprints together
+
+    :type model_path             path as str
+    :type fingerprint            str
+    :type max_entries            int """
+
+    def __init__(self, model_path, fingerprint, max_entries=1000000):
+        self.fingerprint = fingerprint
+        self.variant = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+        cache_path = os.path.join(model_path, 'cache')
+        os.makedirs(cache_path, exist_ok=True)
+        self.filename = os.path.join(cache_path, MEMO_FILE)
+
+        self.db = sqlite3.connect(self.filename, check_same_thread=False)
+        self._upgrade()
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS sentences '
+            '(variant TEXT, source TEXT, annotation TEXT, used REAL, '
+            'PRIMARY KEY (variant, source))')
+        self.db.execute(
+            'CREATE INDEX IF NOT EXISTS sentences_used ON sentences (used)')
+        self.db.commit()
+
+
+    def _get_meta(self, key):
+        row = self.db.execute(
+            'SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return None if row is None else row[0]
+
+
+    def _set_meta(self, key, value):
+        self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                        (key, value))
+
+
+    def _upgrade(self):
+        """ Drop a memo of one fingerprint made by earlier versions """
+        columns = [row[1] for row in
+                   self.db.execute('PRAGMA table_info(sentences)')]
+        if columns and 'variant' not in columns:
+            print('> Sentence memo: upgrading, clearing memo')
+            self.db.execute('DROP TABLE sentences')
+            self.db.execute('DROP TABLE IF EXISTS meta')
+
+
+    @property
+    def warmed(self):
+        """ True if the memo of this fingerprint has been warmed from
+        the training data """
+        with self.lock:
+            return self._get_meta(f'warmed:{self.variant}') is not None
+
+
+    def set_warmed(self, sentences):
+        with self.lock:
+            self._set_meta(f'warmed:{self.variant}', str(sentences))
+            self.db.commit()
+
+
+    def __len__(self):
+        """ Number of sentences of this fingerprint """
+        with self.lock:
+            return self.db.execute(
+                'SELECT COUNT(*) FROM sentences WHERE variant = ?',
+                (self.variant,)).fetchone()[0]
+
+
+    def lookup(self, keys):
+        """ Return {key: annotation} of memoized sentences and mark
+        them as recently used
+
+        :param keys              sentence keys
+        :type keys               [str, ...] """
+
+        hits = {}
+        keys = list(set(keys))
+        with self.lock:
+            for i in range(0, len(keys), QUERY_SIZE):
+                batch = keys[i:i+QUERY_SIZE]
+                marks = ','.join('?' * len(batch))
+                hits.update(
+                    (source, json.loads(value)) for source, value in
+                    self.db.execute(
+                        'SELECT source, annotation FROM sentences '
+                        f'WHERE variant = ? AND source IN ({marks})',
+                        [self.variant] + batch).fetchall())
+            now = time.time()
+            self.db.executemany(
+                'UPDATE sentences SET used = ? WHERE variant = ? AND source = ?',
+                ((now, self.variant, key) for key in hits))
+            self.db.commit()
+        return hits
+
+
+    def store(self, keys, annotations):
+        """ Save sentence annotations and evict least recently used
+        sentences if the memo grows too large """
+        now = time.time()
+        with self.lock:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO sentences VALUES (?, ?, ?, ?)',
+                ((self.variant, key, json.dumps(value, ensure_ascii=False), now)
+                 for key, value in zip(keys, annotations)))
+            self._evict()
+            self.db.commit()
+
+
+    def _evict(self):
+        count = self.db.execute('SELECT COUNT(*) FROM sentences').fetchone()[0]
+        if count > self.max_entries:
+            self.db.execute(
+                'DELETE FROM sentences WHERE rowid IN '
+                '(SELECT rowid FROM sentences ORDER BY used LIMIT ?)',
+                (count - self.max_entries,))
+
+
+_memos = {}
+
+def get_memo(model_path, fingerprint, max_entries=1000000):
+    """ Return the sentence memo of a model for a fingerprint """
+    key = (os.path.abspath(model_path), fingerprint)
+    memo = _memos.get(key, None)
+    if memo is None:
+        memo = SentenceMemo(model_path, fingerprint, max_entries)
+        _memos[key] = memo
+    return memo
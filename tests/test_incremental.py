@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model_api
+import model_registry
+import lemmatizer_pipeline
+from preferences import Paths, Inference
+
+""" ===========================================================
+Incremental lemmatization tests for BabyLemmatizer 2
+
+Runs --incremental twice on an unchanged file with repeated
+sentences and checks that the second run, which takes all of
+its neural net output from the first, writes the same _pp
+file as the first run and as a run without --incremental.
+The neural nets are replaced by a function that tags every
+word as N, so that post-processing fills in the lemmata of
+the training data and raises their scores.
+
+   python -m unittest discover tests
+
+=========================================================== """
+
+TRAIN = [[('a-na', 'ana', 'PRP'), ('E₂', 'bītu', 'N'), ('DINGIR', 'ilu', 'N')],
+         [('LUGAL', 'šarru', 'N'), ('E₂', 'bītu', 'N')]]
+
+SOURCE = [['LUGAL', 'E₂'], ['a-na', 'E₂', 'DINGIR'], ['LUGAL', 'E₂'],
+          ['DINGIR'], ['a-na', 'E₂', 'DINGIR']]
+
+
+def conllu(sentences):
+    lines = []
+    for sentence in sentences:
+        for i, (form, lemma, xpos) in enumerate(sentence, start=1):
+            lines.append('\t'.join(
+                (str(i), form, lemma, '_', xpos, '_', '0', '_', '_', '_')))
+        lines.append('')
+    return '\n'.join(lines) + '\n'
+
+
+def neural_nets(lines, model_name, cpu=False, name='OpenNMT',
+                resident=True, settings=None):
+    if name == 'Tagger':
+        return ['N' for _ in lines]
+    return ['x' for _ in lines]
+
+
+class IncrementalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix='babylem_test_')
+        self.settings = (Paths.models, Inference.cache)
+        Paths.models = os.path.join(self.path, 'models')
+        Inference.cache = False
+
+        model_path = os.path.join(Paths.models, 'dup')
+        for directory in ('conllu', 'lex', 'override'):
+            os.makedirs(os.path.join(model_path, directory))
+        files = {
+            'config.yaml': 'tokenizer: 0\ntagger_context: 2\n'\
+                           'lemmatizer_context: 1\n',
+            'conllu/train.conllu': conllu(TRAIN),
+            'lex/train-types.xlit': ''.join(
+                f'{form}\n' for sentence in TRAIN for form, _, _ in sentence),
+            'override/override.conllu': ''}
+        for filename, content in files.items():
+            with open(os.path.join(model_path, filename), 'w',
+                      encoding='utf-8') as f:
+                f.write(content)
+
+        self.input_file = os.path.join(self.path, 'input', 'text.conllu')
+        os.makedirs(os.path.dirname(self.input_file))
+        with open(self.input_file, 'w', encoding='utf-8') as f:
+            f.write(conllu([[(form, '_', '_') for form in sentence]
+                            for sentence in SOURCE]))
+
+    def tearDown(self):
+        model_registry.get_registry().evict('dup')
+        Paths.models, Inference.cache = self.settings
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def lemmatize(self, incremental=True):
+        with mock.patch.object(model_api, 'translate', neural_nets):
+            lemmatizer_pipeline.Lemmatizer(
+                self.input_file, incremental=incremental).run_model('dup', True)
+        with open(self.input_file.replace('.conllu', '_pp.conllu'),
+                  'r', encoding='utf-8') as f:
+            return [line for line in f.read().splitlines()
+                    if not line.startswith('#')]
+
+    def test_repeated_sentences(self):
+        first = self.lemmatize()
+        second = self.lemmatize()
+        self.assertEqual(first, second)
+        self.assertEqual(second, self.lemmatize(incremental=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model_api
+from preferences import Inference
+
+""" ===========================================================
+Resident OpenNMT translator tests for BabyLemmatizer 2
+
+Trains a tiny brnn model for two steps with the installed
+OpenNMT-py and checks that it is run in-process, i.e. that
+model_api does not fall back to a subprocess, with beam search
+and with single-step decoding of the tagger. CPU worker
+processes must follow settings changed after they have been
+started.
+
+   python -m unittest discover tests
+
+=========================================================== """
+
+try:
+    import torch
+    import onmt
+except ImportError:
+    onmt = None
+
+CONFIG = """save_data: {path}/run
+src_vocab: {path}/vocab.src
+tgt_vocab: {path}/vocab.tgt
+data:
+    corpus_1:
+        path_src: {path}/train.src
+        path_tgt: {path}/train.tgt
+save_model: {path}/tagger/model
+encoder_type: brnn
+layers: 1
+rnn_size: 16
+word_vec_size: 8
+train_steps: 2
+save_checkpoint_steps: 2
+valid_steps: 1000
+batch_size: 16
+seed: 1
+"""
+
+LINES = ['a b c', 'd e f g', 'h a', 'b b c d e f']
+
+
+def make_checkpoint(path):
+    """ Train a character model that upper-cases its input """
+    source = [' '.join(chr(97 + (i * 7 + j) % 8) for j in range(i % 5 + 2))
+              for i in range(64)]
+    target = [line.upper() for line in source]
+    for side, lines in (('src', source), ('tgt', target)):
+        with open(os.path.join(path, f'train.{side}'), 'w',
+                  encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        symbols = sorted(set(' '.join(lines).split()))
+        with open(os.path.join(path, f'vocab.{side}'), 'w',
+                  encoding='utf-8') as f:
+            f.write(''.join(f'{symbol}\t1\n' for symbol in symbols))
+
+    os.makedirs(os.path.join(path, 'tagger'), exist_ok=True)
+    config = os.path.join(path, 'config.yaml')
+    with open(config, 'w', encoding='utf-8') as f:
+        f.write(CONFIG.format(path=path))
+    subprocess.run([sys.executable, '-m', 'onmt.bin.train', '-config', config],
+                   capture_output=True, check=True)
+    return os.path.join(path, 'tagger', 'model_step_2.pt')
+
+
+@unittest.skipIf(onmt is None, 'OpenNMT-py and torch are not installed')
+class ResidentTranslatorTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.path = tempfile.mkdtemp(prefix='babylem_test_')
+        cls.checkpoint = make_checkpoint(cls.path)
+        cls.settings = (Inference.cache, Inference.bucketing, Inference.jobs,
+                        Inference.single_step_tagger)
+        Inference.cache = False
+        Inference.jobs = 1
+
+    @classmethod
+    def tearDownClass(cls):
+        model_api.release_translator(cls.checkpoint)
+        Inference.cache, Inference.bucketing, Inference.jobs,\
+            Inference.single_step_tagger = cls.settings
+        shutil.rmtree(cls.path, ignore_errors=True)
+
+    def translate(self, lines, bucketing, single_step=False):
+        Inference.bucketing = bucketing
+        Inference.single_step_tagger = single_step
+        fallbacks = model_api.fallbacks
+        predictions = model_api.translate_lines(
+            lines, self.checkpoint, cpu=True, name='Test', jobs=1)
+        self.assertEqual(model_api.fallbacks, fallbacks,
+                         'in-process translation fell back to a subprocess')
+        return predictions
+
+    def test_in_process(self):
+        predictions = self.translate(LINES, bucketing=False)
+        self.assertEqual(len(predictions), len(LINES))
+        self.assertTrue(all(isinstance(p, str) for p in predictions))
+
+    def test_bucketing_keeps_order(self):
+        lines = LINES * 10
+        self.assertEqual(self.translate(lines, bucketing=True),
+                         self.translate(lines, bucketing=False))
+
+    def test_tag_topk(self):
+        Inference.bucketing = True
+        topk = model_api.tag_topk(LINES, self.checkpoint, cpu=True, k=3)
+        self.assertEqual(len(topk), len(LINES))
+        for tags in topk:
+            self.assertEqual(len(tags), 3)
+            probabilities = [p for _, p in tags]
+            self.assertTrue(all(p is not None for p in probabilities))
+            self.assertEqual(probabilities, sorted(probabilities, reverse=True))
+
+    def test_single_step(self):
+        predictions = self.translate(LINES, bucketing=True, single_step=True)
+        translator = model_api.get_translator(self.checkpoint, cpu=True)
+        self.assertFalse(translator.single_step_failed)
+        self.assertEqual(predictions, [tags[0][0] for tags in
+                                       model_api.tag_topk(LINES, self.checkpoint,
+                                                          cpu=True, k=1)])
+
+    def test_workers_follow_settings(self):
+        """ Settings changed after the worker pool has been started
+        reach the workers """
+        lines = LINES * 4
+        try:
+            Inference.single_step_tagger = False
+            model_api.translate_lines(lines, self.checkpoint, cpu=True,
+                                      name='Test', jobs=2)
+            single_step = self.translate(lines, bucketing=True,
+                                         single_step=True)
+            self.assertEqual(model_api.translate_lines(
+                lines, self.checkpoint, cpu=True, name='Test', jobs=2),
+                             single_step)
+        finally:
+            model_api.close_pools()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark
+
+""" ===========================================================
+Startup tests for BabyLemmatizer 2
+
+Light commands of babylemmatizer.py must not import torch,
+OpenNMT or the pipelines (benchmark.HEAVY_MODULES). Their
+startup time is measured by python benchmark.py startup.
+
+   python -m unittest discover tests
+
+=========================================================== """
+
+LIGHT_COMMANDS = (('--version',), ('--help',))
+
+
+class StartupTest(unittest.TestCase):
+
+    def test_light_commands(self):
+        for args in LIGHT_COMMANDS:
+            with self.subTest(command=' '.join(args)):
+                modules, _ = benchmark.imported_modules(*args)
+                self.assertIn('argparse', modules)
+                self.assertEqual(benchmark.heavy_modules(modules), [])
+
+    def test_detects_heavy_modules(self):
+        modules, _ = benchmark.imported_modules(
+            '--evaluate-fast', 'no_such_model')
+        self.assertIn('evaluate_models', benchmark.heavy_modules(modules))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,7 +7,7 @@ import math
 import shutil
 import re
 from collections import defaultdict
-from preferences import python_path, onmt_path, Paths, Tokenizer, Context, __version__
+from preferences import python_path, onmt_path, Paths, Tokenizer, Context, Tagger, ModelConfig, __version__
 from command_parser import parse_prefix, split_train_filename
 import preprocessing as PP
 import conllutools
@@ -196,6 +196,7 @@ def _make_training_data(filename):
         conffile.write(f'tokenizer: {Tokenizer.setting}\n')
         conffile.write(f'tagger_context: {Context.tagger_context}\n')
         conffile.write(f'lemmatizer_context: {Context.lemmatizer_context}\n')
+        conffile.write(f'tagger_engine: {Tagger.engine}\n')
     
     """ Load CoNLL-U+ file """
     this_data = conlluplus.ConlluPlus(filename)
@@ -356,8 +357,16 @@ def train_model(*models, cpu=False):
 
         ## TODO: use os.path.join instead of string formatting
         model_path = os.path.join(Paths.models, model)
+        engine = ModelConfig.read(model).tagger_engine
 
+        """ The classifier tagger replaces the neural tagger """
+        if engine == 'classifier':
+            import classifier_tagger
+            classifier_tagger.train_model(model_path)
+            
         for yaml in (x for x in os.listdir(model_path) if x.endswith('.yaml')):
+            if yaml == 'tagger.yaml' and engine == 'classifier':
+                continue
             os.system(f'{python_path}python {onmt_path}build_vocab.py '\
                       f'-config {model_path}/{yaml} -n_sample -1 '\
                       f'-num_threads 2')
@@ -365,7 +374,8 @@ def train_model(*models, cpu=False):
                       f'-config {model_path}/{yaml} {gpu}')
             pass
         _rename_model(model, 'lemmatizer')
-        _rename_model(model, 'tagger')
+        if engine != 'classifier':
+            _rename_model(model, 'tagger')
 
 
 if __name__ == "__main__":
@@ -136,6 +136,7 @@ def txt_lines_to_conllu(lines, output=None):
     conllu = conlluplus.ConlluPlus.__new__(conlluplus.ConlluPlus)
     conllu.data = data
     conllu.validate = False
+    conllu.fixed = None
     conllu.word_count = sum(len(sent) for _, sent in data)
 
     # Si se proporciona output, guardar archivo